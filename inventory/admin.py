@@ -1,6 +1,9 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, SKU, Batch, Barcode, TestQuestion, Test, TestAnswer, TestTemplate, TechnicalOutputChoice, BatchSpecTemplate # Import ALL Models
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.http import urlencode
+from .models import CustomUser, SKU, Batch, Barcode, TestQuestion, Test, TestAnswer, TestTemplate, TechnicalOutputChoice, BatchSpecTemplate, BarcodeSequence, BarcodeBlock, BatchJob, LabelPDFJob, DailyTestCount, encode_suffix # Import ALL Models
 
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
@@ -44,20 +47,74 @@ class TestAdmin(admin.ModelAdmin):
     inlines = [TestAnswerInline]
 
 class BatchAdmin(admin.ModelAdmin):
-    list_display = ['sku', 'prefix', 'batch_date', 'quantity', 'spec_template', 'created_at'] # Added spec_template
-    list_filter = ['sku', 'batch_date', 'spec_template'] # Added spec_template
+    list_display = ['sku', 'prefix', 'batch_date', 'quantity', 'spec_template', 'virtual_barcodes', 'code_range', 'created_at'] # Added spec_template
+    list_filter = ['sku', 'batch_date', 'spec_template', 'virtual_barcodes'] # Added spec_template
     search_fields = ['prefix']
     ordering = ['-created_at']
 
+    def code_range(self, obj):
+        if obj.seq_start is None or obj.seq_end <= obj.seq_start:
+            return '-'
+        return f"{obj.prefix}{encode_suffix(obj.seq_start)} – {obj.prefix}{encode_suffix(obj.seq_end - 1)}"
+    code_range.short_description = 'Code Range'
+
 class BarcodeAdmin(admin.ModelAdmin):
     list_display = ['sequence_number', 'batch']
     list_filter = ['batch__sku']
     search_fields = ['sequence_number']
 
+    def get_search_results(self, request, queryset, search_term):
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        # A full code from a range-backed batch may not have a row yet: say
+        # which batch issued it and link to creating the row, without writing
+        sequence_number = search_term.strip().upper()
+        if sequence_number and not Barcode.objects.filter(sequence_number=sequence_number).exists():
+            batch = Batch.for_sequence_number(sequence_number)
+            if batch is not None:
+                add_url = reverse('admin:inventory_barcode_add') + '?' + urlencode({
+                    'sequence_number': sequence_number, 'batch': batch.pk, 'sku': batch.sku_id,
+                })
+                self.message_user(request, format_html(
+                    '{} is an unused unit of range-backed batch {} and has no row yet. '
+                    '<a href="{}">Create its row</a>',
+                    sequence_number, batch, add_url,
+                ), messages.INFO)
+        return queryset, may_have_duplicates
+
+class BarcodeSequenceAdmin(admin.ModelAdmin):
+    list_display = ['prefix', 'last_suffix', 'updated_at']
+    search_fields = ['prefix']
+    readonly_fields = ['updated_at']
+
+class BarcodeBlockAdmin(admin.ModelAdmin):
+    list_display = ['prefix', 'holder', 'start_index', 'end_index', 'next_index', 'unused', 'leased_at', 'released_at']
+    list_filter = ['prefix', 'holder']
+    readonly_fields = ['prefix', 'holder', 'start_index', 'end_index', 'next_index', 'leased_at', 'released_at']
+
+class BatchJobAdmin(admin.ModelAdmin):
+    list_display = ['batch', 'status', 'created', 'total', 'updated_at']
+    list_filter = ['status']
+    readonly_fields = ['created', 'error', 'created_at', 'updated_at']
+
+class LabelPDFJobAdmin(admin.ModelAdmin):
+    list_display = ['batch', 'barcode_format', 'status', 'size', 'updated_at']
+    list_filter = ['status', 'barcode_format']
+    readonly_fields = ['key', 'size', 'error', 'created_at', 'updated_at']
+
+class DailyTestCountAdmin(admin.ModelAdmin):
+    list_display = ['day', 'sku', 'batch', 'template_used', 'status', 'count']
+    list_filter = ['status', 'day', 'sku']
+    readonly_fields = ['day', 'sku', 'batch', 'template_used', 'status', 'count']
+
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(SKU)
 admin.site.register(Batch, BatchAdmin)
 admin.site.register(Barcode, BarcodeAdmin)
+admin.site.register(BarcodeSequence, BarcodeSequenceAdmin)
+admin.site.register(BarcodeBlock, BarcodeBlockAdmin)
+admin.site.register(BatchJob, BatchJobAdmin)
+admin.site.register(LabelPDFJob, LabelPDFJobAdmin)
+admin.site.register(DailyTestCount, DailyTestCountAdmin)
 admin.site.register(TestTemplate)
 admin.site.register(TestQuestion, TestQuestionAdmin)
 admin.site.register(Test, TestAdmin)
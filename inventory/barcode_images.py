@@ -0,0 +1,241 @@
+import base64
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+from . import code128
+
+logger = logging.getLogger(__name__)
+
+# Writer options for the printed labels; the rendered image depends only on
+# these and the sequence number, so both go into the cache key.
+IMAGE_OPTIONS = {
+    'module_width': 0.5,    # slightly thicker bars
+    'module_height': 22.0,  # taller bars
+    'quiet_zone': 6.5,      # extra whitespace for scanners
+    'font_size': 10,        # text size (not used here)
+    'text_distance': 2.0,
+    'dpi': 300,             # high print quality
+    'write_text': False,    # we'll display text in template
+    'background': 'white',
+    'foreground': 'black'
+}
+
+# Bump when the rendering changes in a way the options above don't capture
+RENDER_VERSION = 2  # 2: in-project Code128 rasterizer, 1-bit PNG
+
+_OPTIONS_FINGERPRINT = json.dumps([RENDER_VERSION, IMAGE_OPTIONS], sort_keys=True)
+
+
+def image_key(sequence_number):
+    """Content address of a sequence number's PNG; also used as its ETag."""
+    return hashlib.sha256(f"{_OPTIONS_FINGERPRINT}|{sequence_number}".encode()).hexdigest()
+
+
+# Module-level partials of the code128 functions, so they can be sent to the
+# render pool (whose processes never load Django)
+_png_renderer = partial(
+    code128.render_png,
+    module_width=IMAGE_OPTIONS['module_width'],
+    module_height=IMAGE_OPTIONS['module_height'],
+    quiet_zone=IMAGE_OPTIONS['quiet_zone'],
+    dpi=IMAGE_OPTIONS['dpi'],
+)
+_svg_renderer = partial(
+    code128.render_svg,
+    module_width=IMAGE_OPTIONS['module_width'],
+    module_height=IMAGE_OPTIONS['module_height'],
+    quiet_zone=IMAGE_OPTIONS['quiet_zone'],
+)
+_inline_svg_renderer = partial(_svg_renderer, size_attrs=False)
+
+
+def render_png(sequence_number):
+    return _png_renderer(sequence_number)
+
+
+def render_svg(sequence_number, size_attrs=True):
+    return _svg_renderer(sequence_number, size_attrs=size_attrs)
+
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def _render_workers():
+    return settings.LABEL_RENDER_WORKERS or os.cpu_count() or 1
+
+
+def _get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn, not fork: the web process may be running BatchJob threads
+            _render_pool = ProcessPoolExecutor(
+                max_workers=_render_workers(),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _render_pool
+
+
+def _reset_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+def _render_many(renderer, codes, pooled=None):
+    """Apply renderer to every code, on the process pool for large (or pooled=True) runs."""
+    if pooled is None:
+        pooled = len(codes) >= settings.LABEL_RENDER_POOL_THRESHOLD
+    if pooled and codes:
+        chunksize = max(1, len(codes) // (_render_workers() * 4))
+        try:
+            return list(_get_render_pool().map(renderer, codes, chunksize=chunksize))
+        except BrokenProcessPool:
+            logger.exception("Label render pool broke; rendering in-process")
+            _reset_render_pool()
+    return [renderer(code) for code in codes]
+
+
+def render_label_sheet(sequence_numbers, barcode_format):
+    """
+    Barcode markup for a whole label sheet in one pass, in input order:
+    inline SVG for 'svg', a PNG data URI for 'inline'. Large sheets are
+    spread over a process pool so the pass uses every core; PNGs that were
+    pre-rendered (see BarcodeImageCache.prerender) are read from disk.
+    """
+    codes = list(sequence_numbers)
+    if barcode_format == 'svg':
+        return _render_many(_inline_svg_renderer, codes)
+
+    pngs = [image_cache.stored(code) for code in codes]
+    missing = [code for code, png in zip(codes, pngs) if png is None]
+    rendered = iter(_render_many(_png_renderer, missing))
+    pngs = [png if png is not None else next(rendered) for png in pngs]
+    return [f"data:image/png;base64,{base64.b64encode(png).decode('ascii')}" for png in pngs]
+
+
+def attach_label_images(barcodes, barcode_format):
+    """
+    Render every barcode of a label sheet in one server-side pass and set it
+    as barcode.label_image, so the page needs no per-label image requests.
+    """
+    barcodes = list(barcodes)
+    if barcode_format != 'png':
+        rendered = render_label_sheet((barcode.sequence_number for barcode in barcodes), barcode_format)
+        for barcode, label_image in zip(barcodes, rendered):
+            barcode.label_image = mark_safe(label_image) if barcode_format == 'svg' else label_image
+    return barcodes
+
+
+class BarcodeImageCache:
+    """
+    Rendered barcode PNGs, kept in a bounded in-memory LRU in front of a
+    content-addressed directory (<dir>/<key[:2]>/<key>.png). A sequence
+    number's image never changes, so entries are never invalidated.
+    """
+    def __init__(self, directory, max_entries):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, sequence_number):
+        key = image_key(sequence_number)
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return png
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                png = f.read()
+            hit = 'disk'
+        except FileNotFoundError:
+            png = render_png(sequence_number)
+            self._write(path, png)
+            hit = None
+
+        with self._lock:
+            if hit:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+            self._entries[key] = png
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return png
+
+    def stored(self, sequence_number):
+        """The PNG if it is already in memory or on disk, else None. Never renders."""
+        key = image_key(sequence_number)
+        with self._lock:
+            png = self._entries.get(key)
+        if png is not None:
+            return png
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def prerender(self, sequence_numbers, chunk_size=2000):
+        """
+        Render every PNG that is not on disk yet, spread over the render
+        pool, and store it. Returns the number of images written.
+        """
+        written = 0
+        sequence_numbers = iter(sequence_numbers)
+        while True:
+            chunk = list(islice(sequence_numbers, chunk_size))
+            if not chunk:
+                return written
+            missing = [code for code in chunk if not os.path.exists(self._path(image_key(code)))]
+            for code, png in zip(missing, _render_many(_png_renderer, missing, pooled=True)):
+                self._write(self._path(image_key(code)), png)
+            written += len(missing)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+            }
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.png")
+
+    def _write(self, path, png):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, path)
+
+
+image_cache = BarcodeImageCache(settings.BARCODE_IMAGE_DIR, settings.BARCODE_IMAGE_CACHE_SIZE)
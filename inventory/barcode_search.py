@@ -0,0 +1,98 @@
+"""
+Substring search index over Barcode.sequence_number, so a partial code
+typed from a damaged label is looked up through an index instead of a scan
+of every barcode.
+
+PostgreSQL: a pg_trgm GIN index on UPPER(sequence_number), the expression
+Django's icontains compares, so icontains itself uses it.
+SQLite: an FTS5 table with the trigram tokenizer over inventory_barcode,
+kept in sync by triggers (bulk_create included), queried with LIKE.
+
+Either index needs at least three characters to narrow a search; shorter
+terms are matched with a plain icontains.
+"""
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'inventory_barcode_search'
+TRIGRAM_INDEX = 'barcode_seq_trgm_idx'
+MIN_TERM_LENGTH = 3
+
+SQLITE_INSTALL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        sequence_number, content='inventory_barcode', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON inventory_barcode BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, sequence_number) VALUES (new.id, new.sequence_number);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON inventory_barcode BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, sequence_number)
+        VALUES ('delete', old.id, old.sequence_number);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update AFTER UPDATE OF sequence_number ON inventory_barcode BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, sequence_number)
+        VALUES ('delete', old.id, old.sequence_number);
+        INSERT INTO {SEARCH_TABLE}(rowid, sequence_number) VALUES (new.id, new.sequence_number);
+    END""",
+    # Index the barcodes already there
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_UNINSTALL = [
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+]
+POSTGRESQL_INSTALL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"""CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON inventory_barcode
+        USING gin (UPPER(sequence_number::text) gin_trgm_ops)""",
+]
+POSTGRESQL_UNINSTALL = [
+    f"DROP INDEX IF EXISTS {TRIGRAM_INDEX}",
+]
+
+# Whether the SQLite search table is usable, per database alias
+_installed = {}
+
+
+def install(connection):
+    """Create (or complete) the search index on connection and index every barcode."""
+    statements = {'sqlite': SQLITE_INSTALL, 'postgresql': POSTGRESQL_INSTALL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+    _installed.pop(connection.alias, None)
+
+
+def uninstall(connection):
+    statements = {'sqlite': SQLITE_UNINSTALL, 'postgresql': POSTGRESQL_UNINSTALL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+    _installed.pop(connection.alias, None)
+
+
+def installed(connection):
+    """Whether the SQLite search table is there and kept in sync."""
+    if connection.alias not in _installed:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'inventory_barcode' "
+                "AND name IN (%s, %s, %s)",
+                [f"{SEARCH_TABLE}_insert", f"{SEARCH_TABLE}_delete", f"{SEARCH_TABLE}_update"],
+            )
+            # A migration that rebuilds inventory_barcode drops its triggers;
+            # rebuild_barcode_search puts them back
+            _installed[connection.alias] = cursor.fetchone()[0] == 3
+    return _installed[connection.alias]
+
+
+def filter_sequence_contains(queryset, term, connection):
+    """queryset narrowed to the barcodes whose sequence number contains term, case-insensitively."""
+    if (connection.vendor == 'sqlite' and len(term) >= MIN_TERM_LENGTH
+            and '%' not in term and '_' not in term and installed(connection)):
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE sequence_number LIKE %s", [f"%{term}%"],
+        ))
+    # PostgreSQL's trigram index serves icontains as it is
+    return queryset.filter(sequence_number__icontains=term)
@@ -0,0 +1,168 @@
+"""
+In-project Code 128 encoder with PNG and SVG output for the label images.
+
+Produces the same symbols as python-barcode's Code128 (same charset B/C
+switching) at the same geometry as its ImageWriter, without building the
+image through PIL: every bar row of a 1D barcode is identical, so a single
+pixel row is filled with slice assignments and the PNG is written from it
+directly with zlib. The SVG form is a single path of bar rectangles.
+"""
+import struct
+import zlib
+
+# Bar/space widths of symbol values 0..105, in modules
+PATTERNS = (
+    '212222', '222122', '222221', '121223', '121322', '131222', '122213', '122312',
+    '132212', '221213', '221312', '231212', '112232', '122132', '122231', '113222',
+    '123122', '123221', '223211', '221132', '221231', '213212', '223112', '312131',
+    '311222', '321122', '321221', '312212', '322112', '322211', '212123', '212321',
+    '232121', '111323', '131123', '131321', '112313', '132113', '132311', '211313',
+    '231113', '231311', '112133', '112331', '132131', '113123', '113321', '133121',
+    '313121', '211331', '231131', '213113', '213311', '213131', '311123', '311321',
+    '331121', '312113', '312311', '332111', '314111', '221411', '431111', '111224',
+    '111422', '121124', '121421', '141122', '141221', '112214', '112412', '122114',
+    '122411', '142112', '142211', '241211', '221114', '413111', '241112', '134111',
+    '111242', '121142', '121241', '114212', '124112', '124211', '411212', '421112',
+    '421211', '212141', '214121', '412121', '111143', '111341', '131141', '114113',
+    '114311', '411113', '411311', '113141', '114131', '311141', '411131', '211412',
+    '211214', '211232',
+)
+STOP_PATTERN = '2331112'  # stop symbol plus the final 2-module bar
+
+CODE_C, CODE_B = 99, 100
+START_B, START_C = 104, 105
+
+
+def encode(data):
+    """
+    Symbol values for data, checksum included. Starts in charset B and
+    switches to C for runs of four or more digits, like python-barcode.
+    """
+    if not data or any(not 32 <= ord(char) <= 126 for char in data):
+        raise ValueError(f"Code 128 labels need printable ASCII, got {data!r}")
+
+    # digits_ahead[pos]: length of the digit run starting at pos
+    digits_ahead = [0] * (len(data) + 1)
+    for pos in range(len(data) - 1, -1, -1):
+        if data[pos].isdigit():
+            digits_ahead[pos] = digits_ahead[pos + 1] + 1
+
+    values, charset, pending = [START_B], 'B', ''
+    for pos, char in enumerate(data):
+        if charset == 'C' and not char.isdigit():
+            values.append(CODE_B)
+            charset = 'B'
+            if pending:
+                values.append(ord(pending) - 32)
+                pending = ''
+        elif charset == 'B' and digits_ahead[pos] > 3:
+            values.append(CODE_C)
+            charset = 'C'
+
+        if charset == 'B':
+            values.append(ord(char) - 32)
+        else:
+            pending += char
+            if len(pending) == 2:
+                values.append(int(pending))
+                pending = ''
+    if pending:
+        values.extend([CODE_B, ord(pending) - 32])
+    if values[1] == CODE_C:
+        values[:2] = [START_C]
+
+    checksum = (values[0] + sum(i * value for i, value in enumerate(values[1:], start=1))) % 103
+    values.append(checksum)
+    return values
+
+
+def bar_widths(data):
+    """Alternating bar/space widths in modules for the whole symbol, starting with a bar."""
+    widths = [int(w) for value in encode(data) for w in PATTERNS[value]]
+    widths.extend(int(w) for w in STOP_PATTERN)
+    return widths
+
+
+def _mm2px(mm, dpi):
+    return mm * dpi / 25.4
+
+
+_TO_BITS = bytes.maketrans(b'\x00\xff', b'01')
+
+
+def _pack_bits(pixels, row_bytes):
+    """0x00/0xff pixels -> 1 bit per pixel, MSB first, padded with white."""
+    bits = pixels.translate(_TO_BITS).ljust(row_bytes * 8, b'1')
+    return int(bits, 2).to_bytes(row_bytes, 'big')
+
+
+def _png_chunk(kind, payload):
+    return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload))
+
+
+def render_png(data, module_width=0.2, module_height=15.0, quiet_zone=6.5, dpi=300, margin=1.0):
+    """
+    1-bit greyscale PNG of data, black bars on white. Sizes are in mm and are
+    mapped to pixels the way python-barcode's ImageWriter does, so the bars
+    land on the same pixel columns.
+    """
+    widths = bar_widths(data)
+    width = int(_mm2px(2 * quiet_zone + sum(widths) * module_width, dpi))
+    height = int(_mm2px(2 * margin + module_height, dpi))
+
+    row = bytearray(b'\xff') * width
+    x_mm = quiet_zone
+    for index, modules in enumerate(widths):
+        next_x_mm = x_mm + modules * module_width
+        if index % 2 == 0:  # even entries are bars
+            start, stop = int(_mm2px(x_mm, dpi)), int(_mm2px(next_x_mm, dpi) - 1) + 1
+            row[start:stop] = b'\x00' * (stop - start)
+        x_mm = next_x_mm
+
+    top = int(_mm2px(margin, dpi))
+    bottom = min(int(_mm2px(margin + module_height, dpi)) + 1, height)
+    row_bytes = (width + 7) // 8
+    white = b'\xff' * row_bytes
+    # Each span is written as one literal row, then filter type 2 ("Up")
+    # rows, which are all zeros and compress to almost nothing
+    same_as_above = b'\x02' + b'\x00' * row_bytes
+    raw = b''.join(
+        b'\x00' + pixels + same_as_above * (rows - 1)
+        for pixels, rows in ((white, top), (_pack_bits(row, row_bytes), bottom - top), (white, height - bottom))
+        if rows > 0
+    )
+
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0)),
+        _png_chunk(b'IDAT', zlib.compress(raw, 6)),
+        _png_chunk(b'IEND', b''),
+    ))
+
+
+def render_svg(data, module_width=0.2, module_height=15.0, quiet_zone=6.5, margin=1.0, size_attrs=True):
+    """
+    Vector form of render_png(): one <path> with a rectangle per bar. Lengths
+    are in units of one module, so the path is mostly small integers. With
+    size_attrs the SVG carries its size in mm; without, it scales to its box.
+    """
+    def units(mm):
+        return f"{mm / module_width:g}"
+
+    height = 2 * margin + module_height
+    x = quiet_zone / module_width
+    # Each bar after the first moves relative to the previous bar's corner
+    bars, last_x = [], None
+    for index, modules in enumerate(bar_widths(data)):
+        if index % 2 == 0:
+            move = f"M{x:g} {units(margin)}" if last_x is None else f"m{x - last_x:g} 0"
+            bars.append(f"{move}h{modules}v{units(module_height)}h-{modules}z")
+            last_x = x
+        x += modules
+    width = x + quiet_zone / module_width
+
+    size = f' width="{width * module_width:g}mm" height="{height:g}mm"' if size_attrs else ''
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width:g} {units(height)}"{size}'
+        f' shape-rendering="crispEdges"><path d="{"".join(bars)}"/></svg>'
+    )
@@ -45,11 +45,15 @@ class BatchCreateForm(forms.ModelForm):
         model = Batch
         # These are the CORE fields always needed for batch/barcode creation.
         # Note: Prefix is defined above, not here.
-        fields = ['sku', 'batch_date', 'quantity', 'spec_template'] 
+        fields = ['sku', 'batch_date', 'quantity', 'spec_template', 'virtual_barcodes'] 
         widgets = {
             'sku': forms.Select(attrs={'class': 'w-full p-2 border rounded-md'}),
             'batch_date': forms.DateInput(attrs={'type': 'date', 'class': 'w-full p-2 border rounded-md'}),
             'quantity': forms.NumberInput(attrs={'class': 'w-full p-2 border rounded-md'}),
+            'virtual_barcodes': forms.CheckboxInput(attrs={'class': 'h-4 w-4 rounded border-gray-300'}),
+        }
+        labels = {
+            'virtual_barcodes': 'Range-backed barcodes (create rows on first use)',
         }
 
     def __init__(self, *args, **kwargs):
@@ -120,6 +124,29 @@ class BatchCreateForm(forms.ModelForm):
             instance.save() 
         return instance
 
+class BarcodeChoiceField(forms.ModelChoiceField):
+    """
+    Barcode picker keyed on sequence_number. Units of a range-backed batch may
+    not have a row yet: a code in the batch's range cleans to an unsaved
+    Barcode, whose row the view creates along with the test (Barcode.resolve).
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('to_field_name', 'sequence_number')
+        super().__init__(*args, **kwargs)
+        self.batch = None
+
+    def to_python(self, value):
+        if self.batch is not None and self.batch.virtual_barcodes and value not in self.empty_values:
+            sequence_number = str(value).strip().upper()
+            barcode = self.queryset.filter(sequence_number=sequence_number).first()
+            if barcode is not None:
+                return barcode
+            if not self.batch.contains(sequence_number):
+                raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+            return Barcode(batch=self.batch, sku_id=self.batch.sku_id, sequence_number=sequence_number)
+        return super().to_python(value)
+
+
 # TestForm remains unchanged from the previous working version
 class TestForm(forms.Form):
     sku = forms.ModelChoiceField(
@@ -130,7 +157,7 @@ class TestForm(forms.Form):
         queryset=Batch.objects.all(), # Initial queryset, will be filtered in __init__
         widget=forms.Select(attrs={'class': 'mt-1 block w-full rounded-md border-gray-300 shadow-sm py-2.5 px-3 text-gray-900 focus:outline-none focus:ring-blue-500 focus:border-blue-500 sm:text-sm'})
     )
-    barcode = forms.ModelChoiceField(
+    barcode = BarcodeChoiceField(
         queryset=Barcode.objects.all(), # Initial queryset, will be filtered in __init__
         required=False, # Barcode is optional
         widget=forms.Select(attrs={'class': 'mt-1 block w-full rounded-md border-gray-300 shadow-sm py-2.5 px-3 text-gray-900 focus:outline-none focus:ring-blue-500 focus:border-blue-500 sm:text-sm'})
@@ -161,6 +188,8 @@ class TestForm(forms.Form):
         # Filter Barcode choices based on selected Batch
         if selected_batch_id:
             self.fields['barcode'].queryset = Barcode.objects.filter(batch_id=selected_batch_id)
+            batch_instance = Batch.objects.filter(pk=selected_batch_id).first()
+            self.fields['barcode'].batch = batch_instance
         else:
             self.fields['barcode'].queryset = Barcode.objects.none()
         
@@ -221,6 +250,34 @@ class TestForm(forms.Form):
         if self.initial.get('batch'):
             self.fields['barcode'].queryset = Barcode.objects.filter(batch_id=self.initial['batch'])
 
+        # The SKU, batch and barcode pickers search as the user types (search_skus and
+        # friends); the querysets above only validate, and the widgets render the
+        # current choice instead of every batch of a SKU or every unit of a batch
+        for name in ('sku', 'batch', 'barcode'):
+            self.fields[name].widget.choices = self.current_choice(name)
+
+    def current_choice(self, name):
+        field = self.fields[name]
+        value = self[name].value()
+        choices = [('', field.empty_label)]
+        if value in field.empty_values:
+            return choices
+        if name == 'barcode':
+            # Keyed on the sequence number, which is its own label; a range-backed
+            # unit may not have a row to look up yet. A code from another batch
+            # is dropped, as the batch and SKU are when they no longer fit
+            batch = field.batch
+            if batch is None:
+                return choices
+            in_batch = batch.contains(value) if batch.virtual_barcodes else \
+                field.queryset.filter(sequence_number=value).exists()
+            return choices + ([(value, value)] if in_batch else [])
+        try:
+            selected = field.queryset.filter(pk=value).first()
+        except (ValueError, TypeError):
+            selected = None
+        return choices + ([(selected.pk, str(selected))] if selected else [])
+
 
 # This is the dedicated form for updating overall status on the test_detail page
 class TestOverallStatusForm(forms.ModelForm):
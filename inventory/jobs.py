@@ -0,0 +1,106 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .barcode_images import image_cache
+from .models import Batch, BatchJob, LabelPDFJob, requeue_job
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pdf_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BATCH_JOB_WORKERS,
+            thread_name_prefix='batch-job',
+        )
+        # First use in this process, maybe after a restart: pick up what the last one left
+        resume_stale_jobs(BatchJob, run_batch_job, _executor)
+    return _executor
+
+
+def _get_pdf_executor():
+    # Separate pool, so a long label PDF never holds up batch inserts
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ThreadPoolExecutor(
+            max_workers=settings.LABEL_PDF_WORKERS,
+            thread_name_prefix='label-pdf',
+        )
+        resume_stale_jobs(LabelPDFJob, run_label_pdf_job, _pdf_executor)
+    return _pdf_executor
+
+
+def resume_stale_jobs(model, run, executor):
+    """Re-queue the stale jobs of model (BatchJob or LabelPDFJob) onto executor; returns how many."""
+    resumed = 0
+    for job in model.objects.filter(status__in=['queued', 'running']).order_by('created_at'):
+        if job.is_stale and requeue_job(job):
+            executor.submit(run, job.pk)
+            resumed += 1
+    if resumed:
+        logger.info("Resumed %s stale %s", resumed, model._meta.verbose_name_plural)
+    return resumed
+
+
+def run_batch_job(job_id):
+    """Run one BatchJob to completion. Safe to call again on a job that was interrupted."""
+    close_old_connections()
+    try:
+        job = BatchJob.objects.select_related('batch__sku').get(pk=job_id)
+        if job.status == 'done':
+            return
+        job.run()
+    except Exception:
+        logger.exception("Batch job %s failed", job_id)
+    finally:
+        # Worker threads keep their own connection; don't leave it open between jobs
+        connection.close()
+
+
+def enqueue_batch_job(job):
+    """Hand the job to the worker pool once the transaction that created it has committed."""
+    transaction.on_commit(lambda: _get_executor().submit(run_batch_job, job.pk))
+
+
+def prerender_batch_artwork(batch_id):
+    """Render and store the label PNGs of a new batch so printing finds them on disk."""
+    close_old_connections()
+    try:
+        batch = Batch.objects.get(pk=batch_id)
+        written = image_cache.prerender(batch.sequence_numbers())
+        logger.info("Pre-rendered %s label images for batch %s", written, batch_id)
+    except Exception:
+        logger.exception("Pre-rendering labels for batch %s failed", batch_id)
+    finally:
+        connection.close()
+
+
+def enqueue_prerender(batch):
+    """Queue label pre-rendering for batch once the transaction that created it has committed."""
+    transaction.on_commit(lambda: _get_executor().submit(prerender_batch_artwork, batch.pk))
+
+
+def run_label_pdf_job(job_id):
+    """Render one LabelPDFJob's PDF to disk."""
+    close_old_connections()
+    try:
+        job = LabelPDFJob.objects.select_related('batch__sku').get(pk=job_id)
+        if job.status == 'done':
+            return
+        job.run()
+    except Exception:
+        logger.exception("Label PDF job %s failed", job_id)
+    finally:
+        connection.close()
+
+
+def enqueue_label_pdf_job(job):
+    """Hand the job to the PDF worker pool once the transaction that queued it has committed."""
+    transaction.on_commit(lambda: _get_pdf_executor().submit(run_label_pdf_job, job.pk))
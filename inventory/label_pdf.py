@@ -0,0 +1,294 @@
+"""
+Direct PDF writer for sticker label sheets (the layout of print_barcodes.html:
+one 100 x 35 mm page per unit, barcode and code on the left, spec table on
+the right), drawn straight into PDF content streams with pydyf.
+
+Nothing is laid out per label. The spec table is the same for every unit of
+a batch, so it is drawn once into a form XObject that each page reuses; a
+page only adds its barcode bars (integer module rectangles under one scale
+matrix) and two runs of text. Text is set in Helvetica-Bold, the standard
+PDF font metric-compatible with the template's Arial, shared by every page.
+"""
+import io
+import zlib
+
+import pydyf
+from django.conf import settings
+
+from . import code128
+from .barcode_images import IMAGE_OPTIONS
+from .pdf import RawObject
+
+MM = 72 / 25.4  # points per mm
+
+PAGE_WIDTH, PAGE_HEIGHT = 100, 35  # mm, like @page in print_barcodes.html
+SECTION_WIDTH = 50
+PADDING = 1.5
+BARCODE_MAX_HEIGHT = 28
+BARCODE_MARGIN = 1.0  # white space above and below the bars, as in code128.render_svg
+LINE_HEIGHT = 1.0
+BASELINE = 0.85  # baseline below the line top, in em, for a 1.0 line height
+
+FONT_SIZE = 10
+LABEL_FONT_SIZE = 8
+SEQUENCE_FONT_SIZE = 7.5
+ROW_HEIGHT = 3.8
+TITLE_ROW_HEIGHT = 4.2
+CELL_PADDING = 0.1
+LABEL_PADDING_LEFT = 1.0
+BORDER_WIDTH = 0.375  # 0.5px
+BORDER_GREY = 0.2  # #333
+TITLE_GREY = 0.941  # #f0f0f0
+LABEL_GREY = 0.973  # #f8f8f8
+SEQUENCE_GREY = 0.91  # #e8e8e8
+
+# Helvetica-Bold advance widths (1/1000 em) of WinAnsi codes 32..126
+_WIDTHS = dict(zip(range(32, 127), (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+)))
+_DEFAULT_WIDTH = 556
+_WIDTH_TABLE = [_WIDTHS.get(code, _DEFAULT_WIDTH) for code in range(256)]
+
+
+def _encode(text):
+    return str(text).encode('cp1252', errors='replace')
+
+
+def text_width(text, size):
+    """Width in mm of text set in Helvetica-Bold at size pt."""
+    return sum(map(_WIDTH_TABLE.__getitem__, _encode(text))) * size / 1000 / MM
+
+
+def _wrap(text, size, width):
+    """Greedy line breaking at spaces; words wider than the cell break anywhere, like break-word."""
+    lines, line = [], ''
+    for word in str(text).split():
+        candidate = f"{line} {word}" if line else word
+        if text_width(candidate, size) <= width:
+            line = candidate
+            continue
+        if line:
+            lines.append(line)
+        line = ''
+        for char in word:
+            if line and text_width(line + char, size) > width:
+                lines.append(line)
+                line = ''
+            line += char
+    if line or not lines:
+        lines.append(line)
+    return lines
+
+
+def _string(text):
+    escaped = _encode(text).replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+    return b'(' + escaped + b')'
+
+
+def _num(value):
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+
+def _text(x, y, size, text):
+    """Ops that set text with its baseline starting at (x, y) mm from the bottom left."""
+    return f"BT /F1 {_num(size)} Tf {_num(x * MM)} {_num(y * MM)} Td ".encode() + _string(text) + b" Tj ET"
+
+
+def _centred_text(text, size, centre, baseline):
+    """Ops for one line of text centred on centre (mm) at baseline (mm)."""
+    encoded = _encode(text)
+    x = centre - sum(map(_WIDTH_TABLE.__getitem__, encoded)) * size / 2000 / MM
+    return b"BT /F1 %g Tf %.2f %.2f Td %s Tj ET" % (size, x * MM, baseline * MM, _string(text))
+
+
+def _lines_in_box(lines, size, left, right, top, bottom, align):
+    """Text ops for lines vertically centred in a box (mm, top > bottom), centred or left-aligned."""
+    line_height = size * LINE_HEIGHT / MM
+    y = (top + bottom) / 2 + len(lines) * line_height / 2 - BASELINE * size / MM
+    ops = []
+    for line in lines:
+        x = left if align == 'left' else (left + right - text_width(line, size)) / 2
+        ops.append(_text(x, y, size, line))
+        y -= line_height
+    return ops
+
+
+class SpecTable:
+    """
+    The right-hand table of a batch's labels: title row, one row per spec
+    field of the batch's template, and a last row for the sequence number.
+    Everything but that number is the same on every label.
+    """
+    def __init__(self, batch, spec_field_map):
+        fields = batch.spec_template.fields_json if batch.spec_template else []
+        fields = fields or []
+        if 'device_name' in fields:
+            title = getattr(batch, 'device_name', '') or batch.sku.code
+        else:
+            title = f"{batch.sku.code} - Specs"
+
+        self.left = SECTION_WIDTH + PADDING
+        self.right = PAGE_WIDTH - PADDING
+        self.middle = (self.left + self.right) / 2
+        column = self.middle - self.left - 2 * CELL_PADDING
+        text_height = FONT_SIZE * LINE_HEIGHT / MM
+
+        # (title lines) and per field (label lines, value lines)
+        self.title = _wrap(title, FONT_SIZE, self.right - self.left - 2 * CELL_PADDING)
+        self.rows = [
+            (_wrap(spec_field_map.get(name, ''), LABEL_FONT_SIZE, column - LABEL_PADDING_LEFT),
+             _wrap(getattr(batch, name, '') or '-', FONT_SIZE, column))
+            for name in fields if name != 'device_name'
+        ]
+        self.heights = [max(TITLE_ROW_HEIGHT, len(self.title) * text_height) + 2 * CELL_PADDING]
+        for label, value in self.rows:
+            lines = max(len(label) * LABEL_FONT_SIZE / FONT_SIZE, len(value))
+            self.heights.append(max(ROW_HEIGHT, lines * text_height) + 2 * CELL_PADDING)
+        self.heights.append(TITLE_ROW_HEIGHT + 2 * CELL_PADDING)
+
+        self.top = (PAGE_HEIGHT + sum(self.heights)) / 2
+        self.sequence_top = self.top - sum(self.heights[:-1])
+        self.bottom = self.sequence_top - self.heights[-1]
+
+    def _rect(self, grey, left, right, top, bottom):
+        return (f"{_num(grey)} g {_num(left * MM)} {_num(bottom * MM)} "
+                f"{_num((right - left) * MM)} {_num((top - bottom) * MM)} re f").encode()
+
+    def draw(self):
+        """Ops for the fixed part of the table."""
+        ops = []
+        top = self.top - self.heights[0]
+        # Backgrounds, then text, then the grid over both
+        ops.append(self._rect(TITLE_GREY, self.left, self.right, self.top, top))
+        row_tops = []
+        for height in self.heights[1:-1]:
+            top -= height
+            row_tops.append(top + height)
+            ops.append(self._rect(LABEL_GREY, self.left, self.middle, top + height, top))
+        ops.append(self._rect(SEQUENCE_GREY, self.left, self.right, self.sequence_top, self.bottom))
+
+        ops.append(b"0 g")
+        ops += _lines_in_box(self.title, FONT_SIZE, self.left, self.right, self.top, self.top - self.heights[0], 'center')
+        for (label, value), row_top, height in zip(self.rows, row_tops, self.heights[1:-1]):
+            ops += _lines_in_box(label, LABEL_FONT_SIZE, self.left + CELL_PADDING + LABEL_PADDING_LEFT, self.middle,
+                                 row_top, row_top - height, 'left')
+            ops += _lines_in_box(value, FONT_SIZE, self.middle, self.right, row_top, row_top - height, 'center')
+
+        ops.append(f"{_num(BORDER_GREY)} G {_num(BORDER_WIDTH)} w".encode())
+        ops.append(f"{_num(self.left * MM)} {_num(self.bottom * MM)} {_num((self.right - self.left) * MM)} "
+                   f"{_num((self.top - self.bottom) * MM)} re".encode())
+        y = self.top
+        for height in self.heights[:-1]:
+            y -= height
+            ops.append(f"{_num(self.left * MM)} {_num(y * MM)} m {_num(self.right * MM)} {_num(y * MM)} l".encode())
+        if self.rows:
+            ops.append(f"{_num(self.middle * MM)} {_num((self.top - self.heights[0]) * MM)} m "
+                       f"{_num(self.middle * MM)} {_num(self.sequence_top * MM)} l".encode())
+        ops.append(b"S")
+        return b"\n".join(ops)
+
+    def draw_sequence(self, sequence_number):
+        baseline = (self.sequence_top + self.bottom) / 2 + (0.5 - BASELINE) * SEQUENCE_FONT_SIZE * LINE_HEIGHT / MM
+        return _centred_text(sequence_number, SEQUENCE_FONT_SIZE, (self.left + self.right) / 2, baseline)
+
+
+class Barcode:
+    """
+    Placement of the left-hand barcode and code. Every Code 128 symbol is 11
+    modules wide, so each symbol's bars are formatted once, in module units,
+    and a label's bars are those snippets joined with an 11-module shift.
+    """
+    def __init__(self):
+        module_width = IMAGE_OPTIONS['module_width']
+        self.quiet_zone = IMAGE_OPTIONS['quiet_zone'] / module_width
+        self.height_units = (IMAGE_OPTIONS['module_height'] + 2 * BARCODE_MARGIN) / module_width
+        self.content_width = SECTION_WIDTH - 2 * PADDING
+        self.text_height = FONT_SIZE * LINE_HEIGHT / MM
+
+        bottom, bar_height = BARCODE_MARGIN / module_width, IMAGE_OPTIONS['module_height'] / module_width
+
+        def bars(pattern):
+            ops, x = [], 0
+            for index, modules in enumerate(int(w) for w in pattern):
+                if index % 2 == 0:
+                    ops.append(f"{x} {bottom:g} {modules} {bar_height:g} re")
+                x += modules
+            return " ".join(ops).encode()
+
+        # cm is not allowed inside a path, so each symbol is filled before the shift
+        self.symbols = [bars(pattern) + b" f 1 0 0 1 11 0 cm " for pattern in code128.PATTERNS]
+        self.stop = bars(code128.STOP_PATTERN)
+        self.placements = {}
+
+    def _placement(self, symbol_count):
+        """The scaling/position matrix of a code with this many symbols, and the baseline of its text."""
+        width_units = 2 * self.quiet_zone + 11 * symbol_count + 13
+        # width: 100%, height: auto, max-height 28mm with object-fit: contain
+        scale = self.content_width / width_units
+        if self.height_units * scale > BARCODE_MAX_HEIGHT:
+            scale = BARCODE_MAX_HEIGHT / self.height_units
+        width, height = width_units * scale, self.height_units * scale
+        top = (PAGE_HEIGHT + height + 1 + self.text_height) / 2
+        left = PADDING + (self.content_width - width) / 2 + self.quiet_zone * scale
+        matrix = f"q {_num(scale * MM)} 0 0 {_num(scale * MM)} {_num(left * MM)} {_num((top - height) * MM)} cm "
+        baseline = top - height - 1 - BASELINE * FONT_SIZE / MM
+        return matrix.encode(), baseline
+
+    def draw(self, sequence_number):
+        values = code128.encode(sequence_number)
+        if len(values) not in self.placements:
+            self.placements[len(values)] = self._placement(len(values))
+        matrix, baseline = self.placements[len(values)]
+        symbols = self.symbols
+        return b"".join((
+            matrix, *[symbols[value] for value in values], self.stop, b" f Q\n",
+            _centred_text(sequence_number, FONT_SIZE, SECTION_WIDTH / 2, baseline),
+        ))
+
+
+def write_label_sheet(batch, sequence_numbers, spec_field_map):
+    """The sticker labels of sequence_numbers (units of batch) as PDF bytes, one page each."""
+    pdf = pydyf.PDF()
+    font = pydyf.Dictionary({
+        'Type': '/Font', 'Subtype': '/Type1',
+        'BaseFont': '/Helvetica-Bold', 'Encoding': '/WinAnsiEncoding',
+    })
+    pdf.add_object(font)
+
+    table = SpecTable(batch, spec_field_map)
+    spec = pydyf.Stream([table.draw()], {
+        'Type': '/XObject', 'Subtype': '/Form',
+        'BBox': pydyf.Array([0, 0, _num(PAGE_WIDTH * MM), _num(PAGE_HEIGHT * MM)]),
+        'Resources': pydyf.Dictionary({'Font': pydyf.Dictionary({'F1': font.reference})}),
+    }, compress=True)
+    pdf.add_object(spec)
+
+    # Size and resources are inherited from the page tree, so pages are tiny
+    pdf.pages['MediaBox'] = pydyf.Array([0, 0, _num(PAGE_WIDTH * MM), _num(PAGE_HEIGHT * MM)])
+    pdf.pages['Resources'] = pydyf.Dictionary({
+        'Font': pydyf.Dictionary({'F1': font.reference}),
+        'XObject': pydyf.Dictionary({'Spec': spec.reference}),
+    })
+    pdf.info['Producer'] = pydyf.String(f"{settings.PRODUCT_NAME} label writer")
+
+    barcode = Barcode()
+    page_head = b"<</Type/Page/Parent " + pdf.pages.reference + b"/Contents "
+    for sequence_number in sequence_numbers:
+        content = b"/Spec Do 0 g\n%s\n%s" % (barcode.draw(sequence_number), table.draw_sequence(sequence_number))
+        # Page streams are under 1 KiB: a small window and memLevel compress them
+        # as well as the defaults at a quarter of the set-up cost
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 10, 2)
+        content = compressor.compress(content) + compressor.flush()
+        stream = RawObject(b"<</Filter/FlateDecode/Length %d>>\nstream\n%s\nendstream" % (len(content), content),
+                           stream=True)
+        pdf.add_object(stream)
+        pdf.add_page(RawObject(page_head + stream.reference + b">>"))
+
+    output = io.BytesIO()
+    pdf.write(output, compress=True)
+    return output.getvalue()
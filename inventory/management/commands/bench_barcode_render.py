@@ -0,0 +1,53 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.barcode_images import IMAGE_OPTIONS, render_png
+from inventory.models import iter_sequence_numbers
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark: python-barcode ImageWriter vs. the in-project Code128 rasterizer for label PNGs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=500, help="Images rendered per run")
+        parser.add_argument('--prefix', default='SKU', help="Prefix of the rendered sequence numbers")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per method (best is reported)")
+
+    def handle(self, *args, **options):
+        try:
+            import barcode
+            from barcode.writer import ImageWriter
+            from PIL import Image
+        except ImportError as e:
+            raise CommandError(f"python-barcode and Pillow are needed for the comparison: {e}")
+
+        codes = list(iter_sequence_numbers(options['prefix'], 0, options['count']))
+        code128 = barcode.get_barcode_class('code128')
+
+        def reference(code):
+            buffer = io.BytesIO()
+            code128(code, writer=ImageWriter()).write(buffer, IMAGE_OPTIONS)
+            return buffer.getvalue()
+
+        # Same bars on the same pixels, or the labels would not scan the same
+        for code in codes[:50] + codes[-50:]:
+            expected = Image.open(io.BytesIO(reference(code))).convert('L')
+            actual = Image.open(io.BytesIO(render_png(code))).convert('L')
+            if expected.size != actual.size or expected.tobytes() != actual.tobytes():
+                raise CommandError(f"rasterizer output differs from python-barcode for {code}")
+
+        results = {}
+        for name, func in (('python-barcode + PIL', reference), ('in-project rasterizer', render_png)):
+            best = float('inf')
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                for code in codes:
+                    func(code)
+                best = min(best, time.perf_counter() - started)
+            results[name] = best
+            self.stdout.write(f"{name:<22} {best * 1000:9.2f} ms  ({len(codes) / best:,.0f} renders/s)")
+
+        speedup = results['python-barcode + PIL'] / results['in-project rasterizer']
+        self.stdout.write(self.style.SUCCESS(f"in-project rasterizer is {speedup:.1f}x faster for {len(codes):,} images"))
@@ -0,0 +1,73 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from inventory.models import SKU, Barcode, BarcodeBlock, BarcodeSequence, Batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark: substring lookups of sequence numbers through the search index vs. a plain "
+        "icontains scan, over a scratch batch of barcodes added to the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000000, help="Scratch barcodes to add")
+        parser.add_argument('--terms', type=int, default=20, help="Partial codes looked up")
+        parser.add_argument('--prefix', default='ZZSEARCH', help="Scratch SKU and prefix, removed afterwards")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        count, prefix = options['count'], options['prefix']
+        self.cleanup(prefix)
+        try:
+            started = time.perf_counter()
+            sku = SKU.objects.create(code=prefix)
+            # Inserted by Batch.save in bulk_create chunks, as production batches are
+            batch = Batch.objects.create(sku=sku, quantity=count)
+            self.stdout.write(f"Added {count:,} barcodes in {time.perf_counter() - started:.1f} s "
+                              f"({Barcode.objects.count():,} in total)")
+
+            # What an operator types: a few characters from the middle or end of a code
+            rng = random.Random(options['seed'])
+            terms = []
+            for code in rng.sample(list(batch.sequence_numbers()), min(options['terms'], count)):
+                length = rng.randint(4, 6)
+                start = rng.randint(len(prefix) - 2, len(code) - length)
+                terms.append(code[start:start + length].lower())
+
+            results = {}
+            for name, lookup in (
+                ('icontains scan', lambda term: Barcode.objects.filter(sequence_number__icontains=term)),
+                ('search index', lambda term: Barcode.objects.search(term)),
+            ):
+                timings, found = [], []
+                for term in terms:
+                    started = time.perf_counter()
+                    found.append(set(lookup(term).values_list('id', flat=True)))
+                    timings.append(time.perf_counter() - started)
+                results[name] = found
+                timings.sort()
+                self.stdout.write(f"{name:<15} median {timings[len(timings) // 2] * 1000:9.2f} ms  "
+                                  f"max {timings[-1] * 1000:9.2f} ms  "
+                                  f"({sum(map(len, found)) / len(found):,.0f} matches per term)")
+            if results['icontains scan'] != results['search index']:
+                raise CommandError("The search index and icontains disagree")
+        finally:
+            self.cleanup(prefix)
+        self.stdout.write(self.style.SUCCESS(f"{len(terms)} terms over {count:,} barcodes on {connection.vendor}: "
+                                             "same matches from both"))
+
+    def cleanup(self, prefix):
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Straight SQL: collecting a million rows for a cascading delete takes longer than the benchmark
+            cursor.execute(
+                "DELETE FROM inventory_barcode WHERE batch_id IN "
+                "(SELECT id FROM inventory_batch WHERE prefix = %s)", [prefix],
+            )
+            Batch.objects.filter(prefix=prefix).delete()
+            SKU.objects.filter(code=prefix).delete()
+            BarcodeBlock.objects.filter(prefix=prefix).delete()
+            BarcodeSequence.objects.filter(prefix=prefix).delete()
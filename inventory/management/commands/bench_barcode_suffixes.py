@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import decode_suffix, encode_suffix, increment_suffix, iter_sequence_numbers
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark: increment_suffix() loop vs. integer-range generation of sequence numbers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000, help="Codes generated per run")
+        parser.add_argument('--start', default='A001', help="First suffix of the range")
+        parser.add_argument('--prefix', default='SKU', help="Prefix prepended to every code")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per method (best is reported)")
+
+    def handle(self, *args, **options):
+        count, start, prefix = options['count'], options['start'], options['prefix']
+
+        def stepwise():
+            codes, suffix = [], start
+            for _ in range(count):
+                codes.append(f"{prefix}{suffix}")
+                suffix = increment_suffix(suffix)
+            return codes
+
+        def ranged():
+            return list(iter_sequence_numbers(prefix, decode_suffix(start), count))
+
+        expected = stepwise()
+        if ranged() != expected:
+            raise CommandError("iter_sequence_numbers() disagrees with increment_suffix()")
+        if encode_suffix(decode_suffix(start) + count - 1) != expected[-1][len(prefix):]:
+            raise CommandError("encode_suffix()/decode_suffix() round trip failed")
+
+        results = {}
+        for name, func in (('increment_suffix loop', stepwise), ('integer range', ranged)):
+            best = float('inf')
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                func()
+                best = min(best, time.perf_counter() - started)
+            results[name] = best
+            self.stdout.write(f"{name:<22} {best * 1000:9.2f} ms  ({count / best:,.0f} codes/s)")
+
+        speedup = results['increment_suffix loop'] / results['integer range']
+        self.stdout.write(self.style.SUCCESS(f"integer range is {speedup:.1f}x faster for {count:,} codes from {start}"))
@@ -0,0 +1,80 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+
+from inventory.barcode_images import render_png, render_svg
+from inventory.models import iter_sequence_numbers
+from inventory.pdf import LABEL_PDF_STYLESHEET, LABEL_PDF_TEMPLATE
+
+
+class Command(BaseCommand):
+    help = "Benchmark: PNG vs. inline SVG barcodes on label pages (bytes per label, render time, PDF assembly)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help="Labels per page")
+        parser.add_argument('--prefix', default='SKU', help="Prefix of the rendered sequence numbers")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement (best is reported)")
+
+    def best_of(self, func, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        return best
+
+    def handle(self, *args, **options):
+        codes = list(iter_sequence_numbers(options['prefix'], 0, options['count']))
+        repeat = options['repeat']
+
+        png_bytes = sum(len(render_png(code)) for code in codes) / len(codes)
+        svg_bytes = sum(len(render_svg(code, size_attrs=False)) for code in codes) / len(codes)
+        self.stdout.write(f"{'bytes per label':<24} png {png_bytes:8.0f}   svg {svg_bytes:8.0f}"
+                          "   (png also costs one HTTP request per label)")
+        # What a gzip-compressing server sends for the inline SVG of a whole page
+        svg_page = ''.join(render_svg(code, size_attrs=False) for code in codes).encode()
+        self.stdout.write(f"{'gzipped svg per label':<24} {len(gzip.compress(svg_page)) / len(codes):16.0f}")
+
+        png_time = self.best_of(lambda: [render_png(code) for code in codes], repeat)
+        svg_time = self.best_of(lambda: [render_svg(code, size_attrs=False) for code in codes], repeat)
+        self.stdout.write(f"{'render per label':<24} png {png_time / len(codes) * 1e6:6.0f} us"
+                          f"   svg {svg_time / len(codes) * 1e6:6.0f} us")
+
+        try:
+            from weasyprint import CSS, HTML
+        except (ImportError, OSError) as e:
+            self.stdout.write(self.style.WARNING(f"WeasyPrint unavailable, PDF assembly not measured: {e}"))
+            return
+
+        class Label:
+            def __init__(self, sequence_number):
+                self.sequence_number = sequence_number
+
+        template = get_template(LABEL_PDF_TEMPLATE)
+        stylesheets = [CSS(string=get_template(LABEL_PDF_STYLESHEET).template.source)]
+        barcodes = [Label(code) for code in codes]
+        pngs = {}
+
+        def fetch_png(url):
+            # Serve the label images from memory so only WeasyPrint's own work is timed
+            code = url.rstrip('/').rsplit('/', 1)[-1]
+            if code not in pngs:
+                pngs[code] = render_png(code)
+            return {'string': pngs[code], 'mime_type': 'image/png'}
+
+        results = {}
+        for barcode_format in ('png', 'svg'):
+            html = template.render({'barcodes': barcodes, 'barcode_format': barcode_format})
+            pdf = HTML(string=html, base_url='http://labels.invalid/', url_fetcher=fetch_png).write_pdf(
+                stylesheets=stylesheets)
+            results[barcode_format] = self.best_of(lambda: HTML(
+                string=html, base_url='http://labels.invalid/', url_fetcher=fetch_png,
+            ).write_pdf(stylesheets=stylesheets), repeat)
+            self.stdout.write(f"{'PDF ' + barcode_format:<24} {results[barcode_format] * 1000:9.0f} ms"
+                              f"   {len(pdf) / 1024:8.0f} KiB")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"svg PDF assembly is {results['png'] / results['svg']:.1f}x faster for {len(codes):,} labels"
+        ))
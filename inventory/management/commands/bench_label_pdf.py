@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.barcode_images import attach_label_images
+from inventory.models import Batch, iter_sequence_numbers
+from inventory.pdf import new_pdf_pool, write_label_pdf
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark: wall time of label-sheet PDFs at several sizes, rendered as one document (1 worker) "
+        "or as page-aligned chunks on N processes and merged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--counts', default='100,1000,10000', help="Comma-separated label counts")
+        parser.add_argument('--workers', default='1,2,4,8', help="Comma-separated worker counts")
+        parser.add_argument('--format', default='svg', choices=['svg', 'inline', 'png'])
+        parser.add_argument('--prefix', default='SKU', help="Prefix of the rendered sequence numbers")
+
+    def handle(self, *args, **options):
+        try:
+            import weasyprint  # noqa: F401
+        except (ImportError, OSError) as e:
+            raise CommandError(f"WeasyPrint unavailable: {e}")
+
+        counts = [int(n) for n in options['counts'].split(',')]
+        worker_counts = [int(n) for n in options['workers'].split(',')]
+        batch = Batch(prefix=options['prefix'], quantity=max(counts), device_name='Bench UPS',
+                      battery='12V 7Ah', capacity='1000VA')
+
+        class Label:
+            def __init__(self, sequence_number):
+                self.sequence_number = sequence_number
+                self.batch = batch
+
+        self.stdout.write(f"{'labels':>8}" + ''.join(f"{f'{n} worker(s)':>17}" for n in worker_counts))
+        pools = {n: new_pdf_pool(n) for n in worker_counts if n > 1}
+        try:
+            for pool in pools.values():
+                # Start the processes (and Django in them) before timing
+                list(pool.map(int, range(len(worker_counts) * 8)))
+            for count in counts:
+                barcodes = attach_label_images(
+                    [Label(code) for code in iter_sequence_numbers(options['prefix'], 0, count)],
+                    options['format'],
+                )
+                row = f"{count:>8}"
+                for workers in worker_counts:
+                    started = time.perf_counter()
+                    pdf = write_label_pdf(batch, barcodes, options['format'], 'http://labels.invalid/',
+                                          f"Bench {count} labels", pools.get(workers), workers)
+                    elapsed = time.perf_counter() - started
+                    row += f"{elapsed:>9.2f} s {len(pdf) / 2**20:>4.1f}M"
+                self.stdout.write(row)
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
@@ -0,0 +1,69 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import get_template
+
+from inventory.models import Test
+from inventory.pdf import REPORT_STYLESHEET, REPORT_TEMPLATE, Renderer, _render, new_pdf_pool
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark: test-report render latency from a cold renderer (new fonts, stylesheet and images "
+        "per PDF, as WeasyPrint does by default), a warm in-process renderer and the warm render pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, help="Test whose report is rendered (default: the latest)")
+        parser.add_argument('--repeat', type=int, default=10, help="Renders per mode")
+
+    def handle(self, *args, **options):
+        try:
+            import weasyprint  # noqa: F401
+        except (ImportError, OSError) as e:
+            raise CommandError(f"WeasyPrint unavailable: {e}")
+
+        tests = Test.objects.select_related('barcode')
+        test = tests.get(pk=options['test']) if options['test'] else tests.order_by('-id').first()
+        if test is None:
+            raise CommandError("No test to render a report for.")
+
+        # The same context as views.render_test_report, on a fixed host
+        base_url = f"http://localhost/test/{test.id}/print/"
+        html = get_template(REPORT_TEMPLATE).render({
+            'test': test,
+            'test_answers': test.answers.select_related('question').all(),
+            'header_url': f"http://localhost{settings.MEDIA_URL}reports/header.png",
+            'footer_url': f"http://localhost{settings.MEDIA_URL}reports/footer.png",
+        })
+        what = f"Bench report {test.id}"
+        repeat = options['repeat']
+
+        def cold():
+            return Renderer().render(html, base_url, REPORT_STYLESHEET, what)
+
+        warm = Renderer()
+        warm.warm_up()
+        pool = new_pdf_pool(1)
+        try:
+            # Start the worker and let it warm up before timing
+            pool.submit(int).result()
+            modes = [
+                ('cold renderer', cold),
+                ('warm renderer', lambda: warm.render(html, base_url, REPORT_STYLESHEET, what)),
+                ('warm pool', lambda: pool.submit(_render, html, base_url, REPORT_STYLESHEET, what).result()),
+            ]
+            self.stdout.write(f"{'':<16}{'median':>10}{'min':>10}{'max':>10}")
+            for name, render in modes:
+                times = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    render()
+                    times.append(time.perf_counter() - started)
+                self.stdout.write(f"{name:<16}" + ''.join(
+                    f"{value * 1000:>7.0f} ms" for value in (statistics.median(times), min(times), max(times))
+                ))
+        finally:
+            pool.shutdown()
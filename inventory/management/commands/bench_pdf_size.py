@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import get_template
+
+from inventory.barcode_images import attach_label_images
+from inventory.models import Batch, Test
+from inventory.pdf import (
+    LABEL_PDF_STYLESHEET, LABEL_PDF_TEMPLATE, REPORT_STYLESHEET, REPORT_TEMPLATE, get_renderer,
+    labels_per_page, pdf_options,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark: bytes of a test report and a batch's label sheet as rendered by default and "
+        "size-optimised (PDF_OPTIMIZE_OPTIONS, vector barcodes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, help="Test whose report is rendered (default: the latest)")
+        parser.add_argument('--batch', type=int, help="Batch whose labels are rendered (default: the latest)")
+        parser.add_argument('--format', default='png', choices=['svg', 'inline', 'png'],
+                            help="Barcode format of the default label sheet")
+
+    def handle(self, *args, **options):
+        try:
+            import weasyprint  # noqa: F401
+        except (ImportError, OSError) as e:
+            raise CommandError(f"WeasyPrint unavailable: {e}")
+
+        test = Test.objects.order_by('-id').first() if options['test'] is None else Test.objects.get(pk=options['test'])
+        batch = (Batch.objects.order_by('-id').first() if options['batch'] is None
+                 else Batch.objects.get(pk=options['batch']))
+        renderer = get_renderer()
+        base_url = 'http://localhost/'
+
+        self.stdout.write(f"{'':<28}{'default':>13}{'optimised':>13}{'saved':>8}")
+        if test is not None:
+            # The same context as views.render_test_report, on a fixed host
+            html = get_template(REPORT_TEMPLATE).render({
+                'test': test,
+                'test_answers': test.answers.select_related('question').all(),
+                'header_url': f"{base_url}{settings.MEDIA_URL.lstrip('/')}reports/header.png",
+                'footer_url': f"{base_url}{settings.MEDIA_URL.lstrip('/')}reports/footer.png",
+            })
+            self.row(f"Test report {test.id}", *(
+                renderer.render(html, base_url, REPORT_STYLESHEET, f"Size bench report {test.id}", pdf_options(optimize))
+                for optimize in (False, True)
+            ))
+
+        if batch is not None:
+            def labels(barcode_format, optimize):
+                html = get_template(LABEL_PDF_TEMPLATE).render({
+                    'batch': batch,
+                    'barcodes': attach_label_images(batch.units(), barcode_format),
+                    'barcode_format': barcode_format,
+                    'labels_per_page': labels_per_page(),
+                })
+                return renderer.render(html, base_url, LABEL_PDF_STYLESHEET, f"Size bench labels {batch.id}",
+                                       pdf_options(optimize))
+
+            self.row(f"Labels of batch {batch.id} ({options['format']})", labels(options['format'], False),
+                     labels('svg', True))
+
+    def row(self, name, default, optimised):
+        saved = 1 - len(optimised) / len(default)
+        self.stdout.write(f"{name:<28}{len(default) / 1024:>9.0f} KiB{len(optimised) / 1024:>9.0f} KiB{saved:>8.0%}")
@@ -0,0 +1,194 @@
+import json
+import re
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from inventory import views
+from inventory.models import SKU, Barcode, Batch, CustomUser, Test
+from inventory.pagination import encode_cursor
+
+# Tables that grow with production; a full scan of any of them is a failure
+LARGE_TABLES = ('inventory_test', 'inventory_barcode', 'inventory_batch')
+
+# Full scans that are known and accepted for now: (view, SQL pattern, reason)
+ALLOWED_SCANS = []
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders test_results, batch_list and barcode_list with their filters and page cursors, "
+        "and asks the picker search endpoints, against the configured database (SQLite or "
+        "PostgreSQL); explains every query they run and fails if any of them scans a whole "
+        "test, barcode or batch table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help="Print every query plan")
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f"Query plans can only be checked on SQLite or PostgreSQL, not {connection.vendor}")
+
+        self.factory = RequestFactory()
+        self.user = CustomUser(username='query-plan-check', role='admin')
+        self.verbose_plans = options['verbose_plans']
+        scans = []
+        allowed = set()
+        explained = 0
+        for view, name, kwargs, params in self.requests():
+            for sql, query_params in self.capture(view, name, kwargs, params):
+                plan = self.explain(sql, query_params)
+                explained += 1
+                if self.verbose_plans:
+                    self.stdout.write(f"{name} {params}\n  {sql}\n  " + "\n  ".join(plan))
+                for table in self.full_scans(sql, plan):
+                    reason = next((reason for allowed_view, pattern, reason in ALLOWED_SCANS
+                                   if allowed_view == name and pattern.search(sql)), None)
+                    if reason:
+                        allowed.add(f"Allowed scan of {table} in {name}: {reason}")
+                    else:
+                        scans.append(f"{name} {params}: full scan of {table}\n  {sql}\n  " + "\n  ".join(plan))
+
+        for line in sorted(allowed):
+            self.stdout.write(line)
+        if scans:
+            raise CommandError(f"{len(scans)} queries scan a whole table:\n" + "\n".join(scans))
+        self.stdout.write(self.style.SUCCESS(
+            f"{explained} queries explained on {connection.vendor}: no full scans of {', '.join(LARGE_TABLES)}"
+        ))
+
+    def requests(self):
+        """(view, url name, url kwargs, GET params) of every request to check."""
+        now = timezone.now()
+        test_cursor = encode_cursor(Test._meta.get_field('test_date'), Test(pk=1, test_date=now))
+        batch_cursor = encode_cursor(Batch._meta.get_field('created_at'), Batch(pk=1, created_at=now))
+        today = now.date().isoformat()
+        pages = [{}, {'after': test_cursor}, {'before': test_cursor}]
+
+        batch = Batch.objects.order_by('-id').first()
+        test = Test.objects.order_by('-id').first()
+        # A partial code, as typed from a damaged label
+        term = next(batch.sequence_numbers(), 'A001')[-4:] if batch else 'A001'
+        test_filters = [
+            {},
+            {'from_date': today, 'to_date': today},
+            {'sku': batch.sku.code if batch else 'SKU'},
+            {'batch': batch.id if batch else 1},
+            {'batch': batch.id if batch else 1, 'from_date': today},
+            {'template_used': test.template_used_id if test and test.template_used_id else 1},
+            {'barcode': term},
+        ]
+        for filters in test_filters:
+            for page in pages:
+                yield views.test_results, 'test_results', {}, {**filters, **page}
+
+        for filters in [{}, {'from_date': today, 'to_date': today}, {'sku_code': batch.sku.code if batch else 'SKU'}]:
+            for page in [{}, {'after': batch_cursor}, {'before': batch_cursor}]:
+                yield views.batch_list, 'batch_list', {}, {**filters, **page}
+
+        # One batch of each storage kind
+        for virtual in (False, True):
+            batch = Batch.objects.filter(virtual_barcodes=virtual).order_by('-id').first()
+            if batch is None:
+                self.stdout.write(f"No {'range-backed' if virtual else 'row-backed'} batch: barcode_list skipped for it")
+                continue
+            if virtual:
+                cursor = next(batch.sequence_numbers(), '')
+            else:
+                cursor = encode_cursor(Barcode._meta.get_field('id'), Barcode(pk=1))
+            for filters in [{}, {'barcode_number': next(batch.sequence_numbers(), 'A001')[-4:]}]:
+                for page in [{}, {'after': cursor}, {'before': cursor}]:
+                    yield views.barcode_list, 'barcode_list', {'batch_id': batch.id}, {**filters, **page}
+            for q in ['', batch.prefix[:2], next(batch.sequence_numbers(), 'A001')[:-2]]:
+                yield views.search_barcodes, 'search_barcodes', {}, {'batch': batch.id, 'q': q}
+
+        # The pickers, as the user types
+        sku = SKU.objects.order_by('-id').first()
+        for params in [{'q': ''}, {'q': sku.code[:2] if sku else 'A'}, {'q': '1'},
+                       {'q': '', 'sku': sku.id if sku else 1}]:
+            yield views.search_batches, 'search_batches', {}, params
+        yield views.search_barcodes, 'search_barcodes', {}, {'q': term}
+
+    def capture(self, view, name, kwargs, params):
+        """The SELECTs a request to the view runs, as (sql, params)."""
+        request = self.factory.get(reverse(name, kwargs=kwargs), params)
+        request.user = self.user
+        queries = []
+
+        def record(execute, sql, query_params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((sql, query_params))
+            return execute(sql, query_params, many, context)
+
+        # Searches are cached; run every one
+        with override_settings(TYPEAHEAD_CACHE_SECONDS=0), connection.execute_wrapper(record):
+            response = view(request, **kwargs)
+        if response.status_code != 200:
+            raise CommandError(f"{name} {params} returned {response.status_code}")
+        return [(sql, query_params) for sql, query_params in queries if '"inventory_' in sql]
+
+    def explain(self, sql, params):
+        """
+        The plan of a query, one line per step. On PostgreSQL a line is
+        "<node type> on <table>", followed by "[cond]" when an index
+        condition narrows the scan.
+        """
+        with self.planner(), connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                return [row[-1] for row in cursor.fetchall()]
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        lines = []
+        nodes = [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            line = node['Node Type']
+            if 'Relation Name' in node:
+                line += f" on {node['Relation Name']}"
+            if 'Index Cond' in node:
+                line += " [cond]"
+            lines.append(line)
+            nodes.extend(node.get('Plans', []))
+        return lines
+
+    @contextmanager
+    def planner(self):
+        if connection.vendor == 'sqlite':
+            yield
+            return
+        # Test databases are small enough that PostgreSQL would rightly prefer a
+        # sequential scan; with those priced out, one left in the plan means no
+        # usable index exists
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            yield
+
+    def full_scans(self, sql, plan):
+        """
+        The large tables that the plan reads in full. Walking a whole table or
+        index without a condition only counts as bounded when it delivers the
+        rows in the order asked for and the query stops after a page of them.
+        """
+        if connection.vendor == 'postgresql':
+            walks = [re.match(r'(?:Seq|Index|Index Only) Scan on (\w+)$', line) for line in plan]
+            sorted_ = any(line.endswith('Sort') for line in plan)
+            tables = [walk.group(1) for walk in walks
+                      if walk and (walk.group(0).startswith('Seq') or sorted_ or 'Limit' not in plan)]
+        else:
+            # SQLite names a table by its alias when the query gives it one ("inventory_test" U0)
+            aliases = {alias: table for table, alias in re.findall(r'"(\w+)" (\w+)\b', sql)}
+            walks = [re.match(r'SCAN (\w+)(.*)', line) for line in plan]
+            sorted_ = any('TEMP B-TREE FOR ORDER BY' in line for line in plan)
+            paged = re.search(r'\bLIMIT\b', sql) is not None
+            tables = [aliases.get(walk.group(1), walk.group(1)) for walk in walks
+                      if walk and ('USING' not in walk.group(2) or sorted_ or not paged)]
+        return [table for table in tables if table in LARGE_TABLES]
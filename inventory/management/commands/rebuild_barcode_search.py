@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from inventory import barcode_search
+from inventory.models import Barcode
+
+
+class Command(BaseCommand):
+    help = (
+        "Recreate the sequence-number search index and re-index every barcode. Run it if a "
+        "migration rebuilt the barcode table on SQLite (which drops the triggers that keep the "
+        "index in sync; searches fall back to a scan until then)."
+    )
+
+    def handle(self, *args, **options):
+        barcode_search.uninstall(connection)
+        barcode_search.install(connection)
+        self.stdout.write(self.style.SUCCESS(
+            f"Search index rebuilt on {connection.vendor} for {Barcode.objects.count():,} barcodes"
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.models import DailyTestCount, Test
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the DailyTestCount rollup (tests per day, SKU, batch, template and status) "
+        "from the Test table. Test.save keeps it current; run this after tests were deleted "
+        "or changed outside of it (bulk updates, raw SQL, restores)."
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = DailyTestCount.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"{rows:,} rollup rows for {Test.objects.count():,} tests in {time.perf_counter() - started:.1f} s"
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from inventory.jobs import run_batch_job, run_label_pdf_job
+from inventory.models import BatchJob, LabelPDFJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued batch jobs, resuming any that were interrupted (e.g. by a server restart), "
+        "then any label PDF jobs left queued or running."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', type=int, help="Run only this job id")
+
+    def handle(self, *args, **options):
+        jobs = BatchJob.objects.filter(status__in=['queued', 'running', 'failed'])
+        if options['job']:
+            jobs = jobs.filter(pk=options['job'])
+
+        for job_id in jobs.order_by('created_at').values_list('pk', flat=True):
+            run_batch_job(job_id)
+            job = BatchJob.objects.get(pk=job_id)
+            style = self.style.SUCCESS if job.status == 'done' else self.style.ERROR
+            self.stdout.write(style(str(job)))
+
+        if options['job']:
+            return
+        pdf_jobs = LabelPDFJob.objects.filter(status__in=['queued', 'running'])
+        for job_id in pdf_jobs.order_by('created_at').values_list('pk', flat=True):
+            run_label_pdf_job(job_id)
+            job = LabelPDFJob.objects.get(pk=job_id)
+            style = self.style.SUCCESS if job.status == 'done' else self.style.ERROR
+            self.stdout.write(style(str(job)))
@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-17 16:20
+
+from django.db import migrations, models
+from django.db.models.functions import Length
+
+
+def seed_sequences(apps, schema_editor):
+    """Start each prefix's counter at the highest suffix already issued."""
+    Batch = apps.get_model("inventory", "Batch")
+    Barcode = apps.get_model("inventory", "Barcode")
+    BarcodeSequence = apps.get_model("inventory", "BarcodeSequence")
+
+    for prefix in Batch.objects.values_list("prefix", flat=True).distinct():
+        last_barcode = (
+            Barcode.objects.filter(sku__code=prefix, sequence_number__startswith=prefix)
+            .order_by(Length("sequence_number").desc(), "-sequence_number")
+            .first()
+        )
+        last_suffix = last_barcode.sequence_number[len(prefix):] if last_barcode else ""
+        BarcodeSequence.objects.get_or_create(
+            prefix=prefix,
+            defaults={"last_suffix": last_suffix if len(last_suffix) >= 4 else ""},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0006_batch_battery"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BarcodeSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("prefix", models.CharField(max_length=20, unique=True)),
+                ("last_suffix", models.CharField(blank=True, max_length=20)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-17 16:22
+
+from django.db import migrations, models
+
+
+def decode_suffix(suffix):
+    group = 0
+    for letter in suffix[:-3]:
+        group = group * 26 + (ord(letter) - 64)
+    return (group - 1) * 999 + int(suffix[-3:]) - 1
+
+
+def backfill_ranges(apps, schema_editor):
+    """Record the suffix range of every existing batch from its barcodes."""
+    Batch = apps.get_model("inventory", "Batch")
+    Barcode = apps.get_model("inventory", "Barcode")
+
+    for batch in Batch.objects.filter(seq_start__isnull=True):
+        indexes = []
+        for sequence_number in Barcode.objects.filter(batch=batch).values_list(
+            "sequence_number", flat=True
+        ):
+            suffix = sequence_number[len(batch.prefix):]
+            if len(suffix) >= 4 and suffix[:-3].isalpha() and suffix[-3:].isdigit():
+                indexes.append(decode_suffix(suffix))
+        if indexes:
+            batch.seq_start, batch.seq_end = min(indexes), max(indexes) + 1
+            batch.save(update_fields=["seq_start", "seq_end"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0007_barcodesequence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="batch",
+            name="seq_end",
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="batch",
+            name="seq_start",
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="batch",
+            name="virtual_barcodes",
+            field=models.BooleanField(
+                default=False,
+                help_text="Record the batch as a code range and create barcode rows only when a unit is used",
+            ),
+        ),
+        migrations.RunPython(backfill_ranges, migrations.RunPython.noop),
+    ]
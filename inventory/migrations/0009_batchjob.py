@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-17 17:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0008_batch_sequence_range"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BatchJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("status", models.CharField(choices=[("queued", "Queued"), ("running", "Running"), ("done", "Done"), ("failed", "Failed")], default="queued", max_length=20)),
+                ("total", models.PositiveIntegerField()),
+                ("created", models.PositiveIntegerField(default=0)),
+                ("error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("batch", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name="job", to="inventory.batch")),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-17 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0009_batchjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BarcodeBlock",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("prefix", models.CharField(db_index=True, max_length=20)),
+                ("holder", models.CharField(max_length=100)),
+                ("start_index", models.PositiveBigIntegerField()),
+                ("end_index", models.PositiveBigIntegerField()),
+                ("next_index", models.PositiveBigIntegerField()),
+                ("leased_at", models.DateTimeField(auto_now_add=True)),
+                ("released_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-17 17:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0010_barcodeblock"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LabelPDFJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("barcode_format", models.CharField(max_length=10)),
+                ("base_url", models.CharField(max_length=500)),
+                ("status", models.CharField(choices=[("queued", "Queued"), ("running", "Running"), ("done", "Done"), ("failed", "Failed")], default="queued", max_length=20)),
+                ("size", models.PositiveBigIntegerField(blank=True, null=True)),
+                ("error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("batch", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="label_pdf_jobs", to="inventory.batch")),
+            ],
+        ),
+    ]
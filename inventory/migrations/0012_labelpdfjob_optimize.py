@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0011_labelpdfjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="labelpdfjob",
+            name="optimize",
+            field=models.BooleanField(default=False),
+        ),
+    ]
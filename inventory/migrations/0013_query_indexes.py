@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-17 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0012_labelpdfjob_optimize"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="barcode",
+            index=models.Index(fields=["batch", "sequence_number", "id"], name="barcode_batch_seq_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="batch",
+            index=models.Index(fields=["created_at", "id"], name="batch_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="batch",
+            index=models.Index(fields=["batch_date"], name="batch_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="test",
+            index=models.Index(fields=["test_date", "id"], name="test_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="test",
+            index=models.Index(fields=["batch", "test_date"], name="test_batch_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="test",
+            index=models.Index(fields=["sku", "test_date"], name="test_sku_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="test",
+            index=models.Index(fields=["template_used", "test_date"], name="test_template_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="test",
+            index=models.Index(fields=["overall_status", "test_date"], name="test_status_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="test",
+            index=models.Index(fields=["barcode", "test_date", "id"], name="test_barcode_latest_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="test",
+            index=models.Index(fields=["batch", "barcode"], name="test_batch_barcode_idx"),
+        ),
+    ]
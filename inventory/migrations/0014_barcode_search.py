@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-17 18:05
+
+from django.db import migrations
+
+from inventory import barcode_search
+
+
+def install_search_index(apps, schema_editor):
+    """Index sequence numbers for substring search (pg_trgm on PostgreSQL, FTS5 on SQLite)."""
+    barcode_search.install(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    barcode_search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0013_query_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-17 18:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def count_existing_tests(apps, schema_editor):
+    """Fill the rollup from the tests recorded so far."""
+    Test = apps.get_model("inventory", "Test")
+    DailyTestCount = apps.get_model("inventory", "DailyTestCount")
+
+    rows = Test.objects.order_by().values(
+        "sku_id", "batch_id", "template_used_id", "overall_status", day=TruncDate("test_date")
+    ).annotate(tests=Count("id"))
+    DailyTestCount.objects.bulk_create(
+        [
+            DailyTestCount(
+                day=row["day"],
+                sku_id=row["sku_id"],
+                batch_id=row["batch_id"],
+                template_used_id=row["template_used_id"],
+                status=row["overall_status"],
+                count=row["tests"],
+            )
+            for row in rows.iterator()
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0014_barcode_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyTestCount",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("status", models.CharField(choices=[("pending", "Pending"), ("passed", "Passed"), ("failed", "Failed")], max_length=20)),
+                ("count", models.IntegerField(default=0)),
+                ("batch", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="inventory.batch")),
+                ("sku", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="inventory.sku")),
+                ("template_used", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to="inventory.testtemplate")),
+            ],
+            options={
+                "indexes": [models.Index(fields=["batch", "day"], name="daily_count_batch_idx")],
+                "constraints": [models.UniqueConstraint(fields=("day", "sku", "batch", "template_used", "status"), name="daily_test_count_key")],
+            },
+        ),
+        migrations.RunPython(count_existing_tests, migrations.RunPython.noop),
+    ]
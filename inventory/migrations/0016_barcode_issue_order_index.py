@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 18:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0015_dailytestcount"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="barcode",
+            index=models.Index(fields=["batch", "id"], name="barcode_batch_id_idx"),
+        ),
+    ]
@@ -1,7 +1,19 @@
+import atexit
+import os
 import string
-from django.db import models
+import threading
+from datetime import timedelta
+from itertools import islice
+from django.conf import settings
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Length, TruncDate
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
+
+from .barcode_search import filter_sequence_contains
 # from .utils import generate_barcode # Assuming this is not strictly needed for model definition
 
 class CustomUser(AbstractUser):
@@ -50,6 +62,265 @@ def increment_suffix(suffix: str) -> str:
     new_letters = "".join(letters_list)
     return f"{new_letters}001"
 
+
+# Each letter group (A, B, ... Z, AA, ...) carries the numbers 001..999, so a
+# suffix maps to an integer as (bijective base-26 letters - 1) * 999 + number - 1.
+SUFFIX_NUMBERS = tuple(f"{n:03d}" for n in range(1, 1000))
+
+
+def decode_suffix(suffix: str) -> int:
+    """
+    A001 -> 0, A999 -> 998, B001 -> 999, Z999 -> 25973, AA001 -> 25974 ...
+    Inverse of encode_suffix().
+    """
+    group = 0
+    for letter in suffix[:-3]:
+        group = group * 26 + (ord(letter) - 64)
+    return (group - 1) * len(SUFFIX_NUMBERS) + int(suffix[-3:]) - 1
+
+
+def suffix_letters(group_index: int) -> str:
+    """Letters of the 0-based letter group: 0 -> A, 25 -> Z, 26 -> AA ..."""
+    letters = ""
+    group = group_index + 1
+    while group:
+        group, remainder = divmod(group - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def encode_suffix(index: int) -> str:
+    """0 -> A001, 998 -> A999, 999 -> B001 ... Inverse of decode_suffix()."""
+    group_index, number_index = divmod(index, len(SUFFIX_NUMBERS))
+    return suffix_letters(group_index) + SUFFIX_NUMBERS[number_index]
+
+
+def is_valid_suffix(suffix: str) -> bool:
+    """True for suffixes of the form <A-Z letters><001..999>."""
+    letters, number = suffix[:-3], suffix[-3:]
+    return (
+        bool(letters) and letters.isascii() and letters.isalpha() and letters.isupper()
+        and number.isdigit() and number != "000"
+    )
+
+
+def iter_sequence_numbers(prefix: str, start_index: int, count: int):
+    """
+    Yield `count` full sequence numbers starting at suffix index `start_index`.
+    Letters are worked out once per 999-code group and the numbers are sliced
+    from a pre-formatted table, so large ranges cost one concatenation per code.
+    """
+    index, end = start_index, start_index + count
+    while index < end:
+        group_index, number_index = divmod(index, len(SUFFIX_NUMBERS))
+        stop = min(end - index + number_index, len(SUFFIX_NUMBERS))
+        head = prefix + suffix_letters(group_index)
+        yield from [head + number for number in SUFFIX_NUMBERS[number_index:stop]]
+        index += stop - number_index
+
+
+def suffix_ranges(start: str):
+    """
+    Yield the suffix indexes (see decode_suffix) of the suffixes beginning
+    with `start`, as (first, stop) ranges in increasing order. Letters alone
+    match every longer letter group after them too (A -> A, AA..AZ, AAA..AZZ
+    ...), so that case never ends; the caller stops when it has enough.
+    """
+    letters = start[:len(start) - len(start.lstrip(string.ascii_uppercase))]
+    digits = start[len(letters):]
+    if not start:
+        yield 0, float('inf')
+        return
+    if not letters or (digits and not (digits.isascii() and digits.isdigit())):
+        return
+    if digits:
+        first, last = max(int(digits.ljust(3, '0')), 1), int(digits.ljust(3, '9'))
+        if len(digits) <= 3 and first <= last:
+            group_start = decode_suffix(letters + SUFFIX_NUMBERS[0])
+            yield group_start + first - 1, group_start + last
+        return
+    extra = 0
+    while True:
+        yield (decode_suffix(letters + 'A' * extra + SUFFIX_NUMBERS[0]),
+               decode_suffix(letters + 'Z' * extra + SUFFIX_NUMBERS[-1]) + 1)
+        extra += 1
+
+
+def last_issued_suffix(prefix: str):
+    """
+    Highest suffix already present in the Barcode table for a prefix, or None.
+    Longer suffixes always come later (Z999 -> AA001), so order by length first.
+    """
+    last_barcode = (
+        Barcode.objects
+        .filter(sku__code=prefix, sequence_number__startswith=prefix)
+        .order_by(Length('sequence_number').desc(), '-sequence_number')
+        .first()
+    )
+    if not last_barcode:
+        return None
+    last_suffix = last_barcode.sequence_number[len(prefix):]
+    return last_suffix if len(last_suffix) >= 4 else None
+
+
+class BarcodeSequence(models.Model):
+    """
+    One counter row per barcode prefix. Batch.save() locks the row and moves it
+    forward by the batch quantity, so allocation never scans the Barcode table
+    and concurrent batches for the same SKU cannot receive the same codes.
+    """
+    prefix = models.CharField(max_length=20, unique=True)
+    last_suffix = models.CharField(max_length=20, blank=True)  # '' = nothing issued yet
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.prefix} -> {self.last_suffix or '(none)'}"
+
+    @classmethod
+    def locked(cls, prefix):
+        """Return the counter row for prefix, locked until the surrounding transaction ends."""
+        try:
+            return cls.objects.select_for_update().get(prefix=prefix)
+        except cls.DoesNotExist:
+            pass
+        # First batch for this prefix since the counter table was introduced:
+        # seed it once from whatever is already in the Barcode table.
+        try:
+            with transaction.atomic():
+                cls.objects.create(prefix=prefix, last_suffix=last_issued_suffix(prefix) or '')
+        except IntegrityError:
+            pass  # another worker created it first
+        return cls.objects.select_for_update().get(prefix=prefix)
+
+    @classmethod
+    def allocate(cls, prefix, count):
+        """
+        Reserve `count` consecutive suffixes for prefix and return the suffix
+        index (see decode_suffix) of the first one. Costs the same few queries
+        whatever the size of the Barcode table.
+        """
+        with transaction.atomic():
+            sequence = cls.locked(prefix)
+            first_index = decode_suffix(sequence.last_suffix) + 1 if sequence.last_suffix else 0
+            if count > 0:
+                sequence.last_suffix = encode_suffix(first_index + count - 1)
+                sequence.save(update_fields=['last_suffix', 'updated_at'])
+            return first_index
+
+
+class BarcodeBlock(models.Model):
+    """
+    A block of suffixes leased from BarcodeSequence by one process (hi/lo).
+    Codes are handed out from the block in memory by BlockAllocator, so lines
+    only touch the shared counter row once per block. next_index is kept up to
+    date, so end_index - next_index is the unused tail once a block is released
+    or its process has gone away.
+    """
+    prefix = models.CharField(max_length=20, db_index=True)
+    holder = models.CharField(max_length=100)  # "<BARCODE_NODE_NAME>:<pid>"
+    start_index = models.PositiveBigIntegerField()
+    end_index = models.PositiveBigIntegerField()  # exclusive
+    next_index = models.PositiveBigIntegerField()  # first suffix index not handed out yet
+    leased_at = models.DateTimeField(auto_now_add=True)
+    released_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.prefix} {encode_suffix(self.start_index)}..{encode_suffix(self.end_index - 1)} ({self.holder})"
+
+    @property
+    def unused(self):
+        return self.end_index - self.next_index
+
+    @classmethod
+    def lease(cls, prefix, size, holder):
+        with transaction.atomic():
+            start_index = BarcodeSequence.allocate(prefix, size)
+            return cls.objects.create(
+                prefix=prefix, holder=holder,
+                start_index=start_index, end_index=start_index + size, next_index=start_index,
+            )
+
+    def release(self):
+        """Close the block; whatever is left between next_index and end_index stays recorded as a gap."""
+        self.released_at = timezone.now()
+        BarcodeBlock.objects.filter(pk=self.pk, holder=self.holder).update(released_at=self.released_at)
+
+
+class BlockAllocator:
+    """
+    Per-process allocator that serves consecutive suffix ranges out of leased
+    BarcodeBlocks. A batch always gets one contiguous range, so a request that
+    does not fit in what is left of the block releases the tail and leases a
+    new block (at least `count` long).
+    """
+    def __init__(self):
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def holder(self):
+        # The pid keeps sibling worker processes on one node from sharing a block
+        return f"{settings.BARCODE_NODE_NAME}:{os.getpid()}"
+
+    def allocate(self, prefix, count):
+        with self._lock:
+            block = self._blocks.get(prefix)
+            first_index = None if block is None else self._advance(block, count)
+            if first_index is None:
+                # Used up, or gone: the transaction that leased it was rolled back
+                if block is not None:
+                    block.release()
+                block = BarcodeBlock.lease(prefix, max(settings.BARCODE_BLOCK_SIZE, count), self.holder)
+                self._blocks[prefix] = block
+                first_index = self._advance(block, count)
+            return first_index
+
+    def _advance(self, block, count):
+        """
+        Take `count` suffixes off the block's row and return the first, or None
+        if the block has no room for them or no longer exists. The row is the
+        record of what was handed out: if the caller's transaction rolls back,
+        so does the advance, and the same codes are handed out next time. The
+        in-memory copy only follows once the transaction has committed.
+        """
+        rows = BarcodeBlock.objects.filter(
+            pk=block.pk, holder=block.holder, start_index=block.start_index, released_at__isnull=True,
+        )
+        with transaction.atomic():
+            if not rows.filter(next_index__lte=F('end_index') - count).update(next_index=F('next_index') + count):
+                return None
+            next_index = rows.values_list('next_index', flat=True).get()
+        transaction.on_commit(lambda: setattr(block, 'next_index', next_index))
+        return next_index - count
+
+    def release_all(self):
+        with self._lock:
+            for block in self._blocks.values():
+                block.release()
+            self._blocks.clear()
+
+
+block_allocator = BlockAllocator()
+
+
+@atexit.register
+def _release_leased_blocks():
+    try:
+        block_allocator.release_all()
+    except Exception:
+        pass  # the database may already be gone at interpreter exit; next_index still records the tail
+
+
+def allocate_suffixes(prefix, count):
+    """
+    Reserve `count` consecutive suffixes for prefix and return the first suffix
+    index. Uses leased blocks when BARCODE_BLOCK_SIZE is set, otherwise the
+    shared counter directly.
+    """
+    if settings.BARCODE_BLOCK_SIZE:
+        return block_allocator.allocate(prefix, count)
+    return BarcodeSequence.allocate(prefix, count)
+
 class BatchSpecTemplate(models.Model):
     name = models.CharField(max_length=100, unique=True) # e.g., SOLAR PCU, MPPT, LI-UPS
     # Stores a list of required field names: ["battery", "capacity", "mppt_cap"]
@@ -87,46 +358,143 @@ class Batch(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Suffix indexes (see decode_suffix) of the codes issued to this batch: seq_start <= i < seq_end
+    seq_start = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    seq_end = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    # Range-backed batches store only the range above; a Barcode row is created
+    # the first time a unit is scanned, tested or printed on its own.
+    virtual_barcodes = models.BooleanField(
+        default=False,
+        help_text="Record the batch as a code range and create barcode rows only when a unit is used",
+    )
+
+    class Meta:
+        indexes = [
+            # batch_list: newest first, keyset on (created_at, id); date filters
+            models.Index(fields=['created_at', 'id'], name='batch_created_idx'),
+            models.Index(fields=['batch_date'], name='batch_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.prefix} - {self.batch_date}"
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, create_barcodes=True, **kwargs):
         # Auto-set prefix from SKU code before saving
         self.prefix = self.sku.code
 
+        # create_barcodes=False only reserves the range; a BatchJob fills in the rows later
         is_new = self.pk is None
-        super().save(*args, **kwargs)
-
-        if is_new:
-            last_barcode = (
-                Barcode.objects
-                .filter(sequence_number__startswith=self.prefix)
-                .order_by('-sequence_number')
-                .first()
+        with transaction.atomic():
+            if is_new:
+                # The counter row stays locked until the batch and its barcodes are committed
+                self.seq_start = allocate_suffixes(self.prefix, self.quantity)
+                self.seq_end = self.seq_start + self.quantity
+            super().save(*args, **kwargs)
+            if is_new and create_barcodes and not self.virtual_barcodes:
+                self._create_barcodes()
+            if is_new and settings.BARCODE_PRERENDER:
+                # Only needs the code range, so it can run alongside a BatchJob
+                from .jobs import enqueue_prerender
+                enqueue_prerender(self)
+
+    def _create_barcodes(self):
+        sequence_numbers = self.sequence_numbers()
+
+        # Insert in fixed-size chunks so memory stays flat for very large quantities
+        chunk_size = settings.BARCODE_BULK_BATCH_SIZE
+        while True:
+            barcodes = self._barcode_rows(islice(sequence_numbers, chunk_size))
+            if not barcodes:
+                break
+            Barcode.objects.bulk_create(barcodes, batch_size=chunk_size)
+
+    def _barcode_rows(self, sequence_numbers):
+        return [
+            Barcode(
+                batch=self,
+                sku=self.sku,
+                sequence_number=full_code,
+                #barcode_image=generate_barcode(full_code)
             )
-            if last_barcode:
-                last_suffix = last_barcode.sequence_number.replace(self.prefix, '')
-                if len(last_suffix) < 4:
-                    last_suffix = None
-            else:
-                last_suffix = None
+            for full_code in sequence_numbers
+        ]
+
+    def needs_background_job(self):
+        """True if the barcode rows for this (unsaved) batch should be inserted by a BatchJob."""
+        return not self.virtual_barcodes and self.quantity >= settings.BARCODE_BACKGROUND_THRESHOLD
+
+    def sequence_numbers(self, offset=0, count=None):
+        """Iterate the batch's sequence numbers in issue order, optionally a window of them."""
+        if self.seq_start is None:
+            return iter(())
+        total = self.seq_end - self.seq_start
+        count = total - offset if count is None else min(count, total - offset)
+        return iter_sequence_numbers(self.prefix, self.seq_start + offset, max(count, 0))
+
+    def sequence_numbers_starting(self, start):
+        """
+        The batch's sequence numbers beginning with `start`, in issue order,
+        worked out from the range: only the matching slice of it is generated.
+        """
+        if self.seq_start is None:
+            return
+        if len(start) <= len(self.prefix):
+            if self.prefix.startswith(start):
+                yield from self.sequence_numbers()
+            return
+        if not start.startswith(self.prefix):
+            return
+        for first, stop in suffix_ranges(start[len(self.prefix):]):
+            if first >= self.seq_end:
+                return
+            first, stop = max(first, self.seq_start), min(stop, self.seq_end)
+            if first < stop:
+                yield from iter_sequence_numbers(self.prefix, first, stop - first)
+
+    def contains(self, sequence_number):
+        """True if sequence_number falls inside this batch's issued range."""
+        if self.seq_start is None or not sequence_number.startswith(self.prefix):
+            return False
+        suffix = sequence_number[len(self.prefix):]
+        return is_valid_suffix(suffix) and self.seq_start <= decode_suffix(suffix) < self.seq_end
+
+    @classmethod
+    def for_sequence_number(cls, sequence_number):
+        """The range-backed batch whose range holds sequence_number, or None."""
+        prefixes = [
+            sequence_number[:i] for i in range(1, len(sequence_number) - 3)
+            if is_valid_suffix(sequence_number[i:])
+        ]
+        for batch in cls.objects.filter(prefix__in=prefixes, virtual_barcodes=True).select_related('sku'):
+            if batch.contains(sequence_number):
+                return batch
+        return None
+
+    def units(self):
+        """Barcodes of the batch for listing and printing, whichever way the batch is stored."""
+        if self.virtual_barcodes:
+            return BarcodeRange(self)
+        return Barcode.objects.filter(batch=self)
 
-            next_suffix = "A001" if not last_suffix else increment_suffix(last_suffix)
 
-            barcodes = []
-            for _ in range(self.quantity):
-                full_code = f"{self.prefix}{next_suffix}"
-                barcodes.append(
-                    Barcode(
-                        batch=self,
-                        sku=self.sku,
-                        sequence_number=full_code,
-                        #barcode_image=generate_barcode(full_code)
-                    )
-                )
-                next_suffix = increment_suffix(next_suffix)
+class BarcodeQuerySet(models.QuerySet):
+    def with_latest_test(self):
+        """
+        Annotate each barcode with latest_status and latest_test_date, from its
+        latest Test (both None if it was never tested), as correlated subqueries.
+        """
+        latest = Test.objects.filter(barcode=OuterRef('pk')).order_by('-test_date', '-id')
+        return self.annotate(
+            latest_status=Subquery(latest.values('overall_status')[:1]),
+            latest_test_date=Subquery(latest.values('test_date')[:1]),
+        )
 
-            Barcode.objects.bulk_create(barcodes)
+    def search(self, term):
+        """
+        Barcodes whose sequence number contains term, case-insensitively,
+        looked up through the sequence-number search index (see barcode_search).
+        """
+        return filter_sequence_contains(self, term.strip(), connections[self.db])
 
 
 class Barcode(models.Model):
@@ -135,9 +503,289 @@ class Barcode(models.Model):
     sequence_number = models.CharField(max_length=30, unique=True)
     #barcode_image = models.ImageField(upload_to='barcodes/', blank=True, null=True)
 
+    objects = BarcodeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # barcode_list: a batch's units in issue order, keyset on id
+            models.Index(fields=['batch', 'id'], name='barcode_batch_id_idx'),
+            # search_barcodes: a batch's codes starting with what was typed
+            models.Index(fields=['batch', 'sequence_number', 'id'], name='barcode_batch_seq_idx'),
+        ]
+
     def __str__(self):
         return self.sequence_number
 
+    @classmethod
+    def resolve(cls, sequence_number, batch=None):
+        """
+        Return the Barcode row for sequence_number (optionally within batch).
+        Units of a range-backed batch get their row created here on first use.
+        Returns None if the code was never issued.
+        """
+        rows = cls.objects.filter(batch=batch) if batch is not None else cls.objects.all()
+        barcode = rows.filter(sequence_number=sequence_number).first()
+        if barcode is not None:
+            return barcode
+
+        owner = batch if batch is not None else Batch.for_sequence_number(sequence_number)
+        if owner is None or not owner.virtual_barcodes or not owner.contains(sequence_number):
+            return None
+        barcode, _ = cls.objects.get_or_create(
+            sequence_number=sequence_number,
+            defaults={'batch': owner, 'sku_id': owner.sku_id},
+        )
+        return barcode
+
+
+class BatchJob(models.Model):
+    """
+    Background insert of a large batch's Barcode rows. Each chunk is committed
+    together with the `created` counter, so progress can be polled and a job
+    interrupted by a restart resumes where it stopped: once it is stale, the
+    next status poll or worker pool start queues it again (as run_batch_jobs
+    does by hand).
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    batch = models.OneToOneField(Batch, on_delete=models.CASCADE, related_name='job')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    total = models.PositiveIntegerField()
+    created = models.PositiveIntegerField(default=0)  # Barcode rows committed so far
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Job {self.id} - {self.batch} ({self.status} {self.created}/{self.total})"
+
+    @property
+    def percent(self):
+        return 100 if not self.total else int(self.created * 100 / self.total)
+
+    @property
+    def is_stale(self):
+        """Queued or running with no progress for BATCH_JOB_TIMEOUT: the worker that had it is gone."""
+        return self.status in ('queued', 'running') and (
+            self.updated_at < timezone.now() - timedelta(seconds=settings.BATCH_JOB_TIMEOUT)
+        )
+
+    def run(self):
+        """Insert the remaining rows chunk by chunk, recording progress after each one."""
+        batch = self.batch
+        chunk_size = settings.BARCODE_BULK_BATCH_SIZE
+        if not BatchJob.objects.filter(pk=self.pk).exclude(status='done').update(
+            status='running', error='', updated_at=timezone.now(),
+        ):
+            return  # finished by another worker meanwhile
+        self.status, self.error = 'running', ''
+        try:
+            while self.created < self.total:
+                barcodes = batch._barcode_rows(batch.sequence_numbers(self.created, chunk_size))
+                if not barcodes:
+                    break
+                with transaction.atomic():
+                    # Claim the chunk first: if the job was re-queued as stale
+                    # and another worker has moved it on since, leave it to that one
+                    if not BatchJob.objects.filter(pk=self.pk, created=self.created).update(
+                        created=self.created + len(barcodes), updated_at=timezone.now(),
+                    ):
+                        return
+                    Barcode.objects.bulk_create(barcodes, batch_size=chunk_size)
+                    self.created += len(barcodes)
+        except Exception as e:
+            self.status, self.error = 'failed', str(e)
+            self.save(update_fields=['status', 'error', 'updated_at'])
+            raise
+        self.status = 'done'
+        self.save(update_fields=['status', 'updated_at'])
+
+
+def requeue_job(job, **fields):
+    """
+    Set a BatchJob or LabelPDFJob back to queued (and `fields` with it),
+    unless it changed since it was read, e.g. another process re-queued it
+    first. Returns whether this call did.
+    """
+    now = timezone.now()
+    if not type(job).objects.filter(pk=job.pk, updated_at=job.updated_at).update(
+        status='queued', updated_at=now, **fields,
+    ):
+        return False
+    for name, value in dict(fields, status='queued', updated_at=now).items():
+        setattr(job, name, value)
+    return True
+
+
+class LabelPDFJob(models.Model):
+    """
+    Background render of a batch's label-sheet PDF into LABEL_PDF_DIR. The key
+    hashes everything the PDF depends on, so identical requests share one job
+    (and one file) instead of rendering the same sheet twice.
+    """
+    STATUS_CHOICES = BatchJob.STATUS_CHOICES
+    key = models.CharField(max_length=64, unique=True)
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='label_pdf_jobs')
+    barcode_format = models.CharField(max_length=10)
+    optimize = models.BooleanField(default=False)  # rendered with PDF_OPTIMIZE_OPTIONS
+    base_url = models.CharField(max_length=500)  # resolves relative URLs in the label template
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    size = models.PositiveBigIntegerField(null=True, blank=True)  # bytes, once done
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Label PDF {self.id} - {self.batch} ({self.barcode_format}, {self.status})"
+
+    @property
+    def path(self):
+        return os.path.join(settings.LABEL_PDF_DIR, f"{self.key}.pdf")
+
+    @property
+    def is_stale(self):
+        """Queued or running for over LABEL_PDF_JOB_TIMEOUT: the worker that had it is gone."""
+        return self.status in ('queued', 'running') and (
+            self.updated_at < timezone.now() - timedelta(seconds=settings.LABEL_PDF_JOB_TIMEOUT)
+        )
+
+    @classmethod
+    def submit(cls, batch, barcode_format, base_url, optimize=False):
+        """
+        The job for this batch's labels in this format, size-optimised or not,
+        created (or re-queued, if it failed, its file is gone or its worker
+        is) when needed. Returns (job, queued); the caller hands queued jobs
+        to the worker pool.
+        """
+        from .pdf import label_pdf_key
+
+        key = label_pdf_key(batch, barcode_format, optimize)
+        with transaction.atomic():
+            job, queued = cls.objects.get_or_create(key=key, defaults={
+                'batch': batch, 'barcode_format': barcode_format, 'optimize': optimize, 'base_url': base_url,
+            })
+            if job.status == 'failed' or (job.status == 'done' and not os.path.exists(job.path)) or job.is_stale:
+                queued = requeue_job(job, error='', base_url=base_url) or queued
+        cls.delete_superseded(batch.id, barcode_format, optimize)
+        return job, queued
+
+    def run(self):
+        from .pdf import render_label_pdf
+
+        # Claim the job as it was read: if it has been re-queued as stale or
+        # picked up by another worker since, leave it to that one
+        claimed_at = timezone.now()
+        if not LabelPDFJob.objects.filter(pk=self.pk, status=self.status, updated_at=self.updated_at).update(
+            status='running', error='', updated_at=claimed_at,
+        ):
+            return
+        self.status, self.error, self.updated_at = 'running', '', claimed_at
+        claimed = LabelPDFJob.objects.filter(pk=self.pk, status='running', updated_at=claimed_at)
+        # Each worker writes its own file; only one still holding the claim moves it into place
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            pdf = render_label_pdf(self.batch, self.barcode_format, self.base_url, self.optimize)
+            os.makedirs(settings.LABEL_PDF_DIR, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(pdf)
+        except Exception as e:
+            self.status, self.error, self.updated_at = 'failed', str(e), timezone.now()
+            claimed.update(status=self.status, error=self.error, updated_at=self.updated_at)
+            raise
+        self.status, self.size, self.updated_at = 'done', len(pdf), timezone.now()
+        with transaction.atomic():
+            if not claimed.update(status=self.status, size=self.size, updated_at=self.updated_at):
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, self.path)
+        LabelPDFJob.delete_superseded(self.batch_id, self.barcode_format, self.optimize)
+
+    @classmethod
+    def delete_superseded(cls, batch_id, barcode_format, optimize):
+        """
+        Delete the done sheets of this batch, format and mode, files included,
+        that a newer one replaced over LABEL_PDF_SUPERSEDED_GRACE ago. Until
+        then a page still polling or downloading a replaced sheet gets it.
+        """
+        jobs = cls.objects.filter(batch_id=batch_id, barcode_format=barcode_format, optimize=optimize, status='done')
+        cutoff = timezone.now() - timedelta(seconds=settings.LABEL_PDF_SUPERSEDED_GRACE)
+        replaced_at = jobs.filter(updated_at__lt=cutoff).order_by('-updated_at').values_list(
+            'updated_at', flat=True,
+        ).first()
+        if replaced_at is None:
+            return
+        for old in jobs.filter(updated_at__lt=replaced_at):
+            if os.path.exists(old.path):
+                os.remove(old.path)
+            old.delete()
+
+
+class BarcodeRange:
+    """
+    List-like view over the units of a range-backed batch, usable with
+    Paginator and in template loops. Items are Barcode instances: rows that
+    were already materialised are returned as stored, the rest are unsaved.
+    With with_latest_test, stored rows carry their latest test (see
+    BarcodeQuerySet.with_latest_test); units without a row were never tested.
+    """
+    CHUNK_SIZE = 1000
+
+    def __init__(self, batch, search=None, with_latest_test=False):
+        self.batch = batch
+        self.with_latest_test = with_latest_test
+        self.search = search.strip().upper() if search else ''
+        # A substring filter has to look at every code once; the range itself never does
+        self._codes = [code for code in batch.sequence_numbers() if self.search in code] if self.search else None
+
+    def __len__(self):
+        if self._codes is not None:
+            return len(self._codes)
+        return (self.batch.seq_end - self.batch.seq_start) if self.batch.seq_start is not None else 0
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if self._codes is not None:
+                codes = self._codes[start:stop:step]
+            else:
+                codes = list(self.batch.sequence_numbers(start, stop - start))[::step]
+            return self._units(codes)
+        index = item + len(self) if item < 0 else item
+        if not 0 <= index < len(self):
+            raise IndexError(item)
+        return self[index:index + 1][0]
+
+    def __iter__(self):
+        for start in range(0, len(self), self.CHUNK_SIZE):
+            yield from self[start:start + self.CHUNK_SIZE]
+
+    def index(self, sequence_number):
+        """Position of sequence_number in this view, or None if it isn't in it."""
+        if self._codes is not None:
+            try:
+                return self._codes.index(sequence_number)
+            except ValueError:
+                return None
+        if not self.batch.contains(sequence_number):
+            return None
+        return decode_suffix(sequence_number[len(self.batch.prefix):]) - self.batch.seq_start
+
+    def _units(self, codes):
+        rows = Barcode.objects.filter(batch=self.batch, sequence_number__in=codes)
+        if self.with_latest_test:
+            rows = rows.with_latest_test()
+        stored = {barcode.sequence_number: barcode for barcode in rows}
+        units = []
+        for code in codes:
+            barcode = stored.get(code) or Barcode(sequence_number=code)
+            barcode.batch, barcode.sku = self.batch, self.batch.sku
+            units.append(barcode)
+        return units
+
 class TestTemplate(models.Model): # NEW MODEL
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
@@ -171,9 +819,156 @@ class Test(models.Model):
     test_date = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # test_results: newest first, keyset on (test_date, id), alone or
+            # within one batch, SKU or template
+            models.Index(fields=['test_date', 'id'], name='test_date_idx'),
+            models.Index(fields=['batch', 'test_date'], name='test_batch_date_idx'),
+            models.Index(fields=['sku', 'test_date'], name='test_sku_date_idx'),
+            models.Index(fields=['template_used', 'test_date'], name='test_template_date_idx'),
+            # Status counts over a date range, from the index alone
+            models.Index(fields=['overall_status', 'test_date'], name='test_status_date_idx'),
+            # Latest test of a unit (with_latest_test), and of every unit of a batch (latest_tests)
+            models.Index(fields=['barcode', 'test_date', 'id'], name='test_barcode_latest_idx'),
+            models.Index(fields=['batch', 'barcode'], name='test_batch_barcode_idx'),
+        ]
+
     def __str__(self):
         return f"Test {self.id} - {self.barcode.sequence_number} ({self.overall_status})"
 
+    def save(self, *args, **kwargs):
+        # Keep the DailyTestCount rollup in step: the test moves from the count
+        # it was in (if any) to the one it is in now
+        with transaction.atomic():
+            previous = None if self.pk is None else Test.objects.filter(pk=self.pk).values(
+                'test_date', 'sku_id', 'batch_id', 'template_used_id', 'overall_status',
+            ).first()
+            super().save(*args, **kwargs)
+            current = DailyTestCount.key(self)
+            if previous:
+                previous = DailyTestCount.key(Test(**previous))
+            if previous != current:
+                if previous:
+                    DailyTestCount.add(previous, -1)
+                DailyTestCount.add(current, 1)
+
+
+def latest_tests(tests):
+    """The latest test of each unit among `tests` (a Test queryset), as one subquery."""
+    return Test.objects.filter(pk__in=tests.order_by().values('barcode').annotate(latest=Max('id')).values('latest'))
+
+
+def attach_batch_progress(batches):
+    """
+    Set tested/passed/failed/untested unit counts on each of `batches`, from
+    one grouped query over the latest test of each unit: a retested unit
+    counts once, by its latest result. Units not tested yet are the rest of
+    the batch's quantity.
+    """
+    rows = latest_tests(Test.objects.filter(batch__in=[batch.id for batch in batches])).order_by().values(
+        'batch',
+    ).annotate(
+        tested=Count('id'),
+        passed=Count('id', filter=Q(overall_status='passed')),
+        failed=Count('id', filter=Q(overall_status='failed')),
+    )
+    progress = {row['batch']: row for row in rows}
+    for batch in batches:
+        row = progress.get(batch.id, {})
+        batch.tested = row.get('tested', 0)
+        batch.passed = row.get('passed', 0)
+        batch.failed = row.get('failed', 0)
+        batch.untested = max(batch.quantity - batch.tested, 0)
+    return batches
+
+class DailyTestCount(models.Model):
+    """
+    Rollup of Test: how many tests of each SKU, batch and template ended up
+    in each status on each day. Test.save and test_deleted keep it current
+    as tests are recorded, re-graded and deleted; rebuild() recounts it from
+    the Test table.
+    """
+    day = models.DateField()
+    sku = models.ForeignKey(SKU, on_delete=models.CASCADE)
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE)
+    template_used = models.ForeignKey(TestTemplate, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Test.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'sku', 'batch', 'template_used', 'status'],
+                                    name='daily_test_count_key'),
+        ]
+        indexes = [
+            models.Index(fields=['batch', 'day'], name='daily_count_batch_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.sku_id}/{self.batch_id}/{self.template_used_id} {self.status}: {self.count}"
+
+    @staticmethod
+    def key(test):
+        """The rollup row a test is counted in, as field values."""
+        return {
+            'day': timezone.localdate(test.test_date),
+            'sku_id': test.sku_id,
+            'batch_id': test.batch_id,
+            'template_used_id': test.template_used_id,
+            'status': test.overall_status,
+        }
+
+    @classmethod
+    def add(cls, key, delta):
+        # One row per key, but a deleted template can leave several with
+        # template_used = NULL; only ever change the first
+        row = cls.objects.filter(pk=Subquery(cls.objects.filter(**key).order_by('pk').values('pk')[:1]))
+        if row.update(count=F('count') + delta) or delta < 0:
+            # No row to take a test off: it went with its batch or SKU
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(count=delta, **key)
+        except IntegrityError:
+            row.update(count=F('count') + delta)  # another request created it first
+
+    @staticmethod
+    def totals(rows):
+        """Total, passed, failed and pending tests over a DailyTestCount queryset."""
+        return rows.aggregate(
+            total=Coalesce(Sum('count'), 0),
+            passed=Coalesce(Sum('count', filter=Q(status='passed')), 0),
+            failed=Coalesce(Sum('count', filter=Q(status='failed')), 0),
+            pending=Coalesce(Sum('count', filter=Q(status='pending')), 0),
+        )
+
+    @classmethod
+    def rebuild(cls):
+        """Recount every row from the Test table; returns the number of rows."""
+        rows = Test.objects.order_by().values(
+            'sku_id', 'batch_id', 'template_used_id', 'overall_status', day=TruncDate('test_date'),
+        ).annotate(tests=Count('id'))
+        with transaction.atomic():
+            cls.objects.all().delete()
+            created = 0
+            rows = iter(rows.iterator(chunk_size=settings.BARCODE_BULK_BATCH_SIZE))
+            while chunk := [
+                cls(day=row['day'], sku_id=row['sku_id'], batch_id=row['batch_id'],
+                    template_used_id=row['template_used_id'], status=row['overall_status'], count=row['tests'])
+                for row in islice(rows, settings.BARCODE_BULK_BATCH_SIZE)
+            ]:
+                cls.objects.bulk_create(chunk)
+                created += len(chunk)
+        return created
+
+
+@receiver(post_delete, sender=Test)
+def test_deleted(sender, instance, **kwargs):
+    """Take a deleted test (on its own or in a cascade) off its DailyTestCount row."""
+    DailyTestCount.add(DailyTestCount.key(instance), -1)
+
+
 class TestAnswer(models.Model):
     test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='answers')
     question = models.ForeignKey(TestQuestion, on_delete=models.CASCADE)
@@ -0,0 +1,109 @@
+"""
+Keyset (cursor) pagination. A page of a queryset ordered by (field, id) is
+fetched with a WHERE on the last row of the previous page instead of an
+OFFSET, so a page deep in a long history costs the same as the first one
+and only the page's rows are loaded.
+"""
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+def encode_cursor(field, row):
+    """The KeysetPage cursor of `row` in an ordering by `field` then id."""
+    return urlsafe_base64_encode(json.dumps([field.value_to_string(row), row.pk]).encode())
+
+
+class KeysetPage:
+    """
+    The page of `queryset` after ?after= (or before ?before=) in request.GET,
+    ordered by `field` then id, descending unless descending=False. Iterate
+    it for the rows; next_cursor and previous_cursor are the values of the
+    ?after= and ?before= links. A missing or malformed cursor gives the
+    first page.
+    """
+    def __init__(self, queryset, request, field, per_page, descending=True):
+        self.field = queryset.model._meta.get_field(field)
+        after = self._decode(request.GET.get('after'))
+        before = None if after else self._decode(request.GET.get('before'))
+        cursor = after or before
+
+        # Going back a page walks the ordering in reverse from the cursor
+        forward = before is None
+        lookup, sign = ('lt', '-') if forward == descending else ('gt', '')
+        rows = queryset.order_by(f"{sign}{self.field.name}", f"{sign}id")
+        if cursor:
+            value, pk = cursor
+            rows = rows.filter(Q(**{f"{self.field.name}__{lookup}": value})
+                               | Q(**{self.field.name: value, f"id__{lookup}": pk}))
+        rows = list(rows[:per_page + 1])
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+
+        if forward:
+            self.object_list = rows
+            self.has_next, self.has_previous = more, cursor is not None
+        else:
+            self.object_list = rows[::-1]
+            self.has_next, self.has_previous = True, more
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        return self._encode(self.object_list[-1]) if self.has_next and self.object_list else None
+
+    @property
+    def previous_cursor(self):
+        return self._encode(self.object_list[0]) if self.has_previous and self.object_list else None
+
+    def _encode(self, row):
+        return encode_cursor(self.field, row)
+
+    def _decode(self, cursor):
+        if not cursor:
+            return None
+        try:
+            value, pk = json.loads(urlsafe_base64_decode(cursor))
+            return self.field.to_python(value), int(pk)
+        except (ValueError, TypeError, ValidationError):
+            return None
+
+
+class RangePage:
+    """
+    KeysetPage for a BarcodeRange: the cursors are sequence numbers, located
+    by their position in the range, so a page costs the same wherever it is.
+    """
+    def __init__(self, units, request, per_page):
+        after = units.index(request.GET.get('after', ''))
+        before = None if after is not None else units.index(request.GET.get('before', ''))
+        if after is not None:
+            start, stop = after + 1, after + 1 + per_page
+        elif before is not None:
+            start, stop = max(before - per_page, 0), before
+        else:
+            start, stop = 0, per_page
+        self.object_list = units[start:stop]
+        self.has_previous = start > 0
+        self.has_next = start + len(self.object_list) < len(units)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        return self.object_list[-1].sequence_number if self.has_next and self.object_list else None
+
+    @property
+    def previous_cursor(self):
+        return self.object_list[0].sequence_number if self.has_previous and self.object_list else None
@@ -0,0 +1,563 @@
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import unquote, urlsplit
+
+import pydyf
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import ImproperlyConfigured
+from django.template.loader import get_template
+from django.urls import Resolver404, resolve
+from django.utils._os import safe_join
+
+from .barcode_images import RENDER_VERSION, attach_label_images, image_cache, render_svg
+
+logger = logging.getLogger(__name__)
+
+
+class LocalURLFetcher:
+    """
+    WeasyPrint url_fetcher that answers this app's own URLs in-process:
+    /media/ and /static/ files from disk, /barcode-img/ and /barcode-svg/
+    from the barcode renderer. Anything else (other hosts, data: URIs) goes
+    to WeasyPrint's default fetcher. `counts` tallies what each PDF fetched.
+    """
+    def __init__(self, base_url):
+        # URLs on the same host as the page's base_url are ours
+        self.host = urlsplit(base_url).netloc
+        self.counts = Counter()
+
+    def __call__(self, url, *args, **kwargs):
+        parts = urlsplit(url)
+        if parts.scheme in ('http', 'https') and parts.netloc == self.host:
+            result = self._local(unquote(parts.path))
+            if result is not None:
+                result['redirected_url'] = url
+                return result
+
+        self.counts['data' if parts.scheme == 'data' else 'remote'] += 1
+        from weasyprint import default_url_fetcher
+        return default_url_fetcher(url, *args, **kwargs)
+
+    def _local(self, path):
+        if path.startswith(settings.MEDIA_URL):
+            self.counts['media'] += 1
+            return self._file(safe_join(settings.MEDIA_ROOT, path[len(settings.MEDIA_URL):]))
+
+        if path.startswith(settings.STATIC_URL):
+            self.counts['static'] += 1
+            found = finders.find(path[len(settings.STATIC_URL):])
+            if not found:
+                raise FileNotFoundError(path)
+            return self._file(found)
+
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return None
+        if match.url_name == 'barcode_image':
+            self.counts['barcode'] += 1
+            return {'string': image_cache.get(match.kwargs['sequence_number']), 'mime_type': 'image/png'}
+        if match.url_name == 'barcode_svg':
+            self.counts['barcode'] += 1
+            return {'string': render_svg(match.kwargs['sequence_number']).encode(), 'mime_type': 'image/svg+xml'}
+        return None
+
+    def _file(self, filename):
+        with open(filename, 'rb') as f:
+            content = f.read()
+        mime_type, _ = mimetypes.guess_type(os.path.basename(filename))
+        return {'string': content, 'mime_type': mime_type or 'application/octet-stream'}
+
+
+def pdf_options(optimize):
+    """WeasyPrint options of a PDF: the defaults, or PDF_OPTIMIZE_OPTIONS for a size-optimised one."""
+    return settings.PDF_OPTIMIZE_OPTIONS if optimize else {}
+
+
+def write_pdf(html_content, base_url, what, stylesheet, options=None):
+    """
+    Render html_content, styled by the stylesheet template of that name, to
+    PDF bytes (options are passed to WeasyPrint). With PDF_RENDER_POOL the
+    render is handed to the warm renderer processes; otherwise this thread's
+    own Renderer does it.
+    """
+    if settings.PDF_RENDER_POOL:
+        try:
+            return _get_pdf_pool().submit(_render, html_content, base_url, stylesheet, what, options).result()
+        except BrokenProcessPool:
+            logger.exception("PDF render pool broke; rendering %s in-process", what)
+            _reset_pdf_pool()
+    return _render(html_content, base_url, stylesheet, what, options)
+
+
+def submit_pdf(html_content, base_url, what, stylesheet, options=None):
+    """Like write_pdf, but returns a Future of the PDF so several can render at once."""
+    if settings.PDF_RENDER_POOL:
+        try:
+            return _get_pdf_pool().submit(_render, html_content, base_url, stylesheet, what, options)
+        except BrokenProcessPool:
+            logger.exception("PDF render pool broke; rendering %s in-process", what)
+            _reset_pdf_pool()
+    future = Future()
+    try:
+        future.set_result(_render(html_content, base_url, stylesheet, what, options))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _render(html_content, base_url, stylesheet, what, options=None):
+    """Pool task (and in-process fallback): one whole PDF from the current Renderer."""
+    return get_renderer().render(html_content, base_url, stylesheet, what, options)
+
+
+class AssetImages(dict):
+    """
+    WeasyPrint image cache that is kept from one document to the next for
+    the app's own static and media files (the report header and footer).
+    Their keys are reduced to the URL path, so every host name the app is
+    reached by shares one decoded image. prune() drops everything else
+    (barcodes, remote images) once a document is written.
+    """
+    def _key(self, key):
+        parts = urlsplit(key)
+        if parts.scheme in ('http', 'https') and _is_asset(unquote(parts.path)):
+            return unquote(parts.path)
+        return key
+
+    def __contains__(self, key):
+        return super().__contains__(self._key(key))
+
+    def __getitem__(self, key):
+        return super().__getitem__(self._key(key))
+
+    def __setitem__(self, key, value):
+        super().__setitem__(self._key(key), value)
+
+    def prune(self):
+        """
+        Drop all but the asset images once a document is written. This relies
+        on how WeasyPrint (pinned to 66.0 in requirements.txt) fills its cache:
+        images under their URL, and a raster image's encoded data under
+        "<image id>-<slot>-<dpi>". A key of any other shape means that changed,
+        so the whole cache is cleared rather than guessed at.
+        """
+        images = {key: image for key, image in self.items()
+                  if isinstance(key, str) and (image is None or hasattr(image, 'id'))}
+        image_ids = {image.id for image in images.values() if image is not None}
+        unexpected = [key for key in self if key not in images
+                      and not (isinstance(key, str) and key.count('-') >= 2 and key.rsplit('-', 2)[0] in image_ids)]
+        if unexpected:
+            logger.warning("Unexpected WeasyPrint image cache keys %r; clearing the cache instead of keeping "
+                           "the asset images", unexpected[:3])
+            self.clear()
+            return
+        assets = {image.id for key, image in images.items() if key.startswith('/') and image is not None}
+        for key in list(self):
+            if key in images:
+                drop = images[key] is None or not key.startswith('/')
+            else:
+                drop = key.rsplit('-', 2)[0] not in assets
+            if drop:
+                del self[key]
+
+
+def _is_asset(path):
+    if path.startswith(settings.STATIC_URL):
+        return True
+    # Label images live under MEDIA_ROOT too, but each is only drawn once
+    barcodes = os.path.relpath(settings.BARCODE_IMAGE_DIR, settings.MEDIA_ROOT)
+    return path.startswith(settings.MEDIA_URL) and not path[len(settings.MEDIA_URL):].startswith(f"{barcodes}/")
+
+
+class Renderer:
+    """
+    The WeasyPrint state every PDF of the app can share: one FontConfiguration
+    (fontconfig and Pango set-up), the PDF stylesheets compiled once, and the
+    decoded images of the app's own assets (per set of options, as images
+    are decoded for given options). WeasyPrint rebuilds all of these for each
+    document unless given them, so each process (or thread) keeps one
+    Renderer for its lifetime; see get_renderer().
+    """
+    def __init__(self):
+        from weasyprint.text.fonts import FontConfiguration
+
+        self.font_config = FontConfiguration()
+        self.images = {}
+        self.stylesheets = {}
+        self.renders = 0
+
+    def stylesheet(self, name):
+        """The compiled stylesheet template `name`, recompiled if its source changes."""
+        from weasyprint import CSS
+
+        source = get_template(name).template.source
+        compiled = self.stylesheets.get(name)
+        if compiled is None or compiled[0] != source:
+            compiled = self.stylesheets[name] = (source, CSS(string=source, font_config=self.font_config))
+        return compiled[1]
+
+    def render(self, html_content, base_url, stylesheet, what, options=None, finisher=None):
+        from weasyprint import HTML
+
+        options = options or {}
+        images = self.images.setdefault(tuple(sorted(options.items())), AssetImages())
+        fetcher = LocalURLFetcher(base_url)
+        started = time.perf_counter()
+        pdf = None
+        try:
+            pdf = HTML(string=html_content, base_url=base_url, url_fetcher=fetcher).write_pdf(
+                stylesheets=[self.stylesheet(stylesheet)],
+                font_config=self.font_config,
+                cache=images,
+                finisher=finisher,
+                **options,
+            )
+            return pdf
+        finally:
+            images.prune()
+            logger.info("%s rendered in %.3f s by a %s renderer%s, fetched %s",
+                        what, time.perf_counter() - started, 'warm' if self.renders else 'cold',
+                        f", {len(pdf)} bytes" if pdf else "", dict(fetcher.counts) or "no resources")
+            self.renders += 1
+
+    def warm_up(self):
+        """Compile the stylesheets, load the fonts and decode the report images ahead of the first real render."""
+        images = ''.join(f'<img src="{settings.MEDIA_URL}{name}">' for name in REPORT_ASSETS)
+        for stylesheet in (REPORT_STYLESHEET, LABEL_PDF_STYLESHEET):
+            self.render(f"<p>{settings.PRODUCT_NAME} 0123456789</p>{images}", 'http://localhost/', stylesheet,
+                        "Renderer warm-up")
+
+
+_renderers = threading.local()
+
+
+def get_renderer():
+    """This thread's Renderer (WeasyPrint objects are not thread-safe), built on first use."""
+    renderer = getattr(_renderers, 'renderer', None)
+    if renderer is None:
+        renderer = _renderers.renderer = Renderer()
+    return renderer
+
+
+LABEL_PDF_TEMPLATE = 'inventory/print_barcodes_pdf.html'
+LABEL_PDF_STYLESHEET = 'inventory/print_barcodes_pdf.css'
+
+
+def labels_per_page():
+    """
+    Labels per page of the label sheet, from the sizes in its stylesheet:
+    as many rows of two .label boxes, with the .label-row gap between them,
+    as fit the @page height. The template starts a new page after this many,
+    so chunks of whole pages merge into exactly the document a single render
+    would give. Raises ImproperlyConfigured if the stylesheet stops giving
+    those sizes in mm.
+    """
+    source = get_template(LABEL_PDF_STYLESHEET).template.source
+    sizes = [
+        re.search(pattern, source, re.S) for pattern in (
+            r'@page\s*{[^}]*?\bsize:\s*[\d.]+mm\s+([\d.]+)mm\s*;',
+            r'\.label\s*{[^}]*?\bheight:\s*([\d.]+)mm',
+            r'\.label-row\s*{[^}]*?\bmargin-bottom:\s*([\d.]+)mm',
+        )
+    ]
+    if not all(sizes):
+        raise ImproperlyConfigured(
+            f"{LABEL_PDF_STYLESHEET} must set the @page size, .label height and .label-row margin-bottom in mm"
+        )
+    page_height, label_height, gap = (float(size.group(1)) for size in sizes)
+    rows = int((page_height + gap) // (label_height + gap))
+    if rows < 1:
+        raise ImproperlyConfigured(f"{LABEL_PDF_STYLESHEET}: a .label is taller than the page")
+    return rows * 2
+
+
+def label_pdf_key(batch, barcode_format, optimize=False):
+    """
+    Hash of everything a batch's label PDF depends on: the batch's fields,
+    its materialised units, the barcode format and renderer, the template,
+    and the size-optimisation options if optimised.
+    """
+    parts = [
+        RENDER_VERSION, barcode_format, get_template(LABEL_PDF_TEMPLATE).template.source,
+        get_template(LABEL_PDF_STYLESHEET).template.source,
+        [getattr(batch, field.attname) for field in batch._meta.concrete_fields],
+        # A batch whose rows are still being inserted gets a new key once they are in
+        None if batch.virtual_barcodes else batch.barcode_set.count(),
+    ]
+    if optimize:
+        parts.append(pdf_options(optimize))
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+def render_label_pdf(batch, barcode_format, base_url, optimize=False):
+    barcodes = attach_label_images(batch.units(), barcode_format)
+    what = f"Label PDF for batch {batch.id}"
+    options = pdf_options(optimize)
+    workers = pdf_workers()
+    if workers > 1 and len(barcodes) >= settings.LABEL_PDF_CHUNK_THRESHOLD:
+        return write_label_pdf(batch, barcodes, barcode_format, base_url, what, _get_pdf_pool(), workers, options)
+    return write_label_pdf(batch, barcodes, barcode_format, base_url, what, options=options)
+
+
+def write_label_pdf(batch, barcodes, barcode_format, base_url, what, pool=None, workers=1, options=None):
+    """
+    The label sheet of barcodes (with label images attached) as one PDF. With
+    a pool, the sheet is split into chunks of whole pages that are laid out
+    in parallel by the pool's processes and merged; without, it is one render.
+    """
+    template = get_template(LABEL_PDF_TEMPLATE)
+
+    def html(chunk):
+        return template.render({
+            'barcodes': chunk,
+            'batch': batch,
+            'barcode_format': barcode_format,
+            'labels_per_page': labels_per_page(),
+        })
+
+    if pool is None:
+        return write_pdf(html(barcodes), base_url, what, LABEL_PDF_STYLESHEET, options)
+
+    # Layout time grows faster than the page count, so chunks stay at most
+    # LABEL_PDF_CHUNK_SIZE labels even when that gives more chunks than workers
+    per_chunk = min(settings.LABEL_PDF_CHUNK_SIZE, -(-len(barcodes) // workers))
+    per_page = labels_per_page()
+    per_chunk = max(1, -(-per_chunk // per_page)) * per_page
+    chunks = [html(barcodes[start:start + per_chunk]) for start in range(0, len(barcodes), per_chunk)]
+    try:
+        parts = list(pool.map(
+            _layout_chunk, chunks, [base_url] * len(chunks),
+            [f"{what}, chunk {index + 1}/{len(chunks)}" for index in range(len(chunks))],
+            [options] * len(chunks),
+        ))
+    except BrokenProcessPool:
+        logger.exception("PDF render pool broke; rendering %s in-process", what)
+        _reset_pdf_pool()
+        return get_renderer().render(html(barcodes), base_url, LABEL_PDF_STYLESHEET, what, options)
+
+    logger.info("%s: %s chunks of %s labels", what, len(chunks), per_chunk)
+    return merge_pdf_parts(parts)
+
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def pdf_workers():
+    """Renders that can run at once: the pool's size, or 1 without the pool."""
+    if not settings.PDF_RENDER_POOL:
+        return 1
+    return settings.PDF_RENDER_WORKERS or os.cpu_count() or 1
+
+
+def _init_pdf_worker():
+    # Rendering resolves the app's own URLs, so the workers need Django
+    import django
+    django.setup()
+    try:
+        get_renderer().warm_up()
+    except Exception:
+        # The first render pays for the set-up instead
+        logger.exception("Warming up the PDF renderer failed")
+
+
+def new_pdf_pool(workers):
+    # spawn, not fork: the web process runs job threads
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_pdf_worker,
+    )
+
+
+def _get_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = new_pdf_pool(pdf_workers())
+        return _pdf_pool
+
+
+def _reset_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(wait=False, cancel_futures=True)
+        _pdf_pool = None
+
+
+class _Captured(Exception):
+    """Raised by the finisher of a chunk render once its objects are captured."""
+
+
+def _layout_chunk(html_content, base_url, what, options=None):
+    """Pool task: lay out one chunk of a label sheet and return it as a PDFPart."""
+    parts = []
+
+    def capture(document, pdf):
+        parts.append(PDFPart(pdf))
+        # The parent writes the merged file; don't serialise this one too
+        raise _Captured
+
+    try:
+        get_renderer().render(html_content, base_url, LABEL_PDF_STYLESHEET, what, options, finisher=capture)
+    except _Captured:
+        pass
+    return parts[0]
+
+
+class PDFPart:
+    """
+    The objects of one chunk's pydyf document, serialised so they can leave
+    the worker process (WeasyPrint's own objects hold cffi handles). Page
+    content is compressed here, in parallel, and copied as-is by the merge.
+    """
+    def __init__(self, pdf):
+        skip = {id(pdf.pages), id(pdf.catalog)}
+        self.objects = [
+            (obj.number, obj.data, isinstance(obj, pydyf.Stream))
+            for obj in pdf.objects if obj.free != 'f' and id(obj) not in skip
+        ]
+        self.pages_number = pdf.pages.number
+        self.catalog_number = pdf.catalog.number
+        self.catalog = pdf.catalog.data
+        self.kids = pdf.pages['Kids'][::3]
+        self.info = {key: pydyf.Array([value]).data[1:-1] for key, value in pdf.info.items()}
+
+
+class RawObject(pydyf.Object):
+    """An already serialised object; streams stay out of object streams."""
+    def __init__(self, data, stream=False):
+        super().__init__()
+        self._data = data
+        self._stream = stream
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def compressible(self):
+        return not self._stream
+
+
+_REFERENCE = re.compile(rb'(?<![\d.])(\d+) 0 R\b')
+
+
+def _renumber(data, numbers, stream=False):
+    """Rewrite the object references in data; a stream's content is left alone."""
+    head, sep, body = data.partition(b'\nstream\n') if stream else (data, b'', b'')
+    return _REFERENCE.sub(lambda match: b'%d 0 R' % numbers[int(match.group(1))], head) + sep + body
+
+
+def merge_pdf_parts(parts):
+    """
+    Concatenate the pages of several PDFParts into one PDF. Objects are
+    renumbered into a single pydyf document; document-level catalog entries
+    (language, metadata) are taken from the first part.
+    """
+    merged = pydyf.PDF()
+    for index, part in enumerate(parts):
+        numbers = {part.pages_number: merged.pages.number, part.catalog_number: merged.catalog.number}
+        first = len(merged.objects)
+        numbers.update((number, first + offset) for offset, (number, _, _) in enumerate(part.objects))
+        for _, data, stream in part.objects:
+            merged.add_object(RawObject(_renumber(data, numbers, stream), stream))
+        for kid in part.kids:
+            merged.pages['Kids'].extend([numbers[kid], 0, 'R'])
+            merged.pages['Count'] += 1
+        if index == 0:
+            catalog = RawObject(_renumber(part.catalog, numbers))
+            catalog.number = merged.catalog.number
+            merged.objects[catalog.number] = merged.catalog = catalog
+            merged.info.update(part.info)
+
+    output = io.BytesIO()
+    merged.write(output, compress=True)
+    return output.getvalue()
+
+
+REPORT_TEMPLATE = 'inventory/print_test_report.html'
+REPORT_STYLESHEET = 'inventory/print_test_report.css'
+# Media files the report embeds; their size and mtime go into the cache key
+REPORT_ASSETS = ('reports/header.png', 'reports/footer.png')
+# Bump when report rendering changes in a way the key doesn't capture
+REPORT_RENDER_VERSION = 1
+
+
+class ReportCache:
+    """
+    Rendered test-report PDFs on disk, one directory per test
+    (<dir>/<test_id>/<key>.pdf, size-optimised ones in <dir>/<test_id>/optimized/).
+    The key covers the test's updated_at and the versions of the report
+    template and its images, so a stale entry is never served; invalidate()
+    drops a test's entries once it has been edited.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def key(self, test, optimize=False):
+        """Content address of test's current report; also used as its ETag."""
+        parts = [
+            REPORT_RENDER_VERSION, test.id, test.updated_at.isoformat(),
+            get_template(REPORT_TEMPLATE).template.source, get_template(REPORT_STYLESHEET).template.source,
+        ]
+        for name in REPORT_ASSETS:
+            try:
+                stat = os.stat(os.path.join(settings.MEDIA_ROOT, name))
+                parts.append([name, stat.st_size, stat.st_mtime_ns])
+            except FileNotFoundError:
+                parts.append([name, None])
+        if optimize:
+            parts.append(pdf_options(optimize))
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def get(self, test_id, key, optimize=False):
+        try:
+            with open(self._path(test_id, key, optimize), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, test_id, key, pdf, optimize=False):
+        path = self._path(test_id, key, optimize)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(pdf)
+        os.replace(tmp_path, path)
+        # Older versions of this report can never be asked for again
+        for name in os.listdir(os.path.dirname(path)):
+            if name.endswith('.pdf') and name != os.path.basename(path):
+                self._remove(os.path.join(os.path.dirname(path), name))
+
+    def invalidate(self, test_id):
+        shutil.rmtree(os.path.join(self.directory, str(test_id)), ignore_errors=True)
+
+    def _path(self, test_id, key, optimize=False):
+        return os.path.join(self.directory, str(test_id), 'optimized' if optimize else '', f"{key}.pdf")
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+report_cache = ReportCache(settings.REPORT_PDF_DIR)
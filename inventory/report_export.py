@@ -0,0 +1,112 @@
+"""
+Bulk export of test reports as one ZIP archive, streamed to the client as
+it is built.
+"""
+import io
+import logging
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from .pdf import REPORT_STYLESHEET, pdf_options, pdf_workers, report_cache, submit_pdf
+
+logger = logging.getLogger(__name__)
+
+# Reports rendering at once, per render worker: enough to keep every worker
+# busy while finished ones are written out, few enough to bound memory
+IN_FLIGHT_PER_WORKER = 2
+
+
+class _ZipStream(io.RawIOBase):
+    """Write-only, unseekable file; zipfile writes into it and take() empties it."""
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def take(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+class ReportExport:
+    """
+    Iterate to get the ZIP archive of the PDF reports of `tests`, chunk by
+    chunk. Reports still in the report cache are copied from it; the others
+    are rendered on the PDF render pool, a few per worker at a time, and each
+    goes into the archive as soon as it is done, so memory holds only the
+    reports in flight. report_html(test) gives a report's (html, base_url);
+    with optimize, the reports are the size-optimised ones. Reports that fail
+    to render are listed in errors.txt in the archive.
+    """
+    def __init__(self, tests, report_html, optimize=False):
+        self.tests = tests
+        self.report_html = report_html
+        self.optimize = optimize
+        self.stream = _ZipStream()
+        self.archive = zipfile.ZipFile(self.stream, 'w', zipfile.ZIP_STORED)  # PDFs are compressed already
+        self.pending = {}
+        self.cached = self.rendered = 0
+        self.failed = []
+
+    def __iter__(self):
+        started = time.perf_counter()
+        window = IN_FLIGHT_PER_WORKER * pdf_workers()
+        try:
+            for test in self.tests:
+                key = report_cache.key(test, self.optimize)
+                pdf = report_cache.get(test.id, key, self.optimize)
+                if pdf is not None:
+                    self.cached += 1
+                    self._add(test, pdf)
+                    yield self.stream.take()
+                    continue
+
+                html_content, base_url = self.report_html(test)
+                future = submit_pdf(html_content, base_url, f"Test report {test.id}", REPORT_STYLESHEET,
+                                    pdf_options(self.optimize))
+                self.pending[future] = (test, key)
+                while len(self.pending) >= window:
+                    yield from self._finish(wait(self.pending, return_when=FIRST_COMPLETED).done)
+            while self.pending:
+                yield from self._finish(wait(self.pending, return_when=FIRST_COMPLETED).done)
+
+            if self.failed:
+                self.archive.writestr('errors.txt', ''.join(f"{line}\n" for line in self.failed))
+            self.archive.close()
+            yield self.stream.take()
+        finally:
+            # The client may go away mid-download; don't render for no one
+            for future in self.pending:
+                future.cancel()
+            elapsed = time.perf_counter() - started
+            exported = self.cached + self.rendered
+            logger.info("Exported %s test reports (%s rendered, %s cached, %s failed) in %.1f s: %.0f reports/min",
+                        exported, self.rendered, self.cached, len(self.failed), elapsed,
+                        exported / elapsed * 60 if elapsed else 0)
+
+    def _finish(self, done):
+        for future in done:
+            test, key = self.pending.pop(future)
+            try:
+                pdf = future.result()
+            except Exception as e:
+                logger.error("Exporting the report of test %s failed: %s", test.id, e, exc_info=True)
+                self.failed.append(f"{self._name(test)}: {e}")
+                continue
+            report_cache.put(test.id, key, pdf, self.optimize)
+            self.rendered += 1
+            self._add(test, pdf)
+            yield self.stream.take()
+
+    def _add(self, test, pdf):
+        self.archive.writestr(self._name(test), pdf)
+
+    def _name(self, test):
+        return f"test_report_{test.barcode.sequence_number}_{test.id}.pdf"
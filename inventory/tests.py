@@ -1,3 +1,1093 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+from concurrent.futures import Future
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import ImproperlyConfigured
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode
+from django.urls import reverse
+
+from .models import (
+    SKU, Barcode, BarcodeBlock, BarcodeRange, BarcodeSequence, Batch, BatchJob, CustomUser, DailyTestCount,
+    LabelPDFJob, Test, TestTemplate, allocate_suffixes, attach_batch_progress, block_allocator, decode_suffix,
+    encode_suffix, increment_suffix, is_valid_suffix, iter_sequence_numbers, requeue_job,
+)
+from . import barcode_search, code128
+from .barcode_images import IMAGE_OPTIONS, BarcodeImageCache, image_key, render_png
+from .pagination import KeysetPage, RangePage
+from .pdf import (
+    REPORT_ASSETS, REPORT_STYLESHEET, REPORT_TEMPLATE, AssetImages, ReportCache, labels_per_page, pdf_workers,
+    report_cache,
+)
+from .report_export import ReportExport
+
+
+class SuffixTests(TestCase):
+    def test_known_values(self):
+        for suffix, index in [('A001', 0), ('A999', 998), ('B001', 999), ('Z999', 25973),
+                              ('AA001', 25974), ('AZ999', 51947), ('BA001', 51948), ('ZZ999', 701297),
+                              ('AAA001', 701298)]:
+            with self.subTest(suffix=suffix):
+                self.assertEqual(decode_suffix(suffix), index)
+                self.assertEqual(encode_suffix(index), suffix)
+
+    def test_round_trip_and_increment(self):
+        suffix = 'A001'
+        for index in list(range(0, 30000)) + list(range(701000, 702500)):
+            if index == 701000:
+                suffix = encode_suffix(index)
+            self.assertEqual(encode_suffix(index), suffix)
+            self.assertEqual(decode_suffix(suffix), index)
+            self.assertTrue(is_valid_suffix(suffix))
+            suffix = increment_suffix(suffix)
+
+    def test_iter_sequence_numbers(self):
+        for start, count in [(0, 0), (0, 5), (995, 10), (25970, 10), (998, 999 * 3 + 2)]:
+            with self.subTest(start=start, count=count):
+                self.assertEqual(list(iter_sequence_numbers('PX', start, count)),
+                                 ['PX' + encode_suffix(index) for index in range(start, start + count)])
+
+    def test_invalid_suffixes(self):
+        for suffix in ['001', 'A000', 'a001', 'A01', 'A0011', 'Ä001', 'A00x', '']:
+            with self.subTest(suffix=suffix):
+                self.assertFalse(is_valid_suffix(suffix))
+
+
+class AllocationTests(TestCase):
+    def test_consecutive_ranges(self):
+        self.assertEqual(BarcodeSequence.allocate('AL', 5), 0)
+        self.assertEqual(BarcodeSequence.allocate('AL', 0), 5)
+        self.assertEqual(BarcodeSequence.allocate('AL', 3), 5)
+        self.assertEqual(BarcodeSequence.allocate('OTHER', 1), 0)
+        self.assertEqual(BarcodeSequence.objects.get(prefix='AL').last_suffix, 'A008')
+
+    def test_seeded_from_existing_barcodes(self):
+        # Codes issued before the counter table existed
+        sku = SKU.objects.create(code='SD')
+        batch = Batch.objects.create(sku=sku, quantity=1)
+        Barcode.objects.filter(batch=batch).update(sequence_number='SDB017')
+        BarcodeSequence.objects.filter(prefix='SD').delete()
+        self.assertEqual(BarcodeSequence.allocate('SD', 1), decode_suffix('B018'))
+
+    def test_rolled_back_allocation_is_reused(self):
+        BarcodeSequence.allocate('RB', 2)
+        try:
+            with transaction.atomic():
+                BarcodeSequence.allocate('RB', 10)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(BarcodeSequence.allocate('RB', 1), 2)
+
+    def test_batches_get_disjoint_ranges(self):
+        sku = SKU.objects.create(code='DJ')
+        batches = [Batch.objects.create(sku=sku, quantity=quantity, virtual_barcodes=quantity > 500)
+                   for quantity in (3, 999, 1, 2000)]
+        self.assertEqual([(batch.seq_start, batch.seq_end) for batch in batches],
+                         [(0, 3), (3, 1002), (1002, 1003), (1003, 3003)])
+        self.assertEqual(Barcode.objects.filter(sku=sku).count(), 4)
+
+    @override_settings(BARCODE_BLOCK_SIZE=100)
+    def test_leased_blocks(self):
+        try:
+            ranges = [(allocate_suffixes('BL', count), count) for count in (10, 80, 20, 150, 5)]
+        finally:
+            block_allocator.release_all()
+        self.assertEqual([first for first, count in ranges], [0, 10, 100, 200, 350])
+        self.assertEqual(BarcodeSequence.objects.get(prefix='BL').last_suffix, 'A450')
+        # The tails left in released blocks stay recorded
+        self.assertEqual(sorted(block.unused for block in BarcodeBlock.objects.filter(prefix='BL')), [0, 10, 80, 95])
+
+    @override_settings(BARCODE_BLOCK_SIZE=100)
+    def test_rolled_back_allocation_from_a_block_is_reused(self):
+        try:
+            self.assertEqual(allocate_suffixes('GP', 10), 0)
+            try:
+                with transaction.atomic():
+                    self.assertEqual(allocate_suffixes('GP', 20), 10)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            self.assertEqual(allocate_suffixes('GP', 5), 10)
+        finally:
+            block_allocator.release_all()
+        block = BarcodeBlock.objects.get(prefix='GP')
+        self.assertEqual((block.next_index, block.unused), (15, 85))
+
+
+# One allocating process of ConcurrentAllocationTests: argv is the database
+# name, prefix, rounds, block size (0 = straight from the counter) and seed;
+# prints the (first index, count) ranges it got as JSON
+ALLOCATION_WORKER = """
+import json, random, sys
+from django.conf import settings
+name, prefix, rounds, block_size, seed = sys.argv[1], sys.argv[2], *map(int, sys.argv[3:])
+settings.DATABASES['default']['NAME'] = name
+import django
+django.setup()
+settings.BARCODE_BLOCK_SIZE = block_size
+from django.db import transaction
+from inventory.models import BlockAllocator, allocate_suffixes
+allocator = BlockAllocator()
+rng = random.Random(seed)
+ranges = []
+for _ in range(rounds):
+    count = rng.randint(1, 7)
+    with transaction.atomic():
+        first = allocator.allocate(prefix, count) if block_size else allocate_suffixes(prefix, count)
+        ranges.append((first, count))
+allocator.release_all()
+print(json.dumps(ranges))
+"""
+
+
+class ConcurrentAllocationTests(TransactionTestCase):
+    """
+    Several processes allocate suffixes for one prefix at once, against the
+    test database (SQLite or PostgreSQL); no two ranges may overlap, and
+    every leased block must record exactly what it did not hand out.
+    """
+
+    def allocate_in_processes(self, prefix, block_size, processes=4, rounds=50):
+        workers = [
+            subprocess.Popen(
+                [sys.executable, '-c', ALLOCATION_WORKER, str(connection.settings_dict['NAME']), prefix,
+                 str(rounds), str(block_size), str(seed)],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=settings.BASE_DIR,
+            )
+            for seed in range(processes)
+        ]
+        ranges = []
+        for worker in workers:
+            out, err = worker.communicate(timeout=300)
+            self.assertEqual(worker.returncode, 0, err)
+            ranges.extend(tuple(allocated) for allocated in json.loads(out.strip().splitlines()[-1]))
+        self.assertEqual(len(ranges), processes * rounds)
+        ranges.sort()
+        for (first, count), (next_first, _) in zip(ranges, ranges[1:]):
+            self.assertLessEqual(first + count, next_first, f"overlapping ranges at suffix index {next_first}")
+        return ranges
+
+    def test_counter(self):
+        ranges = self.allocate_in_processes('MPC', block_size=0)
+        # Straight from the counter, nothing is left out
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(BarcodeSequence.allocate('MPC', 0), sum(count for _, count in ranges))
+
+    def test_leased_blocks(self):
+        ranges = self.allocate_in_processes('MPB', block_size=50)
+        blocks = list(BarcodeBlock.objects.filter(prefix='MPB').order_by('start_index'))
+        for block, next_block in zip(blocks, blocks[1:]):
+            self.assertEqual(block.end_index, next_block.start_index, "blocks are not adjacent")
+        for block in blocks:
+            self.assertIsNotNone(block.released_at)
+            issued = sum(count for first, count in ranges if block.start_index <= first < block.end_index)
+            self.assertEqual(block.start_index + issued, block.next_index, f"block {block} records a wrong tail")
+
+
+class DailyTestCountTests(TestCase):
+    """The rollup kept by Test.save and test_deleted matches a full rebuild()."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sku = SKU.objects.create(code='RT')
+        cls.batch = Batch.objects.create(sku=cls.sku, quantity=5)
+        cls.barcodes = list(Barcode.objects.filter(batch=cls.batch).order_by('sequence_number'))
+        cls.user = CustomUser.objects.create(username='tester')
+        cls.template = TestTemplate.objects.create(name='Bench')
+
+    def record(self, barcode, status='pending', template=None, batch=None):
+        return Test.objects.create(
+            sku=self.sku, batch=batch or self.batch, barcode=barcode, user=self.user,
+            template_used=template, overall_status=status,
+        )
+
+    def counts(self):
+        """The rollup as {key: count}, without rows counted down to zero."""
+        return {
+            (row.day, row.sku_id, row.batch_id, row.template_used_id, row.status): row.count
+            for row in DailyTestCount.objects.exclude(count=0)
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.counts()
+        DailyTestCount.rebuild()
+        self.assertEqual(incremental, self.counts())
+
+    def test_create(self):
+        self.record(self.barcodes[0], 'passed')
+        self.record(self.barcodes[1], 'passed', self.template)
+        self.record(self.barcodes[2], 'failed')
+        self.assertEqual(DailyTestCount.totals(DailyTestCount.objects.all()),
+                         {'total': 3, 'passed': 2, 'failed': 1, 'pending': 0})
+        self.assertMatchesRebuild()
+
+    def test_status_change(self):
+        test = self.record(self.barcodes[0])
+        test.overall_status = 'failed'
+        test.save()
+        test.overall_status = 'passed'
+        test.template_used = self.template
+        test.save()
+        self.record(self.barcodes[1], 'failed')
+        self.assertEqual(DailyTestCount.totals(DailyTestCount.objects.all()),
+                         {'total': 2, 'passed': 1, 'failed': 1, 'pending': 0})
+        self.assertMatchesRebuild()
+
+    def test_moved_to_another_day(self):
+        test = self.record(self.barcodes[0], 'passed')
+        Test.objects.filter(pk=test.pk).update(test_date=test.test_date - timedelta(days=2))
+        DailyTestCount.rebuild()
+        test.refresh_from_db()
+        test.test_date += timedelta(days=1)
+        test.save()
+        self.assertMatchesRebuild()
+
+    def test_delete(self):
+        tests = [self.record(barcode, status) for barcode, status in zip(self.barcodes, ['passed', 'failed', 'passed'])]
+        tests[0].delete()
+        Test.objects.filter(pk=tests[1].pk).delete()
+        self.assertEqual(DailyTestCount.totals(DailyTestCount.objects.all()),
+                         {'total': 1, 'passed': 1, 'failed': 0, 'pending': 0})
+        self.assertMatchesRebuild()
+
+    def test_delete_with_barcode(self):
+        self.record(self.barcodes[0], 'passed')
+        self.record(self.barcodes[1], 'failed')
+        self.barcodes[0].delete()
+        self.assertMatchesRebuild()
+
+    def test_delete_with_batch(self):
+        other = Batch.objects.create(sku=self.sku, quantity=2)
+        self.record(self.barcodes[0], 'passed')
+        for barcode in Barcode.objects.filter(batch=other):
+            self.record(barcode, 'failed', batch=other)
+        other.delete()
+        # The batch's rows go with it and are not recreated below zero
+        self.assertFalse(DailyTestCount.objects.filter(count__lt=0).exists())
+        self.assertMatchesRebuild()
+
+
+@override_settings(BARCODE_BULK_BATCH_SIZE=2)
+class BatchJobTests(TestCase):
+    def setUp(self):
+        self.batch = Batch(sku=SKU.objects.create(code='BJ'), quantity=5)
+        self.batch.save(create_barcodes=False)
+        self.job = BatchJob.objects.create(batch=self.batch, total=5)
+
+    def test_run(self):
+        self.job.run()
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.created), ('done', 5))
+        self.assertEqual(sorted(Barcode.objects.filter(batch=self.batch).values_list('sequence_number', flat=True)),
+                         sorted(self.batch.sequence_numbers()))
+
+    def test_stale_job_resumed_once(self):
+        BatchJob.objects.filter(pk=self.job.pk).update(status='running', created=0,
+                                                       updated_at=timezone.now() - timedelta(hours=1))
+        first, second = BatchJob.objects.get(pk=self.job.pk), BatchJob.objects.get(pk=self.job.pk)
+        self.assertTrue(first.is_stale)
+        self.assertTrue(requeue_job(first))
+        self.assertFalse(requeue_job(second))
+
+    def test_worker_that_lost_its_job_stops(self):
+        # The first worker stalls after reading the job; a second one resumes it and commits a chunk
+        stalled = BatchJob.objects.get(pk=self.job.pk)
+        BatchJob.objects.get(pk=self.job.pk).run()
+        BatchJob.objects.filter(pk=self.job.pk).update(status='running', created=2)
+        Barcode.objects.filter(batch=self.batch).exclude(
+            sequence_number__in=list(self.batch.sequence_numbers(0, 2))).delete()
+        stalled.run()  # does not insert the chunk again
+        self.assertEqual(Barcode.objects.filter(batch=self.batch).count(), 2)
+        BatchJob.objects.get(pk=self.job.pk).run()
+        self.assertEqual(Barcode.objects.filter(batch=self.batch).count(), 5)
+        self.assertEqual(BatchJob.objects.get(pk=self.job.pk).status, 'done')
+
+    def test_poll_requeues_a_stale_job(self):
+        BatchJob.objects.filter(pk=self.job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.client.force_login(CustomUser.objects.create(username='admin', role='admin'))
+        with mock.patch('inventory.views.enqueue_batch_job') as enqueue:
+            self.client.get(reverse('batch_job_status', args=[self.job.id]))
+            self.client.get(reverse('batch_job_status', args=[self.job.id]))
+        enqueue.assert_called_once()
+
+
+class LabelPDFAccessTests(TestCase):
+    """The label PDF views are for admins and testers only, like print_barcodes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        batch = Batch.objects.create(sku=SKU.objects.create(code='LP'), quantity=1)
+        cls.job = LabelPDFJob.objects.create(key='0' * 64, batch=batch, barcode_format='svg', base_url='/')
+        cls.urls = [
+            reverse('print_barcodes_pdf', args=[batch.id]),
+            reverse('label_pdf_job_status', args=[cls.job.id]),
+            reverse('label_pdf_download', args=[cls.job.id]),
+        ]
+
+    def test_anonymous(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 302, url)
+            self.assertIn(reverse('login'), response['Location'])
+
+    def test_service_role(self):
+        self.client.force_login(CustomUser.objects.create(username='service', role='service'))
+        for url in self.urls:
+            self.assertIn(self.client.get(url).status_code, (302, 403), url)
+        self.assertFalse(LabelPDFJob.objects.exclude(pk=self.job.pk).exists())
+
+    def test_tester(self):
+        self.client.force_login(CustomUser.objects.create(username='tester', role='tester'))
+        response = self.client.get(self.urls[1])
+        self.assertEqual(response.json()['status'], 'queued')
+
+
+class LabelPDFJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.batch = Batch.objects.create(sku=SKU.objects.create(code='LQ'), quantity=1)
+
+    def setUp(self):
+        label_pdf_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, label_pdf_dir)
+        self.enterContext(override_settings(LABEL_PDF_DIR=label_pdf_dir))
+
+    def test_submit_shares_a_live_job(self):
+        job, queued = LabelPDFJob.submit(self.batch, 'svg', '/')
+        self.assertTrue(queued)
+        self.assertEqual(LabelPDFJob.submit(self.batch, 'svg', '/'), (job, False))
+
+    def test_submit_requeues_a_stale_job(self):
+        job, _ = LabelPDFJob.submit(self.batch, 'svg', '/')
+        LabelPDFJob.objects.filter(pk=job.pk).update(status='running', updated_at=timezone.now() - timedelta(hours=1))
+        again, queued = LabelPDFJob.submit(self.batch, 'svg', '/other/')
+        self.assertEqual((again.pk, again.status, again.base_url, queued), (job.pk, 'queued', '/other/', True))
+
+    def render(self, job, render=None):
+        with mock.patch('inventory.pdf.render_label_pdf', side_effect=render or (lambda *args: b'%PDF-')) as mocked:
+            job.run()
+        return mocked
+
+    def test_run_claims_the_job(self):
+        job, _ = LabelPDFJob.submit(self.batch, 'svg', '/')
+        stalled = LabelPDFJob.objects.get(pk=job.pk)
+        self.assertEqual(self.render(job).call_count, 1)
+        # A second worker holding the job as it was queued does not render it again
+        self.assertEqual(self.render(stalled).call_count, 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.size), ('done', 5))
+        with open(job.path, 'rb') as f:
+            self.assertEqual(f.read(), b'%PDF-')
+
+    def test_worker_overtaken_during_render_discards_its_file(self):
+        job, _ = LabelPDFJob.submit(self.batch, 'svg', '/')
+
+        def requeued_meanwhile(*args):
+            self.assertTrue(requeue_job(LabelPDFJob.objects.get(pk=job.pk)))
+            return b'%PDF-'
+
+        self.render(job, requeued_meanwhile)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(os.listdir(settings.LABEL_PDF_DIR), [])
+
+    def test_superseded_sheets_kept_for_a_grace_period(self):
+        jobs = []
+        for key in 'abc':
+            job = LabelPDFJob.objects.create(key=key * 64, batch=self.batch, barcode_format='svg', base_url='/',
+                                             status='done')
+            with open(job.path, 'wb') as f:
+                f.write(b'%PDF-')
+            jobs.append(job)
+        LabelPDFJob.delete_superseded(self.batch.id, 'svg', False)
+        self.assertEqual(LabelPDFJob.objects.count(), 3)
+
+        # b replaced a two hours ago, c replaced b just now
+        now = timezone.now()
+        for job, age in zip(jobs, [3, 2, 0]):
+            LabelPDFJob.objects.filter(pk=job.pk).update(updated_at=now - timedelta(hours=age))
+        LabelPDFJob.delete_superseded(self.batch.id, 'svg', False)
+        self.assertEqual(sorted(LabelPDFJob.objects.values_list('key', flat=True)), ['b' * 64, 'c' * 64])
+        self.assertEqual(sorted(os.listdir(settings.LABEL_PDF_DIR)), [f"{'b' * 64}.pdf", f"{'c' * 64}.pdf"])
+
+    def test_poll_requeues_a_stale_job(self):
+        job, _ = LabelPDFJob.submit(self.batch, 'svg', '/')
+        LabelPDFJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.client.force_login(CustomUser.objects.create(username='tester', role='tester'))
+        with mock.patch('inventory.views.enqueue_label_pdf_job') as enqueue:
+            self.client.get(reverse('label_pdf_job_status', args=[job.id]))
+            self.client.get(reverse('label_pdf_job_status', args=[job.id]))
+        enqueue.assert_called_once()
+
+
+class ResolveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sku = SKU.objects.create(code='RS')
+        cls.rows = Batch.objects.create(sku=sku, quantity=3)
+        cls.virtual = Batch.objects.create(sku=sku, quantity=2000, virtual_barcodes=True)
+        Batch.objects.create(sku=SKU.objects.create(code='RSX'), quantity=1, virtual_barcodes=True)
+
+    def test_row_backed_unit(self):
+        barcode = Barcode.objects.filter(batch=self.rows).first()
+        self.assertEqual(Barcode.resolve(barcode.sequence_number), barcode)
+        self.assertEqual(Barcode.resolve(barcode.sequence_number, batch=self.rows), barcode)
+        self.assertIsNone(Barcode.resolve(barcode.sequence_number, batch=self.virtual))
+
+    def test_range_backed_unit_created_once(self):
+        code = list(self.virtual.sequence_numbers(1500, 1))[0]
+        self.assertEqual(Batch.for_sequence_number(code), self.virtual)
+        barcode = Barcode.resolve(code)
+        self.assertEqual((barcode.sequence_number, barcode.batch, barcode.sku_id), (code, self.virtual, self.virtual.sku_id))
+        self.assertEqual(Barcode.resolve(code, batch=self.virtual), barcode)
+        self.assertEqual(Barcode.objects.filter(batch=self.virtual).count(), 1)
+
+    def test_out_of_range(self):
+        first, last = encode_suffix(self.virtual.seq_start), encode_suffix(self.virtual.seq_end - 1)
+        for code in ['RS' + encode_suffix(self.virtual.seq_end), 'RS' + last + '0', 'RS' + first.lower(),
+                     'RSA000', 'RT' + first, 'RS', '']:
+            with self.subTest(code=code):
+                self.assertIsNone(Barcode.resolve(code))
+                self.assertIsNone(Barcode.resolve(code, batch=self.virtual))
+        # Issued, but to the row-backed batch before it
+        self.assertIsNone(Barcode.resolve('RS' + encode_suffix(self.virtual.seq_start - 1), batch=self.virtual))
+        # The longer prefix's batch is told apart from this one
+        self.assertEqual(Barcode.resolve('RSXA001').batch.sku.code, 'RSX')
+        self.assertFalse(Barcode.objects.filter(batch=self.virtual).exists())
+
+
+class BarcodeAdminSearchTests(TestCase):
+    def test_search_for_an_unused_unit_does_not_create_it(self):
+        batch = Batch.objects.create(sku=SKU.objects.create(code='AS'), quantity=3, virtual_barcodes=True)
+        code = list(batch.sequence_numbers())[1]
+        self.client.force_login(CustomUser.objects.create(username='root', is_staff=True, is_superuser=True))
+        response = self.client.get(reverse('admin:inventory_barcode_changelist'), {'q': code.lower()})
+        self.assertContains(response, 'Create its row')
+        self.assertFalse(Barcode.objects.exists())
+
+
+class BarcodeSearchIndexTests(TestCase):
+    def setUp(self):
+        self.batch = Batch.objects.create(sku=SKU.objects.create(code='SI'), quantity=0)
+        # Each test may drop the index; the rollback puts it back, so forget what was seen
+        self.addCleanup(barcode_search._installed.clear)
+
+    def codes(self, term):
+        return sorted(Barcode.objects.search(term).values_list('sequence_number', flat=True))
+
+    def uses_index(self, term):
+        return barcode_search.SEARCH_TABLE in str(Barcode.objects.search(term).query)
+
+    def test_bulk_created_rows_are_searchable(self):
+        Barcode.objects.bulk_create(Barcode(batch=self.batch, sku=self.batch.sku, sequence_number=code)
+                                    for code in ['SIQ101', 'SIQ102', 'SIR101'])
+        self.assertTrue(self.uses_index('q10'))
+        self.assertEqual(self.codes('q10'), ['SIQ101', 'SIQ102'])
+        self.assertEqual(self.codes('R10'), ['SIR101'])
+
+    def test_deleted_and_updated_rows_leave_the_index(self):
+        Barcode.objects.bulk_create(Barcode(batch=self.batch, sku=self.batch.sku, sequence_number=code)
+                                    for code in ['SIQ101', 'SIQ102'])
+        Barcode.objects.filter(sequence_number='SIQ101').delete()
+        Barcode.objects.filter(sequence_number='SIQ102').update(sequence_number='SIW202')
+        self.assertEqual(self.codes('Q10'), [])
+        self.assertEqual(self.codes('W20'), ['SIW202'])
+
+    def test_short_terms_and_wildcards_fall_back_to_icontains(self):
+        Barcode.objects.create(batch=self.batch, sku=self.batch.sku, sequence_number='SIQ1_1')
+        for term in ['Q1', '1_1']:
+            with self.subTest(term=term):
+                self.assertFalse(self.uses_index(term))
+                self.assertEqual(self.codes(term), ['SIQ1_1'])
+
+    def test_falls_back_without_the_index(self):
+        Barcode.objects.create(batch=self.batch, sku=self.batch.sku, sequence_number='SIQ101')
+        self.assertTrue(barcode_search.installed(connection))
+        barcode_search.uninstall(connection)
+        self.assertFalse(barcode_search.installed(connection))
+        self.assertFalse(self.uses_index('Q10'))
+        self.assertEqual(self.codes('Q10'), ['SIQ101'])
+
+    def test_reinstall_in_the_same_process(self):
+        barcode_search.uninstall(connection)
+        self.assertFalse(barcode_search.installed(connection))
+        # Rows saved while it was missing are picked up by the rebuild
+        Barcode.objects.create(batch=self.batch, sku=self.batch.sku, sequence_number='SIQ101')
+        barcode_search.install(connection)
+        self.assertTrue(barcode_search.installed(connection))
+        self.assertTrue(self.uses_index('Q10'))
+        self.assertEqual(self.codes('Q10'), ['SIQ101'])
+        Barcode.objects.create(batch=self.batch, sku=self.batch.sku, sequence_number='SIQ102')
+        self.assertEqual(self.codes('Q10'), ['SIQ101', 'SIQ102'])
+
+
+class SequenceNumbersStartingTests(TestCase):
+    def test_matches_filtering_the_whole_range(self):
+        # A range-backed batch crossing from the single letters into AA001
+        sku = SKU.objects.create(code='VB')
+        Batch.objects.create(sku=sku, quantity=25000, virtual_barcodes=True)
+        batch = Batch.objects.create(sku=sku, quantity=3000, virtual_barcodes=True)
+        codes = list(batch.sequence_numbers())
+        for start in ['', 'V', 'VB', 'VX', 'VBZ', 'VBZ9', 'VBZ99', 'VBZ999', 'VBZ9999', 'VBA', 'VBAA', 'VBAA0',
+                      'VBAA00', 'VBAA000', 'VBAA001', 'VBAB1', 'VBAC', 'VBA1', 'VB1', 'VBAA0A', 'VBa', 'VBZ²']:
+            with self.subTest(start=start):
+                self.assertEqual(list(batch.sequence_numbers_starting(start)),
+                                 [code for code in codes if code.startswith(start)])
+
+
+class LabelsPerPageTests(TestCase):
+    def test_from_stylesheet(self):
+        # 7 rows of two 35 mm labels, 3 mm apart, on a 297 mm page
+        self.assertEqual(labels_per_page(), 14)
+
+    def test_sizes_missing(self):
+        with mock.patch('inventory.pdf.get_template') as get_template:
+            get_template.return_value.template.source = '@page { size: 101mm auto; } .label { height: 35mm; }'
+            with self.assertRaises(ImproperlyConfigured):
+                labels_per_page()
+
+
+class AssetImagesTests(TestCase):
+    def fill(self, images):
+        logo, barcode = SimpleNamespace(id='a1'), SimpleNamespace(id='b2')
+        images['http://localhost:8000/static/logo.png'] = logo
+        images['a1-0-300'] = b'logo data'
+        images['http://localhost:8000/barcode-img/XA001/'] = barcode
+        images['b2-0-300'] = b'barcode data'
+        images['http://elsewhere/missing.png'] = None
+        return logo
+
+    def test_prune_keeps_asset_images(self):
+        images = AssetImages()
+        logo = self.fill(images)
+        images.prune()
+        self.assertEqual(dict(images), {'/static/logo.png': logo, 'a1-0-300': b'logo data'})
+        # Found again under another host name
+        self.assertIs(images['http://192.168.1.5/static/logo.png'], logo)
+
+    def test_prune_clears_unexpected_keys(self):
+        images = AssetImages()
+        self.fill(images)
+        images['a1:0:300'] = b'logo data, keyed some other way'
+        with self.assertLogs('inventory.pdf', 'WARNING'):
+            images.prune()
+        self.assertEqual(dict(images), {})
+
+
+class NewTestFormTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sku = SKU.objects.create(code='NT')
+        cls.batch = Batch.objects.create(sku=cls.sku, quantity=10, virtual_barcodes=True)
+        cls.template = TestTemplate.objects.create(name='Final')
+        cls.code = list(cls.batch.sequence_numbers(4, 1))[0]
+
+    def setUp(self):
+        self.client.force_login(CustomUser.objects.create(username='tester', role='tester'))
+
+    def post(self, **data):
+        return self.client.post(reverse('new_test'), {
+            'sku': self.sku.id, 'batch': self.batch.id, 'barcode': self.code.lower(),
+            'template': self.template.id, 'overall_status': 'passed', **data,
+        })
+
+    def test_invalid_form_creates_no_barcode(self):
+        response = self.post(overall_status='unknown')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Barcode.objects.exists())
+
+    def test_code_outside_the_range(self):
+        response = self.post(barcode=list(self.batch.sequence_numbers())[-1][:-3] + '999')
+        self.assertIn('barcode', response.context['form'].errors)
+        self.assertFalse(Barcode.objects.exists())
+
+    def test_first_test_of_a_unit_creates_its_row(self):
+        self.post()
+        barcode = Barcode.objects.get()
+        self.assertEqual((barcode.sequence_number, barcode.batch), (self.code, self.batch))
+        self.assertEqual(Test.objects.get().barcode, barcode)
+        # A retest uses the same row
+        self.post(overall_status='failed')
+        self.assertEqual((Barcode.objects.count(), Test.objects.count()), (1, 2))
+
+
+class BarcodeListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sku = SKU.objects.create(code='BL')
+        # Move the counter to just before Z999 -> AA001
+        Batch.objects.create(sku=cls.sku, quantity=decode_suffix('Z995'), virtual_barcodes=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(CustomUser.objects.create(username='tester', role='tester'))
+
+    def pages(self, batch, **params):
+        """Sequence numbers on each page, following the Next links."""
+        pages = []
+        url = reverse('barcode_list', args=[batch.id])
+        response = self.client.get(url, params)
+        while True:
+            pages.append([unit.sequence_number for unit in response.context['page_obj']])
+            cursor = response.context['page_obj'].next_cursor
+            if not cursor:
+                return pages
+            response = self.client.get(url, {**params, 'after': cursor})
+
+    def test_issue_order_across_letter_groups(self):
+        for virtual in (False, True):
+            with self.subTest(virtual=virtual):
+                batch = Batch.objects.create(sku=self.sku, quantity=12, virtual_barcodes=virtual)
+                self.assertGreater(batch.seq_end, decode_suffix('AA001'))
+                pages = self.pages(batch)
+                self.assertEqual([len(page) for page in pages], [10, 2])
+                self.assertEqual(sum(pages, []), list(batch.sequence_numbers()))
+
+    def test_count_while_the_job_inserts_rows(self):
+        batch = Batch(sku=self.sku, quantity=5)
+        batch.save(create_barcodes=False)
+        job = BatchJob.objects.create(batch=batch, total=5, status='running', created=0)
+        url = reverse('barcode_list', args=[batch.id])
+        self.assertEqual(self.client.get(url).context['unit_count'], 0)
+        # The job has committed a chunk of three
+        Barcode.objects.bulk_create(batch._barcode_rows(batch.sequence_numbers(0, 3)))
+        BatchJob.objects.filter(pk=job.pk).update(created=3)
+        self.assertEqual(self.client.get(url).context['unit_count'], 3)
+        BatchJob.objects.get(pk=job.pk).run()
+        self.assertEqual(self.client.get(url).context['unit_count'], 5)
+
+
+class KeysetPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sku = SKU.objects.create(code='KP')
+        cls.batch = Batch.objects.create(sku=cls.sku, quantity=1)
+        cls.user = CustomUser.objects.create(username='lead', role='admin')
+        barcode = Barcode.objects.get(batch=cls.batch)
+        start = timezone.now()
+        # Tests 1-5 were saved in the same instant
+        for hours in [0, 0, 0, 0, 0, 1, 2, 3]:
+            test = Test.objects.create(sku=cls.sku, batch=cls.batch, barcode=barcode, user=cls.user)
+            Test.objects.filter(pk=test.pk).update(test_date=start + timedelta(hours=hours))
+        cls.newest_first = list(Test.objects.order_by('-test_date', '-id').values_list('id', flat=True))
+
+    def page(self, **params):
+        return KeysetPage(Test.objects.all(), RequestFactory().get('/', params), 'test_date', 3)
+
+    def ids(self, page):
+        return [test.id for test in page]
+
+    def test_equal_dates_split_across_pages(self):
+        pages, page = [], self.page()
+        while True:
+            pages.append(self.ids(page))
+            if not page.next_cursor:
+                break
+            page = self.page(after=page.next_cursor)
+        self.assertEqual([len(ids) for ids in pages], [3, 3, 2])
+        self.assertEqual(sum(pages, []), self.newest_first)
+
+    def test_before_gives_the_previous_page(self):
+        first = self.page()
+        second = self.page(after=first.next_cursor)
+        third = self.page(after=second.next_cursor)
+        for page, previous in [(second, first), (third, second)]:
+            back = self.page(before=page.previous_cursor)
+            self.assertEqual(self.ids(back), self.ids(previous))
+            self.assertTrue(back.has_next)
+        self.assertFalse(self.page(before=second.previous_cursor).has_previous)
+        self.assertTrue(self.page(before=third.previous_cursor).has_previous)
+
+    def test_malformed_cursor_gives_the_first_page(self):
+        first = self.ids(self.page())
+        for cursor in ['x', '!!', urlsafe_base64_encode(b'not json'), urlsafe_base64_encode(b'["yesterday", 1]'),
+                       urlsafe_base64_encode(b'[1]'), urlsafe_base64_encode(b'["2026-01-01T00:00:00", "a"]')]:
+            for name in ('after', 'before'):
+                with self.subTest(name=name, cursor=cursor):
+                    page = self.page(**{name: cursor})
+                    self.assertEqual(self.ids(page), first)
+                    self.assertFalse(page.has_previous)
+
+    def test_links_keep_the_filters(self):
+        other = Batch.objects.create(sku=SKU.objects.create(code='KQ'), quantity=1)
+        barcode = Barcode.objects.get(batch=other)
+        Test.objects.bulk_create(Test(sku=other.sku, batch=other, barcode=barcode, user=self.user) for _ in range(55))
+        self.client.force_login(self.user)
+        url = reverse('test_results')
+        response = self.client.get(url, {'sku': 'KQ'})
+        tests = response.context['tests']
+        self.assertEqual(len(tests), 50)
+        self.assertContains(response, f'href="?sku=KQ&amp;after={tests.next_cursor}"')
+        response = self.client.get(url, {'sku': 'KQ', 'after': tests.next_cursor})
+        tests = response.context['tests']
+        self.assertEqual({test.batch_id for test in tests}, {other.id})
+        self.assertEqual(len(tests), 5)
+        self.assertContains(response, f'href="?sku=KQ&amp;before={tests.previous_cursor}"')
+
+
+class BatchProgressTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sku = SKU.objects.create(code='BP')
+        cls.user = CustomUser.objects.create(username='tester')
+
+    def record(self, barcode, status):
+        return Test.objects.create(sku=self.sku, batch=barcode.batch, barcode=barcode, user=self.user,
+                                   overall_status=status)
+
+    def test_counts_each_unit_by_its_latest_test(self):
+        batch = Batch.objects.create(sku=self.sku, quantity=6)
+        first, second, third, fourth = Barcode.objects.filter(batch=batch).order_by('id')[:4]
+        self.record(first, 'failed')
+        self.record(first, 'passed')
+        self.record(second, 'passed')
+        self.record(second, 'failed')
+        self.record(third, 'passed')
+        self.record(fourth, 'pending')
+        untested = Batch.objects.create(sku=self.sku, quantity=4, virtual_barcodes=True)
+        batches = [Batch.objects.get(pk=batch.pk), Batch.objects.get(pk=untested.pk)]
+        with self.assertNumQueries(1):
+            attach_batch_progress(batches)
+        self.assertEqual([(b.tested, b.passed, b.failed, b.untested) for b in batches],
+                         [(4, 2, 1, 2), (0, 0, 0, 4)])
+
+    def test_batch_list_page(self):
+        batches = [Batch.objects.create(sku=self.sku, quantity=2) for _ in range(3)]
+        for batch in batches[:2]:
+            self.record(Barcode.objects.filter(batch=batch).first(), 'passed')
+        self.client.force_login(CustomUser.objects.create(username='lead', role='admin'))
+        response = self.client.get(reverse('batch_list'))
+        progress = {batch.id: (batch.tested, batch.passed, batch.untested) for batch in response.context['batches']}
+        self.assertEqual(progress, {batches[0].id: (1, 1, 1), batches[1].id: (1, 1, 1), batches[2].id: (0, 0, 2)})
+
+
+class RangePageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.batch = Batch.objects.create(sku=SKU.objects.create(code='RP'), quantity=25, virtual_barcodes=True)
+        cls.codes = list(cls.batch.sequence_numbers())
+
+    def page(self, units=None, **params):
+        return RangePage(units or BarcodeRange(self.batch), RequestFactory().get('/', params), 10)
+
+    def codes_on(self, page):
+        return [unit.sequence_number for unit in page]
+
+    def test_forward_and_back(self):
+        first = self.page()
+        second = self.page(after=first.next_cursor)
+        third = self.page(after=second.next_cursor)
+        self.assertEqual([self.codes_on(page) for page in (first, second, third)],
+                         [self.codes[:10], self.codes[10:20], self.codes[20:]])
+        self.assertEqual([(page.has_previous, page.has_next) for page in (first, second, third)],
+                         [(False, True), (True, True), (True, False)])
+        self.assertIsNone(third.next_cursor)
+        self.assertEqual(self.codes_on(self.page(before=third.previous_cursor)), self.codes[10:20])
+        back = self.page(before=second.previous_cursor)
+        self.assertEqual(self.codes_on(back), self.codes[:10])
+        self.assertFalse(back.has_previous)
+
+    def test_search(self):
+        units = BarcodeRange(self.batch, search=self.codes[0][:-1].lower())
+        page = self.page(units)
+        self.assertEqual(self.codes_on(page), self.codes[:9])
+        self.assertFalse(page.has_next)
+        self.assertEqual(self.codes_on(self.page(units, after=self.codes[3])), self.codes[4:9])
+
+    def test_cursor_outside_the_range_gives_the_first_page(self):
+        for cursor in ['', 'RPZ999', self.codes[0].lower(), 'nonsense']:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.codes_on(self.page(after=cursor)), self.codes[:10])
+                self.assertEqual(self.codes_on(self.page(before=cursor)), self.codes[:10])
+
+
+class LatestTestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sku = SKU.objects.create(code='LT')
+        cls.user = CustomUser.objects.create(username='tester')
+
+    def record(self, barcode, status, date=None):
+        test = Test.objects.create(sku=self.sku, batch=barcode.batch, barcode=barcode, user=self.user,
+                                   overall_status=status)
+        if date:
+            Test.objects.filter(pk=test.pk).update(test_date=date)
+        return test
+
+    def test_latest_by_date_then_id(self):
+        batch = Batch.objects.create(sku=self.sku, quantity=3)
+        retested, same_instant, untested = Barcode.objects.filter(batch=batch).order_by('id')
+        now = timezone.now()
+        self.record(retested, 'passed', now)
+        latest = self.record(retested, 'failed', now + timedelta(hours=1))
+        # An older test saved later doesn't count as the latest
+        self.record(retested, 'passed', now - timedelta(hours=1))
+        self.record(same_instant, 'failed', now)
+        self.record(same_instant, 'passed', now)
+        rows = {barcode.id: barcode for barcode in Barcode.objects.filter(batch=batch).with_latest_test()}
+        self.assertEqual((rows[retested.id].latest_status, rows[retested.id].latest_test_date),
+                         ('failed', Test.objects.get(pk=latest.pk).test_date))
+        self.assertEqual(rows[same_instant.id].latest_status, 'passed')
+        self.assertEqual((rows[untested.id].latest_status, rows[untested.id].latest_test_date), (None, None))
+
+    def test_range_units(self):
+        batch = Batch.objects.create(sku=self.sku, quantity=5, virtual_barcodes=True)
+        codes = list(batch.sequence_numbers())
+        tested = Barcode.resolve(codes[1], batch=batch)
+        stored = Barcode.resolve(codes[3], batch=batch)
+        self.record(tested, 'failed')
+        self.record(tested, 'passed')
+        units = BarcodeRange(batch, with_latest_test=True)[0:5]
+        self.assertEqual([unit.sequence_number for unit in units], codes)
+        self.assertEqual([unit.pk for unit in units], [None, tested.pk, None, stored.pk, None])
+        self.assertEqual([getattr(unit, 'latest_status', None) for unit in units], [None, 'passed', None, None, None])
+        self.assertEqual({unit.batch_id for unit in units}, {batch.id})
+
+
+class BarcodeImageCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cache = BarcodeImageCache(directory, max_entries=2)
+        self.enterContext(mock.patch('inventory.views.image_cache', self.cache))
+
+    def test_memory_then_disk_hits(self):
+        png = self.cache.get('IMA001')
+        self.assertEqual(png, render_png('IMA001'))
+        self.assertEqual(self.cache.get('IMA001'), png)
+        self.assertEqual(self.cache.stats(), {'memory_hits': 1, 'disk_hits': 0, 'misses': 1, 'entries': 1,
+                                              'max_entries': 2})
+        # A new process starts with an empty LRU over the same directory
+        fresh = BarcodeImageCache(self.cache.directory, max_entries=2)
+        with mock.patch('inventory.barcode_images.render_png') as render:
+            self.assertEqual(fresh.get('IMA001'), png)
+            self.assertEqual(fresh.get('IMA001'), png)
+        render.assert_not_called()
+        self.assertEqual((fresh.memory_hits, fresh.disk_hits, fresh.misses), (1, 1, 0))
+
+    def test_least_recently_used_is_evicted(self):
+        for code in ['IMA001', 'IMA002', 'IMA001', 'IMA003']:
+            self.cache.get(code)
+        self.cache.get('IMA001')
+        self.cache.get('IMA002')
+        # IMA002 had been pushed out of memory, and came back from disk
+        self.assertEqual((self.cache.memory_hits, self.cache.disk_hits, self.cache.misses), (2, 1, 3))
+        self.assertEqual(self.cache.stats()['entries'], 2)
+
+    def test_view_etag(self):
+        url = reverse('barcode_image', args=['IMA001'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response.content, render_png('IMA001'))
+        etag = response['ETag']
+        self.assertEqual(etag, f'"{image_key("IMA001")}"')
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        # The 304 didn't need the image at all
+        self.assertEqual(self.cache.stats()['memory_hits'], 0)
+        self.assertEqual(self.client.get(url, headers={'if-none-match': 'W/' + etag}).status_code, 304)
+        self.assertEqual(self.client.get(url, headers={'if-none-match': '"other"'}).status_code, 200)
+
+    def test_view_unencodable_code(self):
+        self.assertEqual(self.client.get(reverse('barcode_image', args=['IMÄ001'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('barcode_svg', args=['IMÄ001'])).status_code, 404)
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_stats_view(self):
+        self.cache.get('IMA001')
+        self.cache.get('IMA001')
+        self.client.force_login(CustomUser.objects.create(username='lead', role='admin'))
+        self.assertEqual(self.client.get(reverse('barcode_image_stats')).json(),
+                         {'memory_hits': 1, 'disk_hits': 0, 'misses': 1, 'entries': 1, 'max_entries': 2})
+
+
+class Code128Tests(TestCase):
+    # Prefixes and suffixes as issued, then charset B/C switches: digit runs
+    # of every length, at the start, middle and end, odd and even
+    CODES = ['UPSA001', 'UPSZ999', 'UPSAA001', 'UPSAAA001', 'A1234B', 'A12345B', '1234', '12345', '123', '12A',
+             '0', '00', '9999999', '1234567A', 'ab12cd3456', 'UPS-2026-000123', 'x' * 30, ' !~{|}', 'S1K2U3']
+
+    def setUp(self):
+        try:
+            import barcode
+            from barcode.writer import ImageWriter
+            from PIL import Image
+        except ImportError as e:
+            self.skipTest(f"python-barcode and Pillow are needed for the comparison: {e}")
+        self.barcode, self.ImageWriter, self.Image = barcode, ImageWriter, Image
+
+    def test_same_bars_as_python_barcode(self):
+        for code in self.CODES:
+            with self.subTest(code=code):
+                modules = ''.join(('1' if index % 2 == 0 else '0') * width
+                                  for index, width in enumerate(code128.bar_widths(code)))
+                self.assertEqual(modules, self.barcode.get('code128', code).build()[0])
+
+    def test_same_pixels_as_image_writer(self):
+        for code in self.CODES[:8]:
+            with self.subTest(code=code):
+                expected = self.barcode.get('code128', code, writer=self.ImageWriter()).render(IMAGE_OPTIONS)
+                actual = self.Image.open(io.BytesIO(render_png(code)))
+                self.assertEqual(actual.size, expected.size)
+                self.assertEqual(actual.convert('L').tobytes(), expected.convert('L').tobytes())
+
+    def test_unencodable(self):
+        for code in ['', 'UPSÄ001', 'A\n1', '\x7f']:
+            with self.subTest(code=code), self.assertRaises(ValueError):
+                code128.encode(code)
+
+
+class ReportCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        batch = Batch.objects.create(sku=SKU.objects.create(code='RC'), quantity=1)
+        cls.test = Test.objects.create(sku=batch.sku, batch=batch, barcode=Barcode.objects.get(batch=batch),
+                                       user=CustomUser.objects.create(username='tester'))
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cache = ReportCache(os.path.join(directory, 'reports'))
+        self.enterContext(override_settings(MEDIA_ROOT=os.path.join(directory, 'media')))
+        self.sources = {REPORT_TEMPLATE: '<html>{{ test.id }}</html>', REPORT_STYLESHEET: '@page { size: A4; }'}
+        self.enterContext(mock.patch('inventory.pdf.get_template', lambda name: SimpleNamespace(
+            template=SimpleNamespace(source=self.sources[name]))))
+
+    def assertKeyChanges(self, change):
+        key = self.cache.key(self.test)
+        self.cache.put(self.test.id, key, b'%PDF-old')
+        change()
+        new_key = self.cache.key(self.test)
+        self.assertNotEqual(new_key, key)
+        self.assertIsNone(self.cache.get(self.test.id, new_key))
+        self.cache.put(self.test.id, new_key, b'%PDF-new')
+        self.assertEqual(self.cache.get(self.test.id, new_key), b'%PDF-new')
+        # The superseded report was removed
+        self.assertIsNone(self.cache.get(self.test.id, key))
+
+    def test_stable(self):
+        self.assertEqual(self.cache.key(self.test), self.cache.key(Test.objects.get(pk=self.test.pk)))
+        self.assertNotEqual(self.cache.key(self.test), self.cache.key(self.test, optimize=True))
+
+    def test_editing_the_test(self):
+        def edit():
+            self.test.overall_status = 'passed'
+            self.test.save()
+        self.assertKeyChanges(edit)
+
+    def test_editing_the_template(self):
+        self.assertKeyChanges(lambda: self.sources.update({REPORT_TEMPLATE: '<html>{{ test.barcode }}</html>'}))
+
+    def test_editing_the_stylesheet(self):
+        self.assertKeyChanges(lambda: self.sources.update({REPORT_STYLESHEET: '@page { size: letter; }'}))
+
+    def test_replacing_an_image(self):
+        path = os.path.join(settings.MEDIA_ROOT, REPORT_ASSETS[0])
+
+        def write(data):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+        self.assertKeyChanges(lambda: write(b'header'))
+        self.assertKeyChanges(lambda: write(b'new header'))
+
+    def test_invalidate(self):
+        key = self.cache.key(self.test)
+        self.cache.put(self.test.id, key, b'%PDF')
+        self.cache.put(self.test.id, self.cache.key(self.test, True), b'%PDF-small', optimize=True)
+        self.cache.invalidate(self.test.id)
+        self.assertIsNone(self.cache.get(self.test.id, key))
+        self.assertIsNone(self.cache.get(self.test.id, self.cache.key(self.test, True), optimize=True))
+
+
+class ReportExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        batch = Batch.objects.create(sku=SKU.objects.create(code='RE'), quantity=4)
+        user = CustomUser.objects.create(username='tester')
+        for barcode in Barcode.objects.filter(batch=batch).order_by('id'):
+            Test.objects.create(sku=batch.sku, batch=batch, barcode=barcode, user=user)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.enterContext(mock.patch.object(report_cache, 'directory', directory))
+        self.enterContext(mock.patch('inventory.report_export.pdf_workers', return_value=1))
+        self.tests = list(Test.objects.select_related('barcode').order_by('id'))
+        self.submitted = []
+
+    def export(self, futures):
+        """ReportExport of self.tests, with each render's Future taken from futures in turn."""
+        futures = iter(futures)
+
+        def submit_pdf(html_content, base_url, what, stylesheet, options=None):
+            self.submitted.append(what)
+            return next(futures)
+        self.enterContext(mock.patch('inventory.report_export.submit_pdf', submit_pdf))
+        return ReportExport(iter(self.tests), lambda test: (f"<p>{test.id}</p>", '/'))
+
+    def done(self, result):
+        future = Future()
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+        return future
+
+    def test_archive(self):
+        cached = self.tests[1]
+        report_cache.put(cached.id, report_cache.key(cached), b'%PDF-cached')
+        export = self.export([self.done(b'%PDF-0'), self.done(RuntimeError('no fonts')), self.done(b'%PDF-3')])
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(export)))
+        names = [f"test_report_{test.barcode.sequence_number}_{test.id}.pdf" for test in self.tests]
+        # In the order they were ready, errors.txt last
+        self.assertCountEqual(archive.namelist()[:-1], [names[0], names[1], names[3]])
+        self.assertEqual(archive.namelist()[-1], 'errors.txt')
+        self.assertEqual([archive.read(name) for name in (names[0], names[1], names[3])],
+                         [b'%PDF-0', b'%PDF-cached', b'%PDF-3'])
+        self.assertEqual(archive.read('errors.txt').decode(), f"{names[2]}: no fonts\n")
+        self.assertEqual((export.cached, export.rendered, len(export.failed)), (1, 2, 1))
+        self.assertEqual(len(self.submitted), 3)
+        # Rendered reports were kept for next time; the failed one wasn't
+        self.assertEqual(report_cache.get(self.tests[0].id, report_cache.key(self.tests[0])), b'%PDF-0')
+        self.assertIsNone(report_cache.get(self.tests[2].id, report_cache.key(self.tests[2])))
+
+    def test_no_errors_file_without_failures(self):
+        export = self.export([self.done(b'%PDF') for _ in self.tests])
+        self.assertNotIn('errors.txt', zipfile.ZipFile(io.BytesIO(b''.join(export))).namelist())
+
+    def test_client_disconnect_cancels_pending_renders(self):
+        # Two reports in flight per worker: the first is done, the second still rendering
+        still_rendering = Future()
+        chunks = iter(self.export([self.done(b'%PDF-0'), still_rendering]))
+        self.assertTrue(next(chunks))
+        chunks.close()
+        self.assertTrue(still_rendering.cancelled())
+        # The rest were never handed to the pool
+        self.assertEqual(len(self.submitted), 2)
+
+
+class PDFWorkersTests(TestCase):
+    def test_pool_size(self):
+        for pool, workers, expected in [(True, 2, 2), (True, 0, os.cpu_count() or 1), (False, 2, 1), (False, 0, 1)]:
+            with self.subTest(pool=pool, workers=workers), \
+                    override_settings(PDF_RENDER_POOL=pool, PDF_RENDER_WORKERS=workers):
+                self.assertEqual(pdf_workers(), expected)
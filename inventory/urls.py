@@ -7,16 +7,27 @@ urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('barcode/', views.barcode_module, name='barcode_module'),
     path('create_batch/', views.create_batch, name='create_batch'),
+    path('batch_job/<int:job_id>/', views.batch_job_status, name='batch_job_status'),
     path('batches/', views.batch_list, name='batch_list'),
     path('batch/<int:batch_id>/barcodes/', views.barcode_list, name='barcode_list'),
     path('batch/<int:batch_id>/print/', views.print_barcodes, name='print_barcodes'),
     path('batch/<int:batch_id>/print/<int:barcode_id>/', views.print_barcodes, name='print_single_barcode'),
+    path('batch/<int:batch_id>/print/code/<str:sequence_number>/', views.print_barcodes, name='print_sequence_barcode'),
     path('testing/', views.testing_module, name='testing_module'),
     path('new_test/', views.new_test, name='new_test'),
     path('test_results/', views.test_results, name='test_results'),
+    path('test_results/export/', views.export_test_reports, name='export_test_reports'),
     path('barcodes/<int:batch_id>/pdf/', views.print_barcodes_pdf, name='print_barcodes_pdf'),
+    path('barcodes/<int:batch_id>/pdf/stickers/', views.print_barcodes_sticker_pdf, name='print_barcodes_sticker_pdf'),
+    path('label_pdf/<int:job_id>/', views.label_pdf_job_status, name='label_pdf_job_status'),
+    path('label_pdf/<int:job_id>/download/', views.label_pdf_download, name='label_pdf_download'),
+    path('barcode-img-stats/', views.barcode_image_stats, name='barcode_image_stats'),
     path('barcode-img/<str:sequence_number>/', views.barcode_image_view, name='barcode_image'),
+    path('barcode-svg/<str:sequence_number>/', views.barcode_svg_view, name='barcode_svg'),
     path('test/<int:test_id>/', views.test_detail, name='test_detail'),
     path('test/<int:test_id>/print/', views.print_test_report, name='print_test_report'), # <--- THIS IS THE CRUCIAL LINE
     path('keep-alive/', views.session_keep_alive, name='session_keep_alive'),
+    path('search/skus/', views.search_skus, name='search_skus'),
+    path('search/batches/', views.search_batches, name='search_batches'),
+    path('search/barcodes/', views.search_barcodes, name='search_barcodes'),
 ]
\ No newline at end of file
@@ -1,17 +1,33 @@
 # your_app/views.py
 
+import hashlib
+from itertools import islice
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q
+from datetime import datetime, time, timedelta
+from django.db.models import Count, Q, Sum
 from django.conf import settings # Import settings for MEDIA_URL
 from django.views.decorators.cache import never_cache # Import never_cache decorator
+from .barcode_images import attach_label_images, image_cache, image_key, render_svg
+from .barcode_search import MIN_TERM_LENGTH
 from .forms import  BatchCreateForm, TestForm, TestOverallStatusForm
-from .models import Batch, Barcode, SKU, Test, TestQuestion, TestAnswer, CustomUser, TestTemplate
+from .models import Batch, BatchJob, LabelPDFJob, Barcode, BarcodeRange, DailyTestCount, SKU, Test, TestQuestion, TestAnswer, CustomUser, TestTemplate, attach_batch_progress, requeue_job
+from .jobs import enqueue_batch_job, enqueue_label_pdf_job
+from .label_pdf import write_label_sheet
+from .pagination import KeysetPage, RangePage
+from .pdf import REPORT_STYLESHEET, REPORT_TEMPLATE, pdf_options, report_cache, write_pdf
+from .report_export import ReportExport
 import logging
-from django.core.paginator import Paginator
+from django.core.cache import cache
 from django.template.loader import get_template
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.utils.dateparse import parse_date
 from django.template.loader import render_to_string
 
 
@@ -65,7 +81,52 @@ def user_logout(request):
 @login_required
 @never_cache # Added never_cache decorator
 def dashboard(request):
-    return render(request, 'inventory/dashboard.html')
+    context = {}
+    if request.user.role in ['admin', 'tester']:
+        context['stats'] = test_statistics()
+    return render(request, 'inventory/dashboard.html', context)
+
+
+def test_statistics(days=14):
+    """
+    Test counts and yield for the dashboard, from the DailyTestCount rollup:
+    today, the last 7 days, all time, and each of the last `days` days.
+    """
+    today = timezone.localdate()
+    first_day = today - timedelta(days=days - 1)
+    rows = DailyTestCount.objects.filter(day__gte=first_day).values('day').annotate(
+        total=Sum('count'),
+        passed=Sum('count', filter=Q(status='passed')),
+        failed=Sum('count', filter=Q(status='failed')),
+    ).order_by('day')
+    by_day = {row['day']: row for row in rows}
+
+    chart = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        row = by_day.get(day, {})
+        chart.append(with_yield({'day': day, 'total': row.get('total') or 0,
+                                 'passed': row.get('passed') or 0, 'failed': row.get('failed') or 0}))
+    peak = max([day['total'] for day in chart] + [1])
+    for day in chart:
+        day['height'] = round(day['total'] * 100 / peak)
+
+    week = chart[-7:]
+    return {
+        'periods': [
+            ('Today', chart[-1]),
+            ('Last 7 days', with_yield({key: sum(day[key] for day in week) for key in ('total', 'passed', 'failed')})),
+            ('All time', with_yield(DailyTestCount.totals(DailyTestCount.objects.all()))),
+        ],
+        'chart': chart,
+    }
+
+
+def with_yield(counts):
+    """counts with 'yield': passed as a percentage of passed + failed (None before any verdict)."""
+    decided = counts['passed'] + counts['failed']
+    counts['yield'] = round(counts['passed'] * 100 / decided, 1) if decided else None
+    return counts
 
 @login_required
 @never_cache # Added never_cache decorator
@@ -88,7 +149,15 @@ def create_batch(request):
                 # but we'll include it for completeness if the view must return HTML.
                 pass # Proceed to save and redirect below
             else:
-                form.save()
+                batch = form.save(commit=False)
+                if batch.needs_background_job():
+                    # Large batch: reserve the range now and insert the rows in a worker
+                    with transaction.atomic():
+                        batch.save(create_barcodes=False)
+                        job = BatchJob.objects.create(batch=batch, total=batch.quantity)
+                        enqueue_batch_job(job)
+                    return render(request, 'inventory/create_batch.html', {'form': BatchCreateForm(), 'job': job})
+                batch.save()
                 return redirect('batch_list')
         
         # If form is invalid or we are handling an AJAX update request:
@@ -105,6 +174,24 @@ def create_batch(request):
     return render(request, 'inventory/create_batch.html', {'form': form})
 
 
+@login_required
+@never_cache
+def batch_job_status(request, job_id):
+    job = get_object_or_404(BatchJob, id=job_id)
+    if job.is_stale and requeue_job(job):
+        enqueue_batch_job(job)
+    return JsonResponse({
+        'id': job.id,
+        'batch_id': job.batch_id,
+        'status': job.status,
+        'created': job.created,
+        'total': job.total,
+        'percent': job.percent,
+        'error': job.error,
+        'barcode_list_url': reverse('barcode_list', args=[job.batch_id]),
+    })
+
+
 @login_required
 @never_cache # Added never_cache decorator
 def batch_list(request):
@@ -123,9 +210,10 @@ def batch_list(request):
     if to_date:
         batches = batches.filter(batch_date__lte=to_date)
 
-    #batches = batches.order_by('-batch_date')
-    # Order by 'created_at' in descending order to get latest first
-    batches = batches.order_by('-created_at') # CHANGED THIS LINE
+    # Latest first, a page at a time, with the SKU joined and each batch's
+    # test progress from one grouped query
+    batches = KeysetPage(batches.select_related('sku'), request, 'created_at', 50)
+    attach_batch_progress(batches.object_list)
 
     context = {
         'batches': batches,
@@ -138,17 +226,33 @@ def batch_list(request):
 @login_required
 @never_cache # Added never_cache decorator
 def barcode_list(request, batch_id):
-    batch = get_object_or_404(Batch, id=batch_id)
-    barcode_queryset = Barcode.objects.filter(batch=batch).order_by('sequence_number')
-
+    batch = get_object_or_404(Batch.objects.select_related('sku', 'spec_template', 'job'), id=batch_id)
     barcode_number = request.GET.get('barcode_number')
 
-    if barcode_number:
-        barcode_queryset = barcode_queryset.filter(sequence_number__icontains=barcode_number)
-
-    paginator = Paginator(barcode_queryset, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pages follow a sequence-number cursor, and each unit shows its latest test
+    if batch.virtual_barcodes:
+        # Range-backed batch: list the range itself, materialised rows included
+        units = BarcodeRange(batch, search=barcode_number, with_latest_test=True)
+        page_obj = RangePage(units, request, 10)
+        unit_count = len(units)
+    else:
+        barcode_queryset = Barcode.objects.filter(batch=batch).select_related('sku').with_latest_test()
+        if barcode_number:
+            barcode_queryset = barcode_queryset.search(barcode_number)
+        # Rows are inserted in issue order (Batch.save, BatchJob), so ids follow
+        # it; sequence-number strings do not once a batch crosses Z999 -> AA001
+        page_obj = KeysetPage(barcode_queryset, request, 'id', 10, descending=False)
+        job = getattr(batch, 'job', None)
+        if barcode_number:
+            unit_count = None
+        elif job is not None and job.status != 'done':
+            # Still being inserted: the job counts the rows it has committed
+            unit_count = job.created
+        else:
+            # Complete, so a short-lived count per batch spares a COUNT(*) on every page
+            unit_count = cache.get_or_set(
+                f"barcode_list:count:{batch.id}", lambda: Barcode.objects.filter(batch=batch).count(), 60,
+            )
     
     SPEC_FIELD_MAP = {
     'device_name': 'Device Name',
@@ -170,26 +274,46 @@ def barcode_list(request, batch_id):
     context = {
         'batch': batch,
         'page_obj': page_obj,
+        'unit_count': unit_count,
         'barcode_number': barcode_number,
         # 💡 NEW: Pass the SPEC_FIELD_MAP
         'spec_field_map': SPEC_FIELD_MAP,
     }
     return render(request, 'inventory/barcode_list.html', context)
 
+def label_barcode_format(request):
+    """'svg', 'inline' or 'png' (see LABEL_BARCODE_FORMAT), overridable with ?format=."""
+    barcode_format = request.GET.get('format', settings.LABEL_BARCODE_FORMAT)
+    return barcode_format if barcode_format in ('svg', 'inline', 'png') else settings.LABEL_BARCODE_FORMAT
+
+
+def pdf_optimize(request):
+    """Whether to render a size-optimised PDF (?optimize=1, see PDF_OPTIMIZE_OPTIONS)."""
+    return request.GET.get('optimize') == '1'
+
+
 @login_required
 @never_cache # Added never_cache decorator
-def print_barcodes(request, batch_id, barcode_id=None):
+def print_barcodes(request, batch_id, barcode_id=None, sequence_number=None):
     if request.user.role not in ['admin', 'tester']:
         return redirect('dashboard')
     batch = get_object_or_404(Batch, id=batch_id)
     if barcode_id:
         barcodes = [get_object_or_404(Barcode, id=barcode_id, batch=batch)]
+    elif sequence_number:
+        # Printing a single unit of a range-backed batch materialises its row
+        barcode = Barcode.resolve(sequence_number, batch=batch)
+        if barcode is None:
+            raise Http404("No such barcode in this batch.")
+        barcodes = [barcode]
     else:
-        barcodes = Barcode.objects.filter(batch=batch)
+        barcodes = batch.units()
         
+    barcode_format = label_barcode_format(request)
     context = {
         'batch': batch, 
-        'barcodes': barcodes,
+        'barcodes': attach_label_images(barcodes, barcode_format),
+        'barcode_format': barcode_format,
         # 💡 NEW: Pass the SPEC_FIELD_MAP
         'spec_field_map': SPEC_FIELD_MAP,
     }
@@ -233,36 +357,40 @@ def new_test(request):
                 barcode_instance = form.cleaned_data['barcode']
                 template_instance = form.cleaned_data['template']
 
-                test = Test.objects.create(
-                    sku=sku_instance,
-                    batch=batch_instance,
-                    barcode=barcode_instance,
-                    user=request.user,
-                    template_used=template_instance,
-                    overall_status=form.cleaned_data['overall_status']
-                )
-                
-                questions = TestQuestion.objects.filter(template=template_instance)
-                for question in questions:
-                    status_field_name = f'question_{question.id}_status'
-                    output_field_name = f'question_{question.id}_output' # NEW FIELD NAME
-                    remarks_field_name = f'question_{question.id}_remarks'
-
-                    status = form.cleaned_data.get(status_field_name, 'fail')
-                    is_passed = (status == 'pass')
-                    technical_output = form.cleaned_data.get(output_field_name, None) # NEW DATA EXTRACTION
-                    remarks = form.cleaned_data.get(remarks_field_name, '')
-
-                    logger.debug("Saving answer for question %s: status=%s, remarks=%s",
-                                 question.id, status, remarks)
-                    TestAnswer.objects.create(
-                        test=test,
-                        question=question,
-                        is_passed=is_passed,
-                        # NEW FIELD SAVING
-                        technical_output=technical_output,
-                        remarks=remarks
+                with transaction.atomic():
+                    if barcode_instance is not None and barcode_instance.pk is None:
+                        # A range-backed unit tested for the first time gets its row now
+                        barcode_instance = Barcode.resolve(barcode_instance.sequence_number, batch=batch_instance)
+                    test = Test.objects.create(
+                        sku=sku_instance,
+                        batch=batch_instance,
+                        barcode=barcode_instance,
+                        user=request.user,
+                        template_used=template_instance,
+                        overall_status=form.cleaned_data['overall_status']
                     )
+                
+                    questions = TestQuestion.objects.filter(template=template_instance)
+                    for question in questions:
+                        status_field_name = f'question_{question.id}_status'
+                        output_field_name = f'question_{question.id}_output' # NEW FIELD NAME
+                        remarks_field_name = f'question_{question.id}_remarks'
+
+                        status = form.cleaned_data.get(status_field_name, 'fail')
+                        is_passed = (status == 'pass')
+                        technical_output = form.cleaned_data.get(output_field_name, None) # NEW DATA EXTRACTION
+                        remarks = form.cleaned_data.get(remarks_field_name, '')
+
+                        logger.debug("Saving answer for question %s: status=%s, remarks=%s",
+                                     question.id, status, remarks)
+                        TestAnswer.objects.create(
+                            test=test,
+                            question=question,
+                            is_passed=is_passed,
+                            # NEW FIELD SAVING
+                            technical_output=technical_output,
+                            remarks=remarks
+                        )
                 return redirect('test_detail', test_id=test.id)
         else:
             logger.error("Form validation failed: %s", form.errors)
@@ -279,53 +407,107 @@ def test_results(request):
     if request.user.role not in ['admin', 'tester']:
         return redirect('dashboard')
     
-    from_date = request.GET.get('from_date')
-    to_date = request.GET.get('to_date')
-    sku = request.GET.get('sku')
-    batch = request.GET.get('batch')
-    barcode = request.GET.get('barcode')
-    template_used = request.GET.get('template_used')
+    tests, filters = filter_tests(request)
 
-    tests = Test.objects.all()
+    counts = test_counts(tests, filters)
 
-    if from_date:
-        tests = tests.filter(test_date__gte=from_date)
-    if to_date:
-        tests = tests.filter(test_date__lte=to_date)
-    if sku:
-        tests = tests.filter(sku__code=sku)
-    if batch:
-        tests = tests.filter(batch__id=batch)
-    if barcode:
-        tests = tests.filter(barcode__sequence_number__icontains=barcode)
-    if template_used:
-        tests = tests.filter(template_used__id=template_used)
-        
-    tests = tests.order_by('-test_date')    
-
-    counts = tests.aggregate(
-        total=Count('id'),
-        passed=Count('id', filter=Q(overall_status='passed')),
-        failed=Count('id', filter=Q(overall_status='failed')),
-        pending=Count('id', filter=Q(overall_status='pending'))
-    )
+    # Only the page's rows, with the rows each of them shows joined in
+    tests = KeysetPage(tests.select_related('barcode', 'sku', 'batch', 'template_used'), request, 'test_date', 50)
 
     context = {
         'tests': tests,
         'counts': counts,
-        'skus': SKU.objects.all(),
-        'batches': Batch.objects.all(),
+        # The SKU and batch pickers search as the user types; only the current batch is looked up
+        'selected_batch': Batch.objects.filter(pk=filters['batch']).first() if (filters['batch'] or '').isdigit() else None,
         'templates': TestTemplate.objects.all(),
-        'from_date': from_date,
-        'to_date': to_date,
-        'sku': sku,
-        'batch': batch,
-        'barcode': barcode,
-        'template_used': template_used,
+        **filters,
     }
     return render(request, 'inventory/test_results.html', context)
 
 
+def filter_day(value):
+    """The date of a YYYY-MM-DD filter value, or None if it isn't one."""
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
+def day_start(day):
+    """Midnight at the start of day, in the current time zone."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_tests(request):
+    """Tests matching the test_results filters in request.GET, and the filter values."""
+    filters = {
+        name: request.GET.get(name)
+        for name in ('from_date', 'to_date', 'sku', 'batch', 'barcode', 'template_used')
+    }
+    tests = Test.objects.all()
+
+    # Whole days, both ends included, as DailyTestCount counts them
+    from_day, to_day = filter_day(filters['from_date']), filter_day(filters['to_date'])
+    if from_day:
+        tests = tests.filter(test_date__gte=day_start(from_day))
+    if to_day:
+        tests = tests.filter(test_date__lt=day_start(to_day + timedelta(days=1)))
+    if filters['sku']:
+        tests = tests.filter(sku__code=filters['sku'])
+    if filters['batch']:
+        tests = tests.filter(batch__id=filters['batch'])
+    if filters['barcode']:
+        tests = tests.filter(barcode__in=Barcode.objects.search(filters['barcode']))
+    if filters['template_used']:
+        tests = tests.filter(template_used__id=filters['template_used'])
+    return tests, filters
+
+
+def test_counts(tests, filters):
+    """
+    Total, passed, failed and pending counts of the filtered tests. They come
+    from the DailyTestCount rollup, which doesn't go down to barcodes: with a
+    barcode filter the tests themselves are counted.
+    """
+    if filters['barcode']:
+        return tests.aggregate(
+            total=Count('id'),
+            passed=Count('id', filter=Q(overall_status='passed')),
+            failed=Count('id', filter=Q(overall_status='failed')),
+            pending=Count('id', filter=Q(overall_status='pending'))
+        )
+
+    rows = DailyTestCount.objects.all()
+    from_day, to_day = filter_day(filters['from_date']), filter_day(filters['to_date'])
+    if from_day:
+        rows = rows.filter(day__gte=from_day)
+    if to_day:
+        rows = rows.filter(day__lte=to_day)
+    if filters['sku']:
+        rows = rows.filter(sku__code=filters['sku'])
+    if filters['batch']:
+        rows = rows.filter(batch__id=filters['batch'])
+    if filters['template_used']:
+        rows = rows.filter(template_used__id=filters['template_used'])
+    return DailyTestCount.totals(rows)
+
+
+@login_required
+def export_test_reports(request):
+    if request.user.role not in ['admin', 'tester']:
+        return redirect('dashboard')
+    if not HTML:
+        return HttpResponse("Weasyprint is not installed. Please install it to generate PDF reports.", status=500)
+
+    tests, _ = filter_tests(request)
+    tests = tests.select_related('sku', 'batch', 'barcode', 'user', 'template_used').order_by('-test_date', '-id')
+    export = ReportExport(tests.iterator(chunk_size=200), lambda test: test_report_html(request, test),
+                          pdf_optimize(request))
+    response = StreamingHttpResponse(export, content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="test_reports_{timezone.localdate():%Y%m%d}.zip"'
+    return response
+
+
 @login_required
 @never_cache # Added never_cache decorator
 def test_detail(request, test_id):
@@ -338,6 +520,7 @@ def test_detail(request, test_id):
         form = TestOverallStatusForm(request.POST, instance=test)
         if form.is_valid():
             form.save()
+            report_cache.invalidate(test.id)
             return redirect('test_detail', test_id=test.id)
         else:
             logger.error("Overall status form validation failed: %s", form.errors)
@@ -354,14 +537,45 @@ def test_detail(request, test_id):
     return render(request, 'inventory/test_detail.html', context)
 
 @login_required
-@never_cache # Added never_cache decorator
 def print_test_report(request, test_id):
     # Ensure user has permission
     if request.user.role not in ['admin', 'tester', 'service']:
         return redirect('dashboard')
     
-    # Fetch test and related answers
     test = get_object_or_404(Test.objects.select_related('sku', 'batch', 'barcode', 'user', 'template_used'), id=test_id)
+
+    # The PDF only changes with the test or the report template, so it is
+    # rendered once per version and revalidated by ETag on every request
+    optimize = pdf_optimize(request)
+    key = report_cache.key(test, optimize)
+    etag = quote_etag(key)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        pdf_file = report_cache.get(test.id, key, optimize)
+        if pdf_file is None:
+            if not HTML: # Check if WeasyPrint was successfully imported
+                return HttpResponse("Weasyprint is not installed. Please install it to generate PDF reports.", status=500)
+            try: # Added try-except block for more specific error logging
+                pdf_file = render_test_report(request, test, optimize)
+            except Exception as e:
+                logger.error(f"WeasyPrint PDF generation failed: {e}", exc_info=True) # Log full traceback
+                return HttpResponse(f"Error generating PDF: {e}", status=500)
+            report_cache.put(test.id, key, pdf_file, optimize)
+        response = HttpResponse(pdf_file, content_type='application/pdf')
+        response['Content-Disposition'] = f'filename="test_report_{test.barcode.sequence_number}.pdf"'
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def render_test_report(request, test, optimize=False):
+    html_content, base_url = test_report_html(request, test)
+    logger.info(f"WeasyPrint base_url for PDF: {base_url}")
+    return write_pdf(html_content, base_url, f"Test report {test.id}", REPORT_STYLESHEET, pdf_options(optimize))
+
+
+def test_report_html(request, test):
+    """The report's HTML and the base URL WeasyPrint resolves it against."""
     test_answers = test.answers.select_related('question').all()
 
     # Build absolute URLs for images using settings.MEDIA_URL
@@ -377,73 +591,117 @@ def print_test_report(request, test_id):
     }
     
     # Render the HTML template for the report
-    template = get_template('inventory/print_test_report.html')
+    template = get_template(REPORT_TEMPLATE)
     html_content = template.render(context)
 
     # Convert HTML to PDF using WeasyPrint
-    if HTML: # Check if WeasyPrint was successfully imported
-        # Log the base_url to help debug if images are not found
-        base_url = request.build_absolute_uri() # This is the base URL for relative paths in HTML
-        logger.info(f"WeasyPrint base_url for PDF: {base_url}")
-        
-        try: # Added try-except block for more specific error logging
-            pdf_file = HTML(string=html_content, base_url=base_url).write_pdf()
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'filename="test_report_{test.barcode.sequence_number}.pdf"'
-            return response
-        except Exception as e:
-            logger.error(f"WeasyPrint PDF generation failed: {e}", exc_info=True) # Log full traceback
-            return HttpResponse(f"Error generating PDF: {e}", status=500)
-    else:
-        return HttpResponse("Weasyprint is not installed. Please install it to generate PDF reports.", status=500)
+    # Log the base_url to help debug if images are not found
+    base_url = request.build_absolute_uri() # This is the base URL for relative paths in HTML
+    return html_content, base_url
 
 
+@login_required
 @never_cache # Added never_cache decorator
 def print_barcodes_pdf(request, batch_id):
+    if request.user.role not in ['admin', 'tester']:
+        return redirect('dashboard')
     if HTML:
-        batch = Batch.objects.get(id=batch_id)
-        barcodes = Barcode.objects.filter(batch=batch)
-        template = get_template('inventory/print_barcodes_pdf.html')
-        html_content = template.render({'barcodes': barcodes, 'batch': batch})
-
-        pdf_file = HTML(string=html_content, base_url=request.build_absolute_uri()).write_pdf()
-
-        response = HttpResponse(pdf_file, content_type='application/pdf')
-        response['Content-Disposition'] = f'filename="barcodes_batch_{batch.prefix}.pdf"'
-        return response
+        batch = get_object_or_404(Batch, id=batch_id)
+        # Rendered by a LabelPDFJob; operators printing the same sheet share one job
+        optimize = pdf_optimize(request)
+        # Optimised sheets draw the barcodes as vectors: smaller than any raster
+        barcode_format = 'svg' if optimize else label_barcode_format(request)
+        job, queued = LabelPDFJob.submit(batch, barcode_format, request.build_absolute_uri(), optimize)
+        if queued:
+            enqueue_label_pdf_job(job)
+        if job.status == 'done':
+            return redirect('label_pdf_download', job_id=job.id)
+        return render(request, 'inventory/label_pdf_job.html', {'job': job})
     else:
         return HttpResponse("Weasyprint is not installed. Please install it to generate PDF reports.", status=500)
 
 
-import io
-from django.http import HttpResponse, JsonResponse
-from django.views.decorators.cache import never_cache
-import barcode
-from barcode.writer import ImageWriter
+@login_required
+@never_cache
+def label_pdf_job_status(request, job_id):
+    if request.user.role not in ['admin', 'tester']:
+        return JsonResponse({'error': 'Not allowed.'}, status=403)
+    job = get_object_or_404(LabelPDFJob, id=job_id)
+    if job.is_stale and requeue_job(job):
+        enqueue_label_pdf_job(job)
+    return JsonResponse({
+        'id': job.id,
+        'batch_id': job.batch_id,
+        'status': job.status,
+        'size': job.size,
+        'error': job.error,
+        'download_url': reverse('label_pdf_download', args=[job.id]),
+    })
+
 
+@login_required
+def label_pdf_download(request, job_id):
+    if request.user.role not in ['admin', 'tester']:
+        return redirect('dashboard')
+    job = get_object_or_404(LabelPDFJob.objects.select_related('batch'), id=job_id, status='done')
+    try:
+        pdf_file = open(job.path, 'rb')
+    except FileNotFoundError:
+        raise Http404("This label PDF has been replaced; print the batch again.")
+    response = FileResponse(pdf_file, content_type='application/pdf')
+    response['Content-Disposition'] = f'filename="barcodes_batch_{job.batch.prefix}.pdf"'
+    return response
+
+
+@login_required
 @never_cache
+def print_barcodes_sticker_pdf(request, batch_id):
+    if request.user.role not in ['admin', 'tester']:
+        return redirect('dashboard')
+    batch = get_object_or_404(Batch.objects.select_related('sku', 'spec_template'), id=batch_id)
+    # Drawn directly rather than through WeasyPrint, so it needs no background job
+    if batch.virtual_barcodes:
+        sequence_numbers = batch.sequence_numbers()
+    else:
+        sequence_numbers = batch.units().order_by('id').values_list('sequence_number', flat=True).iterator()
+    pdf = write_label_sheet(batch, sequence_numbers, SPEC_FIELD_MAP)
+    response = HttpResponse(pdf, content_type='application/pdf')
+    response['Content-Disposition'] = f'filename="labels_batch_{batch.prefix}.pdf"'
+    return response
+
 def barcode_image_view(request, sequence_number):
-    buffer = io.BytesIO()
-    code128 = barcode.get_barcode_class('code128')
-
-    # Improved writer options for better scanning
-    writer = ImageWriter()
-    writer.format = 'PNG'  # Ensure high-quality PNG output
-
-    options = {
-        'module_width': 0.5,    # slightly thicker bars
-        'module_height': 22.0,  # taller bars
-        'quiet_zone': 6.5,      # extra whitespace for scanners
-        'font_size': 10,        # text size (not used here)
-        'text_distance': 2.0,   
-        'dpi': 300,             # high print quality
-        'write_text': False,    # we'll display text in template
-        'background': 'white',
-        'foreground': 'black'
-    }
+    # The image for a sequence number never changes: strong ETag, cache forever
+    etag = quote_etag(image_key(sequence_number))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            png = image_cache.get(sequence_number)
+        except ValueError:
+            raise Http404("Not a valid Code 128 value.")
+        response = HttpResponse(png, content_type='image/png')
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+    return response
+
+def barcode_svg_view(request, sequence_number):
+    # Vector sibling of barcode_image_view; cheap enough to build on each miss
+    etag = quote_etag(image_key(sequence_number) + '-svg')
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            svg = render_svg(sequence_number)
+        except ValueError:
+            raise Http404("Not a valid Code 128 value.")
+        response = HttpResponse(svg, content_type='image/svg+xml')
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+    return response
 
-    code128(sequence_number, writer=writer).write(buffer, options)
-    return HttpResponse(buffer.getvalue(), content_type='image/png')
+@login_required
+def barcode_image_stats(request):
+    if request.user.role != 'admin':
+        return redirect('dashboard')
+    return JsonResponse(image_cache.stats())
 
 @login_required
 def session_keep_alive(request):
@@ -452,3 +710,76 @@ def session_keep_alive(request):
     """
     return JsonResponse({'status': 'ok'})
 
+
+
+# Typeahead searches for the SKU, batch and barcode pickers: the pages render
+# only the current choice and the pickers ask these as the user types
+
+
+def typeahead_response(request, kind, search):
+    """
+    JSON {'results': [{'id', 'text', ...}]} of a picker search: search(q) gives
+    up to TYPEAHEAD_LIMIT matches for the ?q= prefix, reused from the cache for
+    TYPEAHEAD_CACHE_SECONDS along with the other GET parameters.
+    """
+    if request.user.role not in ['admin', 'tester']:
+        return JsonResponse({'results': []}, status=403)
+    q = request.GET.get('q', '').strip()
+    params = sorted(request.GET.items())
+    key = f"typeahead:{kind}:{hashlib.sha256(repr(params).encode()).hexdigest()}"
+    results = cache.get_or_set(key, lambda: search(q), settings.TYPEAHEAD_CACHE_SECONDS)
+    response = JsonResponse({'results': results})
+    patch_cache_control(response, private=True, max_age=settings.TYPEAHEAD_CACHE_SECONDS)
+    return response
+
+
+@login_required
+def search_skus(request):
+    def search(q):
+        skus = SKU.objects.filter(code__istartswith=q).order_by('code')[:settings.TYPEAHEAD_LIMIT]
+        return [{'id': sku.id, 'code': sku.code, 'text': sku.code} for sku in skus]
+    return typeahead_response(request, 'sku', search)
+
+
+@login_required
+def search_batches(request):
+    """Newest batches first; ?q= matches the prefix (the SKU code) or a batch number, ?sku= limits to one SKU."""
+    sku_id = request.GET.get('sku')
+
+    def search(q):
+        batches = Batch.objects.all()
+        if sku_id and sku_id.isdigit():
+            batches = batches.filter(sku_id=sku_id)
+        if q:
+            # Batches take their SKU's code as prefix; match it on the small SKU table
+            match = Q(sku__in=SKU.objects.filter(code__istartswith=q))
+            if q.isdigit():
+                match |= Q(id=q)
+            batches = batches.filter(match)
+        batches = batches.order_by('-created_at', '-id')[:settings.TYPEAHEAD_LIMIT]
+        return [{'id': batch.id, 'text': str(batch)} for batch in batches]
+    return typeahead_response(request, 'batch', search)
+
+
+@login_required
+def search_barcodes(request):
+    """
+    Sequence numbers starting with ?q=, in order, within ?batch= when given
+    (the test-entry picker always gives it). Units of a range-backed batch
+    are listed from its range, rows or not.
+    """
+    batch = Batch.objects.filter(pk=request.GET.get('batch')).first() if request.GET.get('batch', '').isdigit() else None
+
+    def search(q):
+        q = q.upper()
+        if batch is None and len(q) < MIN_TERM_LENGTH:
+            return []  # too short to narrow every barcode ever issued
+        if batch is not None and batch.virtual_barcodes:
+            codes = batch.sequence_numbers_starting(q)
+        else:
+            barcodes = Barcode.objects.filter(batch=batch) if batch is not None else Barcode.objects.search(q)
+            codes = barcodes.filter(sequence_number__istartswith=q).order_by('sequence_number').values_list(
+                'sequence_number', flat=True,
+            )
+        return [{'id': code, 'text': code} for code in islice(codes, settings.TYPEAHEAD_LIMIT)]
+    return typeahead_response(request, 'barcode', search)
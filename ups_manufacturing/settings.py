@@ -80,6 +80,15 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Take the write lock when a transaction starts so concurrent batch
+        # creation queues up on the barcode counter instead of failing with
+        # "database is locked" (select_for_update is a no-op on SQLite).
+        "OPTIONS": {
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
+        # On disk, so the allocation tests' worker processes can share it
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
@@ -134,3 +143,77 @@ LOGOUT_REDIRECT_URL = 'login'
 SESSION_COOKIE_AGE = 900  # 15 minutes in seconds (15 * 60 = 900)
 SESSION_SAVE_EVERY_REQUEST = True
 PRODUCT_NAME = "CoreInspect" # <--- CHANGE THIS TO YOUR DESIRED PRODUCT NAME
+
+# Barcode rows are inserted in chunks of this size when a batch is created
+BARCODE_BULK_BATCH_SIZE = 2000
+
+# Batches of at least this many barcodes are inserted by a background BatchJob
+# instead of inside the create_batch request
+BARCODE_BACKGROUND_THRESHOLD = 10000
+# Worker threads per process that run BatchJobs
+BATCH_JOB_WORKERS = 2
+# A batch job still queued or running with no chunk committed for this many
+# seconds has lost its worker (e.g. to a restart) and is queued again
+BATCH_JOB_TIMEOUT = 5 * 60
+
+# Hi/lo barcode allocation: each process leases this many suffixes per prefix
+# from the shared counter and issues codes from the block in memory. 0 disables
+# leasing (every batch locks the counter row). Set on multi-line deployments.
+BARCODE_BLOCK_SIZE = 0
+# Identifies this node/line on leased blocks
+BARCODE_NODE_NAME = os.environ.get('BARCODE_NODE_NAME', 'default')
+
+# Rendered barcode PNGs: content-addressed store on disk plus an in-memory LRU
+# of this many images per process
+BARCODE_IMAGE_DIR = os.path.join(MEDIA_ROOT, 'barcodes')
+BARCODE_IMAGE_CACHE_SIZE = 2048
+# Render every new batch's label PNGs into BARCODE_IMAGE_DIR in the background
+# (on the label render pool) so printing reads finished files
+BARCODE_PRERENDER = False
+# Barcodes on label pages and PDFs: 'svg' inlines vector paths and 'inline'
+# embeds PNG data URIs (both rendered server-side in one pass, so the page is
+# a single request); 'png' links the cached images one request per label.
+# Any of them can be picked per request with ?format=
+LABEL_BARCODE_FORMAT = 'svg'
+# Label sheets with at least this many barcodes are rendered on a process
+# pool of LABEL_RENDER_WORKERS processes (0 = one per CPU)
+LABEL_RENDER_POOL_THRESHOLD = 200
+LABEL_RENDER_WORKERS = 0
+
+# Rendered test-report PDFs, reused until the test or the report template
+# changes. Outside MEDIA_ROOT: reports are only served behind login
+REPORT_PDF_DIR = os.path.join(BASE_DIR, 'report_cache')
+# Label-sheet PDFs are rendered by LabelPDFJobs on LABEL_PDF_WORKERS threads
+# per process and kept in LABEL_PDF_DIR for download
+LABEL_PDF_DIR = os.path.join(BASE_DIR, 'label_pdfs')
+LABEL_PDF_WORKERS = 1
+# A label PDF job still queued or running this many seconds after it last
+# changed has lost its worker (e.g. to a restart) and is queued again when
+# polled or printed; keep it above the slowest sheet's render time
+LABEL_PDF_JOB_TIMEOUT = 30 * 60
+# A label PDF replaced by a newer sheet of the same batch is kept this many
+# seconds, for pages still polling or downloading it
+LABEL_PDF_SUPERSEDED_GRACE = 60 * 60
+# PDFs are rendered by a pool of PDF_RENDER_WORKERS processes (0 = one per
+# CPU) that keep fonts, compiled stylesheets and report images loaded; with
+# PDF_RENDER_POOL = False each thread renders in-process instead. Every WSGI
+# worker process starts its own pool, and each renderer holds a warm
+# WeasyPrint in memory, so the server runs WSGI workers x PDF_RENDER_WORKERS
+# of them: size it to about the CPU count divided by the WSGI workers, and
+# leave 0 for a single WSGI worker only
+PDF_RENDER_POOL = True
+PDF_RENDER_WORKERS = 2
+# Size-optimised PDFs (?optimize=1 on the report and label PDF views): the
+# WeasyPrint options that recompress images losslessly and downsample them to
+# print resolution. Fonts are subset and streams compressed in every PDF.
+PDF_OPTIMIZE_OPTIONS = {'optimize_images': True, 'dpi': 300}
+# Label PDFs of at least LABEL_PDF_CHUNK_THRESHOLD labels are laid out in
+# chunks of up to LABEL_PDF_CHUNK_SIZE labels (rounded to whole pages) on
+# the render pool and merged
+LABEL_PDF_CHUNK_THRESHOLD = 500
+LABEL_PDF_CHUNK_SIZE = 700
+
+# SKU, batch and barcode pickers search as the user types: at most
+# TYPEAHEAD_LIMIT matches per search, cached for TYPEAHEAD_CACHE_SECONDS
+TYPEAHEAD_LIMIT = 20
+TYPEAHEAD_CACHE_SECONDS = 30